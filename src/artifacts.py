@@ -0,0 +1,209 @@
+"""Memory-mappable, versioned artifact bundles shared by training and serving.
+
+Each training run writes a new version under artifacts/versions/<version>/ and
+then atomically repoints artifacts/CURRENT at it. A bundle is a folder of plain
+.npy arrays plus small JSON metadata files:
+
+    svd.json, svd_pu.npy, svd_qi.npy, svd_bu.npy, svd_bi.npy, svd_user_ids.npy, svd_item_ids.npy
+    knn.json, matrix_data.npy, matrix_indices.npy, matrix_indptr.npy,
+              matrix_worker_ids.npy, matrix_user_ids.npy,
+              neighbor_indices.npy, neighbor_similarities.npy
+    workers.json, worker_ids.npy, worker_names_{blob,offsets}.npy, worker_genres_{blob,offsets}.npy
+
+Serving opens every array with np.load(mmap_mode='r'): nothing is parsed or
+unpickled, pages are read lazily and forked workers share them.
+"""
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from typing import Optional
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from data_processing import RatingMatrix
+from config import ARTIFACT_VERSIONS_TO_KEEP
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+CURRENT_POINTER = "CURRENT"
+VERSIONS_FOLDER = "versions"
+
+
+def _atomic_write(path, write, mode="wb"):
+    """Write through a temp file and rename, so readers (and hard links) never see partial files."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def save_array(folder, name, array):
+    _atomic_write(os.path.join(folder, f"{name}.npy"),
+                  lambda f: np.save(f, np.ascontiguousarray(array), allow_pickle=False))
+
+def load_array(folder, name, mmap_mode='r'):
+    return np.load(os.path.join(folder, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+
+def save_strings(folder, name, strings):
+    """Store strings as one UTF-8 blob plus an offsets array (no object arrays, no pickle)."""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(s) for s in encoded])
+    save_array(folder, f"{name}_blob", np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    save_array(folder, f"{name}_offsets", offsets)
+
+def load_strings(folder, name) -> list[str]:
+    blob = load_array(folder, f"{name}_blob").tobytes()
+    offsets = load_array(folder, f"{name}_offsets").tolist()
+    return [blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+def save_metadata(folder, name, metadata):
+    _atomic_write(os.path.join(folder, f"{name}.json"),
+                  lambda f: json.dump({"format_version": FORMAT_VERSION, **metadata}, f), mode="w")
+
+def load_metadata(folder, name):
+    with open(os.path.join(folder, f"{name}.json")) as f:
+        return json.load(f)
+
+def has_bundle(folder) -> bool:
+    """Check that every part of a bundle has been exported to the folder."""
+    return all(os.path.exists(os.path.join(folder, f"{part}.json")) for part in ("svd", "knn", "workers"))
+
+
+def current_version(root) -> Optional[str]:
+    """Return the version CURRENT points at, or None if nothing has been published."""
+    try:
+        with open(os.path.join(root, CURRENT_POINTER)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def current_bundle_folder(root) -> Optional[str]:
+    """Return the folder of the published bundle (or of a pre-versioning bundle in root)."""
+    version = current_version(root)
+    if version:
+        return os.path.join(root, VERSIONS_FOLDER, version)
+    return root if has_bundle(root) else None
+
+def new_version_folder(root) -> str:
+    """Create a staging folder for a new version, seeded with hard links to the current bundle.
+
+    Parts the caller does not retrain carry over unchanged; parts it re-exports
+    are replaced file by file (save_array renames, it never writes in place).
+    """
+    version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    folder = os.path.join(root, VERSIONS_FOLDER, version)
+    os.makedirs(folder)
+    base = current_bundle_folder(root)
+    if base:
+        for name in os.listdir(base):
+            source = os.path.join(base, name)
+            if os.path.isfile(source) and (name.endswith(".npy") or name.endswith(".json")):
+                os.link(source, os.path.join(folder, name))
+    return folder
+
+def publish_version(root, folder) -> str:
+    """Atomically point CURRENT at a fully exported version folder and prune old versions."""
+    if not has_bundle(folder):
+        raise ValueError(f"Refusing to publish incomplete artifact bundle {folder}")
+    version = os.path.basename(os.path.normpath(folder))
+    _atomic_write(os.path.join(root, CURRENT_POINTER), lambda f: f.write(version), mode="w")
+    logger.info(f"Published artifact version {version}")
+    prune_versions(root)
+    return version
+
+def prune_versions(root, keep: int = ARTIFACT_VERSIONS_TO_KEEP):
+    """Delete all but the newest `keep` versions, never the current one.
+
+    Snapshots still serving from a deleted version keep working: their mapped
+    files stay alive until unmapped.
+    """
+    versions_root = os.path.join(root, VERSIONS_FOLDER)
+    if not os.path.isdir(versions_root):
+        return
+    current = current_version(root)
+    versions = sorted(os.listdir(versions_root), reverse=True)
+    for version in versions[keep:]:
+        if version != current:
+            shutil.rmtree(os.path.join(versions_root, version), ignore_errors=True)
+
+
+def export_svd(svd, folder, ratings_log_bytes: int = 0):
+    """Export the factors, biases and id mapping of a trained surprise SVD (and how much of the ratings log it saw)."""
+    os.makedirs(folder, exist_ok=True)
+    trainset = svd.trainset
+    save_array(folder, "svd_pu", svd.pu)
+    save_array(folder, "svd_qi", svd.qi)
+    save_array(folder, "svd_bu", svd.bu)
+    save_array(folder, "svd_bi", svd.bi)
+    save_array(folder, "svd_user_ids",
+               np.array([trainset.to_raw_uid(inner) for inner in range(trainset.n_users)], dtype=np.int64))
+    save_array(folder, "svd_item_ids",
+               np.array([trainset.to_raw_iid(inner) for inner in range(trainset.n_items)], dtype=np.int64))
+    save_metadata(folder, "svd", {
+        "global_mean": float(trainset.global_mean),
+        "biased": bool(svd.biased),
+        "rating_scale": list(trainset.rating_scale),
+        "ratings_log_bytes": int(ratings_log_bytes),
+    })
+
+def export_knn(rating_matrix: RatingMatrix, indices, similarities, folder, backend: str = "brute"):
+    """Export the CSR rating matrix and the precomputed neighbor table."""
+    os.makedirs(folder, exist_ok=True)
+    matrix = rating_matrix.matrix
+    save_array(folder, "matrix_data", matrix.data)
+    save_array(folder, "matrix_indices", matrix.indices)
+    save_array(folder, "matrix_indptr", matrix.indptr)
+    save_array(folder, "matrix_worker_ids", rating_matrix.worker_ids)
+    save_array(folder, "matrix_user_ids", rating_matrix.user_ids)
+    save_array(folder, "neighbor_indices", indices)
+    save_array(folder, "neighbor_similarities", similarities)
+    save_metadata(folder, "knn", {"shape": list(matrix.shape), "n_neighbors": int(indices.shape[1]),
+                                  "backend": backend})
+
+def export_workers(worker_df: pd.DataFrame, folder):
+    """Export the worker id, name and genre table used for lookups and the genre index."""
+    os.makedirs(folder, exist_ok=True)
+    save_array(folder, "worker_ids", worker_df['workerId'].to_numpy(dtype=np.int64))
+    save_strings(folder, "worker_names", worker_df['names'].astype(str).tolist())
+    save_strings(folder, "worker_genres", worker_df['genres'].fillna('').astype(str).tolist())
+    save_metadata(folder, "workers", {"count": len(worker_df)})
+
+
+def load_svd_arrays(folder) -> dict:
+    """Return the keyword arguments of BatchSVDScorer, backed by memory-mapped arrays."""
+    metadata = load_metadata(folder, "svd")
+    return {
+        "pu": load_array(folder, "svd_pu"),
+        "qi": load_array(folder, "svd_qi"),
+        "bu": load_array(folder, "svd_bu"),
+        "bi": load_array(folder, "svd_bi"),
+        "global_mean": metadata["global_mean"],
+        "user_ids": load_array(folder, "svd_user_ids"),
+        "item_ids": load_array(folder, "svd_item_ids"),
+        "biased": metadata["biased"],
+        "rating_scale": tuple(metadata["rating_scale"]),
+    }
+
+def load_rating_matrix(folder) -> RatingMatrix:
+    metadata = load_metadata(folder, "knn")
+    matrix = csr_matrix(
+        (load_array(folder, "matrix_data"), load_array(folder, "matrix_indices"), load_array(folder, "matrix_indptr")),
+        shape=tuple(metadata["shape"]),
+        copy=False,
+    )
+    return RatingMatrix(matrix=matrix, worker_ids=load_array(folder, "matrix_worker_ids"),
+                        user_ids=load_array(folder, "matrix_user_ids"))
+
+def load_neighbor_arrays(folder):
+    """Return the (indices, similarities) neighbor table arrays."""
+    return load_array(folder, "neighbor_indices"), load_array(folder, "neighbor_similarities")
+
+def load_workers(folder) -> pd.DataFrame:
+    return pd.DataFrame({
+        "workerId": load_array(folder, "worker_ids"),
+        "names": load_strings(folder, "worker_names"),
+        "genres": load_strings(folder, "worker_genres"),
+    })
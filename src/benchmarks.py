@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import config
+from config import KNN_NEIGHBORS, RATINGS_FILE, WORKERS_FILE, FINAL_FILE, ARTIFACTS_FOLDER
+from data_processing import load_ratings_data, load_ratings, stream_ratings
+from neighbor_index import make_neighbor_index
+
+SRC_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Libraries both loaders need anyway are imported before the clock starts, so
+# the timing covers model/data loading (including sklearn/surprise imports
+# pulled in by unpickling) rather than interpreter start-up.
+STARTUP_SNIPPET = """
+import time
+import numpy, pandas, scipy.sparse
+import schemas, service_pb2
+start = time.perf_counter()
+import recommendations
+print(time.perf_counter() - start)
+"""
+
+
+def _make_workdir(base_folder, with_bundle: bool) -> str:
+    """Create a working directory that exposes data/ and pkl_objects/, and artifacts/ if requested."""
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    links = ["data", "pkl_objects"] + (["artifacts"] if with_bundle else [])
+    for name in links:
+        os.symlink(os.path.join(base_folder, name), os.path.join(workdir, name))
+    return workdir
+
+def _time_startup(workdir) -> float:
+    env = {**os.environ, "PYTHONPATH": SRC_FOLDER}
+    result = subprocess.run([sys.executable, "-c", STARTUP_SNIPPET], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def bench_startup(base_folder: str = os.getcwd(), repeat: int = 5) -> dict:
+    """Time a cold `import recommendations` with pickle/CSV loading vs. the mmap bundle.
+
+    Each run is a fresh interpreter, so nothing is shared between runs except
+    the OS page cache.
+    """
+    if not os.path.isdir(os.path.join(base_folder, "artifacts")):
+        raise FileNotFoundError("No artifacts/ folder, run models_training.py first")
+
+    results = {}
+    for label, with_bundle in (("pickle_csv", False), ("mmap_bundle", True)):
+        workdir = _make_workdir(base_folder, with_bundle)
+        try:
+            timings = [_time_startup(workdir) for _ in range(repeat)]
+        finally:
+            shutil.rmtree(workdir)
+        results[label] = {"median_s": statistics.median(timings), "min_s": min(timings), "runs": timings}
+    return results
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def recall_at_k(approximate_distances, exact_distances) -> float:
+    """Mean fraction of the approximate neighbors that are as close as the exact k-th neighbor.
+
+    Measured on distances rather than ids, since many workers share identical
+    rating vectors and brute force picks arbitrarily among tied neighbors.
+    """
+    valid = approximate_distances <= exact_distances[:, -1:] + 1e-12
+    return float(valid.sum(axis=1).clip(max=exact_distances.shape[1]).mean()) / exact_distances.shape[1]
+
+def id_overlap_at_k(approximate, exact) -> float:
+    """Mean fraction of each row's brute-force neighbor ids that the approximate search returned."""
+    hits = [len(np.intersect1d(a, e)) for a, e in zip(approximate, exact)]
+    return float(np.mean(hits)) / exact.shape[1]
+
+def bench_neighbors(k: int = KNN_NEIGHBORS, probes=(1, 2, 4, 8, 16)) -> dict:
+    """Compare the approximate IVF backend against exact brute force on the rating matrix.
+
+    Build is fit(); query is kneighbors() for every worker, i.e. building the
+    neighbor table. Recall@k is measured against the brute-force neighbors.
+    """
+    csr_data = load_ratings(use_cache=False).to_rating_matrix().matrix
+    brute = make_neighbor_index("brute")
+    _, build_s = _timed(brute.fit, csr_data)
+    (exact_distances, exact), query_s = _timed(brute.kneighbors, csr_data, n_neighbors=k)
+    results = {"brute": {"build_s": build_s, "query_s": query_s, "recall": 1.0, "id_overlap": 1.0}}
+
+    ivf = make_neighbor_index("ivf")
+    _, build_s = _timed(ivf.fit, csr_data)
+    for n_probe in probes:
+        ivf.n_probe = n_probe
+        (distances, approximate), query_s = _timed(ivf.kneighbors, csr_data, n_neighbors=k)
+        results[f"ivf probe={n_probe}"] = {"build_s": build_s, "query_s": query_s,
+                                           "recall": recall_at_k(distances, exact_distances),
+                                           "id_overlap": id_overlap_at_k(approximate, exact)}
+    return results
+
+def _measure(fn) -> dict:
+    """Run fn once and return wall time, peak traced allocation and the size of what it returned."""
+    tracemalloc.start()
+    try:
+        result, seconds = _timed(fn)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if isinstance(result, pd.DataFrame):
+        retained = result.memory_usage(deep=True).sum()
+    else:
+        retained = sum(getattr(result, name).nbytes for name in vars(result))
+    return {"seconds": seconds, "peak_mb": peak / 2 ** 20, "retained_mb": retained / 2 ** 20}
+
+def bench_ratings_loading(filename: str = RATINGS_FILE) -> dict:
+    """Compare the pandas ratings loader with the streaming loader and its binary cache.
+
+    "pandas x2" is what training used to do: one full read_csv per trainer.
+    """
+    cache_file = os.path.join(tempfile.mkdtemp(prefix="bench_"), "ratings.npz")
+    try:
+        results = {
+            "pandas": _measure(load_ratings_data),
+            "pandas x2": _measure(lambda: (load_ratings_data(), load_ratings_data())[0]),
+            "streaming": _measure(lambda: stream_ratings(filename)),
+        }
+        load_ratings(filename=filename, cache_file=cache_file)  # Write the cache
+        results["binary cache"] = _measure(lambda: load_ratings(filename=filename, cache_file=cache_file))
+    finally:
+        shutil.rmtree(os.path.dirname(cache_file))
+    return results
+
+
+# Full suite: real and synthetically scaled catalogs, each trained and served in
+# its own work directory and subprocess so peak RSS is per phase
+
+REGRESSION_THRESHOLD = 0.2  # Relative slowdown reported as a regression
+MIN_COMPARABLE_VALUE = 1e-4  # Ignore metrics too small to time reliably
+HIGHER_IS_BETTER = ("recall", "id_overlap")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+def make_synthetic_catalog(data_folder: str, scale: int, source_folder: str = config.DATA_FOLDER):
+    """Write a catalog `scale` times larger in workers, users and ratings into data_folder.
+
+    Every replica copies the real workers and ratings with shifted worker and
+    user ids, so per-worker and per-user rating density stay realistic.
+    """
+    os.makedirs(data_folder, exist_ok=True)
+    id_offset = 10 ** 13  # Above every real id
+    ratings = pd.read_csv(os.path.join(source_folder, os.path.basename(RATINGS_FILE)))
+    ratings = pd.concat([ratings.assign(userId=ratings['userId'] + replica * id_offset,
+                                        movieId=ratings['movieId'] + replica * id_offset)
+                         for replica in range(scale)], ignore_index=True)
+    ratings.to_csv(os.path.join(data_folder, os.path.basename(RATINGS_FILE)), index=False)
+
+    for filename, id_column, name_column in ((FINAL_FILE, 'workerId', 'names'), (WORKERS_FILE, 'movieId', 'title')):
+        workers = pd.read_csv(os.path.join(source_folder, os.path.basename(filename)))
+        workers = pd.concat([workers.assign(**{id_column: workers[id_column] + replica * id_offset,
+                                               name_column: workers[name_column] + (f" #{replica}" if replica else "")})
+                             for replica in range(scale)], ignore_index=True)
+        workers.to_csv(os.path.join(data_folder, os.path.basename(filename)), index=False)
+
+def _phase_train(knn_backend: str = None) -> dict:
+    """Train both models into a new artifact version of the current work directory."""
+    if knn_backend:
+        config.KNN_BACKEND = knn_backend  # Before models_training reads it
+    from artifacts import new_version_folder, publish_version
+    from models_training import train_svd, train_knn
+
+    folder = new_version_folder(ARTIFACTS_FOLDER)
+    ratings, load_s = _timed(load_ratings, use_cache=False)
+    _, svd_s = _timed(train_svd, folder, ratings)
+    _, knn_s = _timed(train_knn, folder, ratings)
+    publish_version(ARTIFACTS_FOLDER, folder)
+    return {"ratings_load_s": load_s, "train_svd_s": svd_s, "train_knn_s": knn_s,
+            "ratings": len(ratings), "workers": len(ratings.worker_ids), "users": len(ratings.user_ids),
+            "peak_rss_mb": peak_rss_mb()}
+
+def _phase_serve(warm_repeat: int = 20) -> dict:
+    """Load the published artifacts, time per-genre latency and a full cache rebuild."""
+    start = time.perf_counter()
+    from recommendations import get_top_workers_by_genre
+    load_s = time.perf_counter() - start
+    from catalog import catalog_service
+    from cache_service import recommendation_cache
+
+    genres = catalog_service.genres()
+    cold = {genre: _timed(get_top_workers_by_genre, genre)[1] for genre in genres}
+    warm = {genre: statistics.median(_timed(get_top_workers_by_genre, genre)[1] for _ in range(warm_repeat))
+            for genre in genres}
+    _, rebuild_s = _timed(recommendation_cache.update_all_recommendations, None)
+    return {
+        "artifact_load_s": load_s,
+        "cold_latency_s": cold,
+        "warm_latency_s": warm,
+        "cold_latency_p50_s": statistics.median(cold.values()),
+        "warm_latency_p50_s": statistics.median(warm.values()),
+        "warm_latency_max_s": max(warm.values()),
+        "cache_rebuild_s": rebuild_s,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def _run_phase(workdir: str, phase: str, *args) -> dict:
+    env = {**os.environ, "PYTHONPATH": SRC_FOLDER}
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--phase", phase, *args],
+                            cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"{phase} phase failed in {workdir}:\n{result.stderr[-2000:]}")
+    # The phase prints its JSON result last; trainers print progress before it
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def bench_scenario(scale: int = 1, knn_backend: str = None, base_folder: str = os.getcwd()) -> dict:
+    """Train and serve one catalog (the bundled data at scale 1) in a temporary work directory."""
+    workdir = tempfile.mkdtemp(prefix=f"bench_x{scale}_")
+    try:
+        if scale == 1:
+            os.symlink(os.path.join(base_folder, "data"), os.path.join(workdir, "data"))
+        else:
+            _, generate_s = _timed(make_synthetic_catalog, os.path.join(workdir, "data"), scale,
+                                   os.path.join(base_folder, "data"))
+        for name in ("pkl_objects", "artifacts", "cache"):
+            os.makedirs(os.path.join(workdir, name))
+        results = {"train": _run_phase(workdir, "train", *([knn_backend] if knn_backend else [])),
+                   "serve": _run_phase(workdir, "serve")}
+        if scale != 1:
+            results["generate_s"] = generate_s
+        return results
+    finally:
+        shutil.rmtree(workdir)
+
+def run_suite(scales=(1, 10), knn_backend: str = None, components: bool = True) -> dict:
+    results = {
+        "meta": {"created_at": datetime.now().isoformat(), "python": platform.python_version(),
+                 "machine": platform.machine(), "scales": list(scales), "knn_backend": knn_backend or config.KNN_BACKEND},
+        "scenarios": {},
+    }
+    for scale in scales:
+        label = "real" if scale == 1 else f"x{scale}"
+        print(f"Running scenario {label}...", file=sys.stderr)
+        results["scenarios"][label] = bench_scenario(scale, knn_backend)
+    if components:
+        results["components"] = {"ratings_loading": bench_ratings_loading(), "neighbors": bench_neighbors()}
+        if os.path.isdir(ARTIFACTS_FOLDER):
+            results["components"]["startup"] = bench_startup()
+    return results
+
+def print_summary(results: dict):
+    for label, scenario in results["scenarios"].items():
+        train, serve = scenario["train"], scenario["serve"]
+        print(f"{label:5s} {train['workers']:>8d} workers {train['ratings']:>9d} ratings | "
+              f"train svd {train['train_svd_s']:7.2f} s knn {train['train_knn_s']:7.2f} s "
+              f"rss {train['peak_rss_mb']:7.0f} MB | load {serve['artifact_load_s'] * 1000:7.1f} ms "
+              f"cold p50 {serve['cold_latency_p50_s'] * 1000:6.2f} ms warm p50 {serve['warm_latency_p50_s'] * 1000:6.2f} ms "
+              f"rebuild {serve['cache_rebuild_s']:6.2f} s rss {serve['peak_rss_mb']:6.0f} MB")
+
+def _flatten(results, prefix: str = "") -> dict:
+    """Map "a.b.c" paths to the numeric leaves of a nested result dict."""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+def compare(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    """Return (metric, baseline, current, ratio, regressed) for every metric present in both runs."""
+    current, previous = _flatten(results.get("scenarios", {}) | {"components": results.get("components", {})}), \
+        _flatten(baseline.get("scenarios", {}) | {"components": baseline.get("components", {})})
+    rows = []
+    for metric in sorted(current.keys() & previous.keys()):
+        old, new = previous[metric], current[metric]
+        if abs(old) < MIN_COMPARABLE_VALUE:
+            continue
+        ratio = new / old
+        higher_is_better = any(name in metric for name in HIGHER_IS_BETTER)
+        regressed = ratio < 1 - threshold if higher_is_better else ratio > 1 + threshold
+        rows.append((metric, old, new, ratio, regressed))
+    return rows
+
+def print_comparison(rows):
+    for metric, old, new, ratio, regressed in rows:
+        flag = "REGRESSED" if regressed else ""
+        print(f"{metric:70s} {old:12.4f} -> {new:12.4f}  x{ratio:5.2f}  {flag}")
+    print(f"{sum(row[4] for row in rows)} of {len(rows)} metrics regressed")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark loading, serving, cache rebuild and training.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10],
+                        help="Catalog sizes to run, 1 being the bundled data (100 needs time and memory)")
+    parser.add_argument("--knn-backend", help="Override KNN_BACKEND for training, e.g. ivf for large scales")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Compare against a previous results file")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--no-components", action="store_true",
+                        help="Skip the startup, ratings loading and neighbor backend micro benchmarks")
+    parser.add_argument("--phase", choices=["train", "serve"], help=argparse.SUPPRESS)
+    parser.add_argument("phase_args", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase == "train":
+        print(json.dumps(_phase_train(*args.phase_args)))
+    elif args.phase == "serve":
+        print(json.dumps(_phase_serve()))
+    else:
+        suite = run_suite(args.scales, args.knn_backend, components=not args.no_components)
+        with open(args.output, "w") as f:
+            json.dump(suite, f, indent=2)
+        print_summary(suite)
+        print(f"Results written to {args.output}")
+        if args.baseline:
+            with open(args.baseline) as f:
+                comparison = compare(suite, json.load(f), args.threshold)
+            print_comparison(comparison)
+            sys.exit(1 if any(row[4] for row in comparison) else 0)
@@ -1,22 +1,109 @@
+import atexit
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-from config import RECOMMENDATIONS_CACHE_FILE, CACHE_FOLDER
-from data_processing import get_all_genres
-from recommendations import get_top_workers_by_genre
+from config import (RECOMMENDATIONS_CACHE_FILE, CACHE_FOLDER, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES,
+                    CACHE_FLUSH_DELAY_SECONDS, RANKING_CACHE_MAX_ENTRIES, WEIGHT_KNN, WEIGHT_SVD, GENRE_MATCH_MODE)
+from change_tracking import ChangeTracker, ChangeScan
+from catalog import catalog_service
+from data_processing import normalize_genre
+from recommendations import (model_registry, to_recommendation_response, GenreRanking, HybridRecommender,
+                             GenreSpec, canonical_genre, member_genres)
+from model_registry import ModelSnapshot
+from ingestion import rating_ingestor, RatingUpdate
 from schemas import RecommendationResponse
+from metrics import registry, CACHE_REBUILD_SECONDS
 import logging
 
 logger = logging.getLogger(__name__)
 
+CACHE_FORMAT_VERSION = 3
+KEY_SEPARATOR = "::"
+
+
+def cache_key(genre: GenreSpec, user_id: int = 1, top_n: int = 8, weight_knn: float = WEIGHT_KNN,
+              weight_svd: float = WEIGHT_SVD) -> str:
+    """Build the cache key of a query; every parameter that changes the result is part of it.
+
+    The genre part is canonical, so "Plumbing" and " plumbing", or the same
+    genres listed in another order, share one entry.
+    """
+    return KEY_SEPARATOR.join([
+        canonical_genre(genre), f"user={int(user_id)}", f"top={int(top_n)}",
+        f"knn={float(weight_knn)!r}", f"svd={float(weight_svd)!r}",
+    ])
+
+
+def ranking_key(genre: GenreSpec, user_id: int = 1, weight_knn: float = WEIGHT_KNN,
+                weight_svd: float = WEIGHT_SVD) -> str:
+    """Cache key of a full ranking: a query without top_n, since every page comes from it."""
+    return KEY_SEPARATOR.join([
+        canonical_genre(genre), f"user={int(user_id)}", "ranking",
+        f"knn={float(weight_knn)!r}", f"svd={float(weight_svd)!r}",
+    ])
+
+
+def canonical_key(key: str) -> str:
+    """Rewrite a stored key with a canonical genre part (keys written before format 3 used the raw genre)."""
+    genre, rest = key.split(KEY_SEPARATOR, 1)
+    return KEY_SEPARATOR.join([normalize_genre(genre), rest])
+
+
+@dataclass
+class CacheEntry:
+    value: RecommendationResponse
+    cached_at: float  # epoch seconds
+
+
+@dataclass
+class RankingEntry:
+    ranking: GenreRanking
+    recommender: HybridRecommender  # Resolves the ranking's rows; the one that computed it
+    cached_at: float  # epoch seconds
+
+
 class RecommendationCache:
-    def __init__(self):
+    """In-memory LRU cache of recommendation responses with per-entry TTL.
+
+    Lookups and inserts never touch the disk: changes mark the cache dirty and a
+    debounced background timer writes the whole cache at most once per
+    flush_delay seconds, through a temp file and an atomic rename.
+
+    Next to the responses it keeps full per-query rankings (memory only, under
+    their own LRU bound), so any offset/limit page is a slice, not a rescore.
+    """
+
+    def __init__(self, ttl_seconds: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES,
+                 flush_delay: float = CACHE_FLUSH_DELAY_SECONDS):
         self.cache_file = RECOMMENDATIONS_CACHE_FILE
-        self.last_updated = None
-        self.cache_data = {}
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.flush_delay = flush_delay
+        self.last_updated = None  # ISO time of the last full rebuild
+        self.model_version = model_registry.version
+        self.last_rebuild = None  # Timings of the last full or incremental rebuild
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._rankings: "OrderedDict[str, RankingEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._flush_timer = None
         self._ensure_cache_folder_exists()
+        self.change_tracker = ChangeTracker()
         self._load_cache()
+        model_registry.add_listener(self.on_model_swap)
+        atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self._entries)
 
     def _ensure_cache_folder_exists(self):
         """Ensure the cache folder exists."""
@@ -24,82 +111,312 @@ class RecommendationCache:
             os.makedirs(CACHE_FOLDER)
 
     def _load_cache(self):
-        """Load cache from file if it exists."""
+        """Load cache from file if it exists (both the current and the legacy per-genre format)."""
         try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, 'r') as f:
-                    data = json.load(f)
-                    self.cache_data = data.get('recommendations', {})
-                    self.last_updated = data.get('last_updated')
-                    logger.info("Cache loaded successfully")
-            else:
+            if not os.path.exists(self.cache_file):
                 logger.info("No cache file found, starting fresh")
+                return
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+            # Entries computed by other models are stale (files without a version predate versioning)
+            cached_version = data.get('model_version')
+            if cached_version and cached_version != self.model_version:
+                logger.info(f"Cache was built for model version {cached_version}, ignoring it")
+                return
+            self.last_updated = data.get('last_updated')
+
+            if 'entries' in data:
+                items = [(canonical_key(key), entry['value'], entry['cached_at'])
+                         for key, entry in data['entries'].items()]
+            else:
+                # Legacy file: {genre: response} for the default query, all written at last_updated
+                written_at = datetime.fromisoformat(self.last_updated).timestamp() if self.last_updated else 0.0
+                items = [(cache_key(genre), value, written_at) for genre, value in data.get('recommendations', {}).items()]
+
+            # Oldest first, so LRU order follows age
+            for key, value, cached_at in sorted(items, key=lambda item: item[2]):
+                self._entries[key] = CacheEntry(RecommendationResponse(**value), cached_at)
+            self._evict()
+            logger.info(f"Cache loaded successfully ({len(self._entries)} entries)")
         except Exception as e:
             logger.error(f"Error loading cache: {e}")
-            self.cache_data = {}
+            self._entries.clear()
 
-    def _save_cache(self):
-        """Save current cache to file."""
+    def _serialize(self) -> dict:
+        return {
+            'format_version': CACHE_FORMAT_VERSION,
+            'last_updated': self.last_updated,
+            'model_version': self.model_version,
+            'entries': {
+                key: {'cached_at': entry.cached_at, 'value': entry.value.model_dump()}
+                for key, entry in self._entries.items()
+            },
+        }
+
+    def _save_cache(self, data: dict):
+        """Write the cache file atomically (temp file + rename)."""
+        tmp_file = f"{self.cache_file}.tmp"
+        with self._write_lock:
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_file, self.cache_file)
+        logger.info("Cache saved successfully")
+
+    def _mark_dirty(self):
+        """Schedule a write-behind flush; changes within flush_delay are written together."""
+        with self._lock:
+            self._dirty = True
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_delay, self._flush_from_timer)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._flush_timer = None
+        self.flush()
+
+    def flush(self):
+        """Persist pending changes now."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = self._serialize()
+            self._dirty = False
         try:
-            data = {
-                'last_updated': datetime.now().isoformat(),
-                'recommendations': self.cache_data
-            }
-            with open(self.cache_file, 'w') as f:
-                json.dump(data, f, indent=2)
-            logger.info("Cache saved successfully")
+            self._save_cache(data)
         except Exception as e:
             logger.error(f"Error saving cache: {e}")
+            self._mark_dirty()
 
-    def update_all_recommendations(self):
-        """Generate and cache recommendations for all genres."""
-        all_genres = get_all_genres()
-        logger.info(f"Updating recommendations for {len(all_genres)} genres")
-        
-        updated_cache = {}
-        for genre in all_genres:
-            try:
-                result = get_top_workers_by_genre(genre)
-                # Ensure proper serialization
-                updated_cache[genre] = {
-                    "recommendations": [
-                        {
-                            "workerId": rec.workerId,
-                            "name": rec.name,
-                            "score": float(rec.score)
-                        }
-                        for rec in result.recommendations
-                    ]
-                }
-            except Exception as e:
-                logger.error(f"Error generating recommendations for {genre}: {e}")
-                continue
-        
-        self.cache_data = updated_cache
-        self._save_cache()
-        return len(all_genres)
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        while len(self._rankings) > RANKING_CACHE_MAX_ENTRIES:
+            self._rankings.popitem(last=False)
+            self.evictions += 1
 
-    def get_cached_recommendations(self, genre: str) -> Optional[RecommendationResponse]:
-        """Get cached recommendations for a genre."""
-        cached = self.cache_data.get(genre)
-        if cached:
-            try:
-                # Convert the cached dictionary to a RecommendationResponse object
-                return RecommendationResponse(**cached)
-            except Exception as e:
-                logger.error(f"Error parsing cached recommendations for {genre}: {e}")
+    def _is_expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.cached_at >= self.ttl_seconds
+
+    def get(self, genre: GenreSpec, **params) -> Optional[RecommendationResponse]:
+        """Return the cached response for a query, or None if it is missing or expired."""
+        key = cache_key(genre, **params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry, time.time()):
+                self.misses += 1
                 return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, genre: GenreSpec, result: RecommendationResponse, **params):
+        """Insert a response, evicting the least recently used entries beyond max_entries."""
+        key = cache_key(genre, **params)
+        with self._lock:
+            self._entries[key] = CacheEntry(result, time.time())
+            self._entries.move_to_end(key)
+            self._evict()
+        self._mark_dirty()
+
+    def get_page(self, genre: GenreSpec, offset: int = 0, limit: int = 8, user_id: int = 1,
+                 weight_knn: float = WEIGHT_KNN, weight_svd: float = WEIGHT_SVD) -> Optional[RecommendationResponse]:
+        """Return one page of a cached query, or None if neither its ranking nor the page is cached."""
+        key = ranking_key(genre, user_id, weight_knn, weight_svd)
+        with self._lock:
+            entry = self._rankings.get(key)
+            if entry is not None and not self._is_expired(entry, time.time()):
+                self._rankings.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = None
+        if entry is not None:
+            return to_recommendation_response(entry.recommender.page(entry.ranking, offset, limit))
+        if offset == 0:
+            # First pages are also cached as plain responses (and survive restarts)
+            return self.get(genre, user_id=user_id, top_n=limit, weight_knn=weight_knn, weight_svd=weight_svd)
+        with self._lock:
+            self.misses += 1
         return None
 
-    def is_cache_fresh(self, hours: int = 12) -> bool:
-        """Check if cache is fresh (updated within specified hours)."""
+    def put_ranking(self, genre: GenreSpec, ranking: GenreRanking, snapshot: ModelSnapshot, user_id: int = 1,
+                    weight_knn: float = WEIGHT_KNN, weight_svd: float = WEIGHT_SVD):
+        """Cache the full ranking of a query, unless it was computed by models since swapped out."""
+        if snapshot.version != self.model_version:
+            logger.info(f"Dropping ranking for {genre} computed by stale model version {snapshot.version}")
+            return
+        key = ranking_key(genre, user_id, weight_knn, weight_svd)
+        with self._lock:
+            self._rankings[key] = RankingEntry(ranking, snapshot.recommender, time.time())
+            self._rankings.move_to_end(key)
+            self._evict()
+
+    def _drop_genres(self, genres):
+        """Drop every cached query (any parameters, multi-genre ones too) that involves a recomputed genre."""
+        tokens = {normalize_genre(genre) for genre in genres}
+
+        def involved(genre):
+            return genre in tokens or (GENRE_MATCH_MODE == "substring" and any(genre in token for token in tokens))
+
+        with self._lock:
+            for entries in (self._entries, self._rankings):
+                for key in list(entries):
+                    if any(involved(genre) for genre in member_genres(key.split(KEY_SEPARATOR, 1)[0])):
+                        del entries[key]
+
+    def _drop_users(self, user_ids):
+        """Drop every cached query of the given users."""
+        users = {f"user={int(user_id)}" for user_id in user_ids}
+        with self._lock:
+            for entries in (self._entries, self._rankings):
+                for key in list(entries):
+                    if key.split(KEY_SEPARATOR)[1] in users:
+                        del entries[key]
+
+    def invalidate(self, model_version: str):
+        """Drop every entry and mark the cache as belonging to a new model version."""
+        with self._lock:
+            self.model_version = model_version
+            self._entries.clear()
+            self._rankings.clear()
+            self.last_updated = None
+        self._mark_dirty()
+
+    def on_model_swap(self, snapshot: ModelSnapshot):
+        """Registry listener: invalidate, then rebuild against the newly swapped-in models."""
+        logger.info(f"Model version changed to {snapshot.version}, rebuilding recommendation cache")
+        self.invalidate(snapshot.version)
+        self.update_all_recommendations(models_changed=True)
+
+    def on_ratings_update(self, update: RatingUpdate):
+        """Ingestor listener: keep what the new ratings cannot change, recompute the affected genres.
+
+        Entries of other genres stay valid under the updated version; the
+        ingesting users' entries are dropped everywhere, since their SVD factors
+        moved.
+        """
+        start = time.perf_counter()
+        genres = update.snapshot.recommender.affected_genres(update.worker_ids)
+        with self._lock:
+            self.model_version = update.snapshot.version
+            self._drop_genres(genres)
+            self._drop_users(update.user_ids)
+        self._recompute(sorted(genres), start, mode="online", snapshot=update.snapshot,
+                        changed_workers=len(update.worker_ids))
+
+    def update_all_recommendations(self, scan: Optional[ChangeScan] = None, models_changed: bool = False):
+        """Generate and cache recommendations for all genres in one bulk pass.
+
+        Ratings fingerprints are only committed with models_changed (or for the
+        first baseline): until a retrain, the serving models do not include them.
+        """
+        start = time.perf_counter()
+        # Fingerprint the data before computing, so changes made during the rebuild are seen next time
+        scan = scan or self.change_tracker.scan()
+        catalog_service.refresh()
+        all_genres = catalog_service.genres()
+        logger.info(f"Updating recommendations for {len(all_genres)} genres")
+        count = self._recompute(all_genres, start, mode="full")
+        if count is not None:
+            self.change_tracker.commit(scan, None if models_changed or not scan.has_baseline else ("workers",))
+        return count or 0
+
+    def refresh_changed(self):
+        """Recompute only the genres affected by catalog rows changed since the last build.
+
+        Falls back to a full rebuild when there is no fingerprint baseline or the
+        cache was never built. The catalog is reloaded into the serving models
+        first; changed ratings files are left uncommitted, as they only move
+        results once a retrain has absorbed them (which rebuilds everything).
+        """
+        start = time.perf_counter()
+        scan = self.change_tracker.scan()
+        if not scan.has_baseline or not self.last_updated:
+            logger.info("No fingerprint baseline, running a full rebuild")
+            return self.update_all_recommendations(scan)
+        if not scan.has_changes:
+            logger.info("No worker changes since the last build")
+            self.change_tracker.commit(scan)
+            return 0
+
+        rating_changes = scan.changed_in("ratings")
+        if len(rating_changes):
+            logger.info(f"Ratings of {len(rating_changes)} workers changed; they reach the results with the next retrain")
+        changed_workers = scan.changed_in("workers")
+        if not len(changed_workers):
+            return 0
+
+        # Serve the catalog just scanned (or a newer one), then recompute against it
+        catalog_service.refresh()
+        snapshot = model_registry.current()
+        # Genres the changed workers belong to or reach as neighbors now, plus the ones they left
+        genres = snapshot.recommender.affected_genres(changed_workers) | scan.previous_genres(changed_workers)
+        logger.info(f"{len(changed_workers)} workers changed, refreshing {len(genres)} genres")
+
+        self._drop_genres(genres)
+        count = self._recompute(sorted(genres), start, mode="incremental", snapshot=snapshot,
+                                changed_workers=len(changed_workers))
+        if count is not None:
+            self.change_tracker.commit(scan, ("workers",))
+        return count or 0
+
+    def _recompute(self, genres, start: float, mode: str, snapshot: Optional[ModelSnapshot] = None,
+                   changed_workers: Optional[int] = None) -> Optional[int]:
+        """Rank genres in one bulk pass and cache them; None if the models changed meanwhile."""
+        # One snapshot for the whole pass, so every genre comes from the same models
+        snapshot = snapshot or model_registry.current()
+        rankings, genre_seconds = snapshot.recommender.rank_many(genres)
+        shared_seconds = genre_seconds.pop("_shared")
+
+        if snapshot.version != self.model_version:
+            logger.info(f"Models changed during rebuild, discarding results of version {snapshot.version}")
+            return None
+
+        for genre, ranking in rankings.items():
+            self.put_ranking(genre, ranking, snapshot)
+            self.put(genre, to_recommendation_response(snapshot.recommender.page(ranking)))
+
+        self.last_updated = datetime.now().isoformat()
+        self.last_rebuild = {
+            "mode": mode,
+            "changed_workers": changed_workers,
+            "total_seconds": time.perf_counter() - start,
+            "shared_seconds": shared_seconds,
+            "genre_seconds": genre_seconds,
+        }
+        CACHE_REBUILD_SECONDS.observe(self.last_rebuild["total_seconds"], mode)
+        logger.info(f"Cache {mode} rebuild of {len(genres)} genres in {self.last_rebuild['total_seconds']:.3f}s")
+        self._mark_dirty()
+        self.flush()
+        return len(genres)
+
+    def get_cached_recommendations(self, genre: str) -> Optional[RecommendationResponse]:
+        """Get cached recommendations for a genre (default query parameters)."""
+        return self.get(genre)
+
+    def is_cache_fresh(self, hours: Optional[float] = None) -> bool:
+        """Check if the last full rebuild happened within the given hours (the TTL by default)."""
         if not self.last_updated:
             return False
+        max_age = timedelta(hours=hours) if hours is not None else timedelta(seconds=self.ttl_seconds)
         try:
             last_updated = datetime.fromisoformat(self.last_updated)
-            return datetime.now() - last_updated < timedelta(hours=hours)
-        except:
+            return datetime.now() - last_updated < max_age
+        except ValueError:
             return False
 
 # Create a global cache instance
-recommendation_cache = RecommendationCache()
\ No newline at end of file
+recommendation_cache = RecommendationCache()
+
+rating_ingestor.add_listener(recommendation_cache.on_ratings_update)
+
+# Read at scrape time, so lookups pay nothing extra
+registry.register_callback(
+    "recommendation_cache_events_total", "Recommendation cache lookups and evictions", "counter",
+    lambda: [({"event": "hit"}, recommendation_cache.hits), ({"event": "miss"}, recommendation_cache.misses),
+             ({"event": "eviction"}, recommendation_cache.evictions)])
+registry.register_callback(
+    "recommendation_cache_entries", "Entries in the recommendation cache", "gauge",
+    lambda: [({}, len(recommendation_cache))])
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, List, Optional
+import pandas as pd
+from config import FINAL_FILE, CATALOG_CHECK_SECONDS
+from data_processing import load_final_data, build_genre_index
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(filename: str) -> str:
+    with open(filename, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """The worker table with everything /genres, the cache rebuild and scoring need, computed once."""
+    workers: pd.DataFrame = field(repr=False)
+    genres: list  # Sorted raw genre tokens, as get_all_genres returns them
+    counts: dict  # Raw genre token -> number of workers in it
+    genre_index: dict = field(repr=False)  # Normalized genre -> worker row positions (the engine's genre index)
+    genres_json: bytes = field(repr=False)
+    genres_with_counts_json: bytes = field(repr=False)
+    digest: str
+    loaded_at: datetime = field(default_factory=datetime.now)
+
+    @classmethod
+    def build(cls, workers: pd.DataFrame, digest: str) -> "CatalogSnapshot":
+        members = {}
+        for position, tokens in enumerate(workers['genres'].str.split('|')):
+            if isinstance(tokens, list):
+                for genre in tokens:
+                    members.setdefault(genre, set()).add(position)
+        genres = sorted(members)
+        counts = {genre: len(members[genre]) for genre in genres}
+        return cls(
+            workers=workers,
+            genres=genres,
+            counts=counts,
+            genre_index=build_genre_index(workers),
+            genres_json=json.dumps(genres).encode(),
+            genres_with_counts_json=json.dumps([{"genre": genre, "workers": counts[genre]} for genre in genres]).encode(),
+            digest=digest,
+        )
+
+
+class CatalogService:
+    """Loads the worker catalog once and reloads it only when the file really changes.
+
+    A check stats the file; a new size or mtime triggers a content hash, and
+    only a new hash rebuilds the snapshot. Readers get an immutable snapshot,
+    swapped by reference. Once start() has run, a background thread checks
+    every check_interval seconds and current() never touches the disk;
+    without it, current() checks at most once per check_interval.
+
+    Listeners are called with (previous, new) after every reload, the first
+    load included (previous is None then). The serving models take their
+    worker table from here (see recommendations.serve_catalog).
+    """
+
+    def __init__(self, filename: str = FINAL_FILE, check_interval: float = CATALOG_CHECK_SECONDS):
+        self.filename = filename
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Optional[CatalogSnapshot], CatalogSnapshot], None]] = []
+        self._snapshot = None
+        self._stat = None
+        self._checked_at = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _file_stat(self):
+        stat = os.stat(self.filename)
+        return stat.st_size, stat.st_mtime_ns
+
+    def add_listener(self, callback: Callable[[Optional[CatalogSnapshot], CatalogSnapshot], None]):
+        """Register a callback run after every reload (e.g. swapping the serving worker table).
+
+        A catalog loaded before the callback was registered is passed to it right away.
+        """
+        with self._lock:
+            self._listeners.append(callback)
+            snapshot = self._snapshot
+        if snapshot is not None:
+            callback(None, snapshot)
+
+    def current(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and (self._thread is not None
+                                     or time.monotonic() - self._checked_at < self.check_interval):
+            return snapshot
+        return self.refresh()
+
+    def refresh(self) -> CatalogSnapshot:
+        """Check the file now and reload it if it changed; returns the current snapshot."""
+        with self._lock:
+            previous = self._snapshot
+            self._refresh()
+            snapshot = self._snapshot
+        if snapshot is not previous:
+            for callback in self._listeners:
+                try:
+                    callback(previous, snapshot)
+                except Exception as e:
+                    logger.error(f"Error in catalog listener: {e}")
+        return snapshot
+
+    def _refresh(self):
+        self._checked_at = time.monotonic()
+        stat = self._file_stat()
+        if self._snapshot is not None and stat == self._stat:
+            return
+        digest = file_digest(self.filename)
+        self._stat = stat
+        if self._snapshot is not None and digest == self._snapshot.digest:
+            logger.info("Catalog file touched but unchanged")
+            return
+        self._snapshot = CatalogSnapshot.build(load_final_data(), digest)
+        self.reloads += 1
+        logger.info(f"Catalog loaded: {len(self._snapshot.workers)} workers, {len(self._snapshot.genres)} genres")
+
+    def start(self) -> CatalogSnapshot:
+        """Load the catalog, then keep checking it from a background thread (request paths do no I/O)."""
+        snapshot = self.refresh()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-refresh", daemon=True)
+            self._thread.start()
+        return snapshot
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error checking the catalog file: {e}")
+
+    def genres(self) -> list:
+        return self.current().genres
+
+
+# Create a global catalog instance
+catalog_service = CatalogService()
@@ -0,0 +1,149 @@
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+from config import RATINGS_FILE, FINAL_FILE, FINGERPRINTS_FILE
+from data_processing import load_ratings_data, load_final_data
+
+logger = logging.getLogger(__name__)
+
+# source name -> (file, loader, columns that define a worker's data)
+SOURCES = {
+    "ratings": (RATINGS_FILE, load_ratings_data, ["workerId", "userId", "rating"]),
+    "workers": (FINAL_FILE, load_final_data, ["workerId", "names", "genres"]),
+}
+# Its fingerprint also records every worker's genres, so a refresh knows the genres a worker left
+GENRES_SOURCE = "workers"
+
+
+def worker_digests(df: pd.DataFrame, columns) -> tuple[np.ndarray, np.ndarray]:
+    """Return (sorted workerIds, uint64 digest per worker), independent of row order."""
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy(dtype=np.uint64)
+    ids = df['workerId'].to_numpy(dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    ids, hashes = ids[order], hashes[order]
+    unique_ids, starts = np.unique(ids, return_index=True)
+    if not len(unique_ids):
+        return unique_ids, np.array([], dtype=np.uint64)
+    # Summing row hashes (wrapping) makes the digest order-independent
+    return unique_ids, np.add.reduceat(hashes, starts)
+
+def changed_ids(old_ids, old_digests, new_ids, new_digests) -> np.ndarray:
+    """Return the workerIds that were added, removed or whose digest differs."""
+    common, old_pos, new_pos = np.intersect1d(old_ids, new_ids, assume_unique=True, return_indices=True)
+    modified = common[old_digests[old_pos] != new_digests[new_pos]]
+    added = np.setdiff1d(new_ids, old_ids, assume_unique=True)
+    removed = np.setdiff1d(old_ids, new_ids, assume_unique=True)
+    return np.union1d(modified, np.union1d(added, removed))
+
+def genre_memberships(df: pd.DataFrame) -> dict:
+    """Return the (workerId, genre) pairs of a worker table, genres coded against a vocabulary."""
+    pairs = df[['workerId']].assign(genre=df['genres'].str.split('|')).explode('genre').dropna()
+    codes, names = pd.factorize(pairs['genre'])
+    return {
+        "genre_names": np.asarray(names, dtype=str),
+        "genre_ids": pairs['workerId'].to_numpy(dtype=np.int64),
+        "genre_codes": codes.astype(np.int32),
+    }
+
+
+@dataclass
+class ChangeScan:
+    """Result of comparing the data files against the last committed fingerprints."""
+    changed_worker_ids: np.ndarray
+    fingerprints: dict = field(repr=False)
+    has_baseline: bool = True
+    workers_df: pd.DataFrame = field(default=None, repr=False)  # Set when the workers file was re-read
+    changed: dict = field(default_factory=dict)  # Source name -> workerIds changed in that source
+    previous: dict = field(default_factory=dict, repr=False)  # The committed fingerprints scanned against
+
+    @property
+    def has_changes(self) -> bool:
+        return not self.has_baseline or len(self.changed_worker_ids) > 0
+
+    def changed_in(self, name: str) -> np.ndarray:
+        return self.changed.get(name, np.array([], dtype=np.int64))
+
+    def previous_genres(self, worker_ids) -> set:
+        """Genres the given workers belonged to at the last commit."""
+        fingerprint = self.previous.get(GENRES_SOURCE)
+        if fingerprint is None or "genre_ids" not in fingerprint:
+            return set()
+        codes = fingerprint["genre_codes"][np.isin(fingerprint["genre_ids"], worker_ids)]
+        return set(fingerprint["genre_names"][np.unique(codes)].tolist())
+
+
+class ChangeTracker:
+    """Tracks which workers' ratings or catalog rows changed since the last cache build.
+
+    Per-source file stats (size, mtime) are checked first, so unchanged files are
+    never re-read; changed files are re-read and diffed per worker.
+    """
+
+    def __init__(self, fingerprint_file: str = FINGERPRINTS_FILE, sources: dict = SOURCES):
+        self.fingerprint_file = fingerprint_file
+        self.sources = sources
+
+    def _load_fingerprints(self) -> dict:
+        if not os.path.exists(self.fingerprint_file):
+            return {}
+        fingerprints = {}
+        with np.load(self.fingerprint_file) as data:
+            for name in self.sources:
+                if f"{name}_ids" not in data:
+                    continue
+                prefix = f"{name}_"
+                fingerprint = {key[len(prefix):]: data[key] for key in data.files if key.startswith(prefix)}
+                fingerprint["stat"] = tuple(fingerprint["stat"].tolist())
+                if name == GENRES_SOURCE and "genre_ids" not in fingerprint:
+                    continue  # Written before genres were recorded; treated as no baseline
+                fingerprints[name] = fingerprint
+        return fingerprints
+
+    def scan(self) -> ChangeScan:
+        """Compare every source with its committed fingerprint."""
+        previous = self._load_fingerprints()
+        current, changed, workers_df = {}, {}, None
+        for name, (filename, loader, columns) in self.sources.items():
+            stat = os.stat(filename)
+            file_stat = (stat.st_size, stat.st_mtime_ns)
+            if name in previous and previous[name]["stat"] == file_stat:
+                current[name] = previous[name]
+                continue
+            df = loader()
+            if name == "workers":
+                workers_df = df
+            ids, digests = worker_digests(df, columns)
+            current[name] = {"stat": file_stat, "ids": ids, "digests": digests}
+            if name == GENRES_SOURCE:
+                current[name].update(genre_memberships(df))
+            if name in previous:
+                changed[name] = changed_ids(previous[name]["ids"], previous[name]["digests"], ids, digests)
+
+        changed_worker_ids = (np.unique(np.concatenate(list(changed.values()))) if changed
+                              else np.array([], dtype=np.int64))
+        has_baseline = all(name in previous for name in self.sources)
+        return ChangeScan(changed_worker_ids, current, has_baseline=has_baseline, workers_df=workers_df,
+                          changed=changed, previous=previous)
+
+    def commit(self, scan: ChangeScan, sources: Optional[Iterable[str]] = None):
+        """Persist a scan's fingerprints as the new baseline (atomically).
+
+        With sources, only those are advanced; the others keep their committed
+        fingerprint, so their changes are reported again by the next scan.
+        """
+        sources = set(self.sources if sources is None else sources)
+        fingerprints = {name: scan.fingerprints[name] if name in sources else scan.previous.get(name)
+                        for name in self.sources}
+        arrays = {}
+        for name, fingerprint in fingerprints.items():
+            if fingerprint is None:
+                continue
+            for key, value in fingerprint.items():
+                arrays[f"{name}_{key}"] = np.array(value, dtype=np.int64) if key == "stat" else value
+        tmp_file = f"{self.fingerprint_file}.tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_file, self.fingerprint_file)
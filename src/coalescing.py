@@ -0,0 +1,80 @@
+import logging
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Callable, Hashable
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Every live SingleFlight, for the metrics endpoint
+_flights = weakref.WeakSet()
+
+
+class SingleFlight:
+    """Coalesces concurrent computations of the same key into one.
+
+    The first caller for a key (the leader) starts the work; everyone arriving
+    while it is in flight gets the leader's Future instead of starting their own.
+    The key is forgotten as soon as the work finishes, so later calls recompute.
+    Thread-safe; async callers can await the Future with asyncio.wrap_future.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._in_flight: dict[Hashable, Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        _flights.add(self)
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def submit(self, key: Hashable, start: Callable[[], Future]) -> Future:
+        """Return the in-flight Future for key, or call start() to launch the work."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                logger.debug(f"{self.name}: coalesced request for {key!r}")
+                return future
+            future = start()
+            self._in_flight[key] = future
+            self.leaders += 1
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        """Run fn in the calling thread unless the same key is already in flight, then wait for it."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+                logger.debug(f"{self.name}: coalesced request for {key!r}")
+
+        if leader:
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._forget(key, future)
+        return future.result()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._in_flight), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+registry.register_callback(
+    "singleflight_requests_total", "Calls that started a computation (leader) or joined one (coalesced)", "counter",
+    lambda: [sample for flight in list(_flights)
+             for sample in (({"flight": flight.name, "role": "leader"}, flight.leaders),
+                            ({"flight": flight.name, "role": "coalesced"}, flight.coalesced))])
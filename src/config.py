@@ -5,23 +5,87 @@ DATA_FOLDER = os.path.join(os.getcwd(), "data")
 WORKERS_FILE = os.path.join(DATA_FOLDER, "movies_snowflake.csv")
 RATINGS_FILE = os.path.join(DATA_FOLDER, "ratings_snowflake.csv")
 FINAL_FILE = os.path.join(DATA_FOLDER, "movies_updated_final.csv")
+CATALOG_CHECK_SECONDS = 5.0  # How often the in-memory worker catalog checks FINAL_FILE for changes
 
 
 # PKL files
 PKL_FOLDER = os.path.join(os.getcwd(), "pkl_objects")
 SVD_MODEL_FILE = os.path.join(PKL_FOLDER, "svd_model.pkl")
 KNN_MODEL_FILE = os.path.join(PKL_FOLDER, "knn_model.pkl")
-FINAL_DATASET_FILE = os.path.join(PKL_FOLDER, "final_dataset.pkl")
+RATING_MATRIX_FILE = os.path.join(PKL_FOLDER, "rating_matrix.npz")
+NEIGHBOR_TABLE_FILE = os.path.join(PKL_FOLDER, "neighbor_table.npz")
+# Parsed copy of the ratings CSV, reused while the CSV is unchanged
+RATINGS_CACHE_FILE = os.path.join(PKL_FOLDER, "ratings.npz")
+RATINGS_CACHE_ENABLED = True
+RATINGS_CHUNK_ROWS = 50000  # Rows parsed per chunk by the streaming loader
+RATINGS_LOG_FILE = os.path.join(DATA_FOLDER, "ratings_log.csv")  # Ratings ingested online; retraining reads it too
+RATINGS_LOG_POLL_SECONDS = 1.0  # How often the ingestor checks the log for ratings appended by another process
+
+# Scoring pool: live recommendations run in worker threads, off the event loop
+SCORING_MAX_WORKERS = 4
+SCORING_MAX_QUEUE = 32  # Jobs allowed to wait for a worker before requests get a 503
+SCORING_TIMEOUT_SECONDS = 10.0
+
+# gRPC server ("sync" thread pool server, or "aio" for the asyncio server)
+GRPC_SERVER_MODE = "sync"
+GRPC_PORT = 50051
+GRPC_MAX_WORKERS = 10  # Handler threads (sync) or scoring threads (aio)
+GRPC_MAX_CONCURRENT_RPCS = 64  # aio only; calls beyond this get RESOURCE_EXHAUSTED
+GRPC_MAX_RECEIVE_MESSAGE_BYTES = 4 * 1024 * 1024
+GRPC_MAX_SEND_MESSAGE_BYTES = -1  # Unlimited
+GRPC_SHUTDOWN_GRACE_SECONDS = 10.0  # aio only; how long SIGTERM waits for in-flight calls
+GRPC_METRICS_PORT = 9095  # Prometheus /metrics of the gRPC process; None disables it
+
+# Sampling profiler (off until started via POST /profiler/start)
+PROFILER_SAMPLE_INTERVAL_SECONDS = 0.005
+
+# Artifact bundle (memory-mapped .npy arrays exported by models_training)
+ARTIFACTS_FOLDER = os.path.join(os.getcwd(), "artifacts")
+ARTIFACT_VERSIONS_TO_KEEP = 3
+
+# Training jobs: at most one at a time per artifacts folder, across processes
+TRAINING_LOCK_FILE = os.path.join(ARTIFACTS_FOLDER, "training.lock")
+TRAINING_JOB_HISTORY = 20  # Finished jobs kept for status lookups
+# SVD and KNN are fitted in two child processes. "forkserver" forks them from a
+# single-threaded server process with the trainers preloaded (fork is unsafe
+# from the threaded servers, spawn re-imports everything for every job)
+TRAINING_START_METHOD = "forkserver"
 
 # Cache files
 CACHE_FOLDER = os.path.join(os.getcwd(), "cache")
 RECOMMENDATIONS_CACHE_FILE = os.path.join(CACHE_FOLDER, "recommendations_cache.json")
+CACHE_TTL_SECONDS = 12 * 60 * 60  # Per entry
+CACHE_MAX_ENTRIES = 10000  # Least recently used entries are evicted beyond this
+RANKING_CACHE_MAX_ENTRIES = 1000  # Full per-query rankings kept in memory for paging
+CACHE_FLUSH_DELAY_SECONDS = 2.0  # Write-behind debounce for the cache file
+# Per-worker digests of the data files at the last cache build (incremental refresh)
+FINGERPRINTS_FILE = os.path.join(CACHE_FOLDER, "fingerprints.npz")
 
 # KNN & SVD Weights
 WEIGHT_KNN = 0.4
 WEIGHT_SVD = 0.6
 
+# Genre matching: "exact" matches whole genre tokens, "substring" keeps the
+# legacy case-insensitive str.contains behaviour
+GENRE_MATCH_MODE = "exact"
+
+# KNN Configuration
+KNN_NEIGHBORS = 11  # Neighbors kept per worker (the worker itself included)
+# Neighbor backend: "brute" (exact sklearn search, the baseline) or "ivf"
+# (approximate clustered index, see neighbor_index.py)
+KNN_BACKEND = "brute"
+IVF_N_LISTS = None  # Clusters; None means sqrt(number of workers)
+IVF_N_PROBE = 8  # Clusters searched per query; higher is slower and more exact
+IVF_TRAIN_ITERATIONS = 10  # k-means passes when building the index
+
 # SVD Configuration
 RATING_SCALE = (1, 5)
 TEST_SIZE = 0.2  # 20% test split
+SVD_N_FACTORS = 100  # Defaults of surprise's SVD; a training job can override them
+SVD_N_EPOCHS = 20
+# Online fold-in of ingested ratings (the SGD settings match surprise's SVD defaults used for training)
+ONLINE_SGD_EPOCHS = 20
+ONLINE_SGD_LR = 0.005
+ONLINE_SGD_REG = 0.02
+ONLINE_SGD_MAX_RATINGS = 200  # Ratings per user or worker sampled for the fold-in; bounds its latency
 
@@ -1,5 +1,22 @@
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
 import pandas as pd
-from config import WORKERS_FILE, RATINGS_FILE, FINAL_FILE
+from scipy.sparse import csr_matrix
+from worker_index import IdLookup
+from config import (WORKERS_FILE, RATINGS_FILE, FINAL_FILE, RATINGS_CACHE_FILE, RATINGS_CACHE_ENABLED,
+                    RATINGS_CHUNK_ROWS, RATINGS_LOG_FILE)
+
+logger = logging.getLogger(__name__)
+
+# Columns the trainers use and their compact parse dtypes (ids are too large for int32)
+RATINGS_DTYPES = {'userId': np.int64, 'movieId': np.int64, 'rating': np.float32}
+# The ratings log has the ratings CSV's columns but no header, so concurrent appenders never write one twice
+RATINGS_LOG_COLUMNS = ['userId', 'movieId', 'rating', 'timestamp']
 
 def load_raw_workers_data():
     """Loads workers dataset."""
@@ -17,13 +34,236 @@ def load_final_data():
     """Loads final dataset."""
     return pd.read_csv(FINAL_FILE)
 
-def preprocess_data(ratings_df: pd.DataFrame):
-    """Prepares dataset for matrix factorization and KNN."""
-    final_dataset = ratings_df.pivot(index="workerId", columns="userId", values="rating")
-    final_dataset.fillna(0, inplace=True)
-    final_dataset.reset_index(inplace=True)  # 🔥 Add this line
+@dataclass
+class RatingMatrix:
+    """Sparse workers x users rating matrix with the ids behind its rows and columns."""
+    matrix: csr_matrix
+    worker_ids: np.ndarray  # row -> workerId, sorted (ids ingested online are appended after them)
+    user_ids: np.ndarray  # column -> userId, sorted (same)
+
+    def with_ratings(self, worker_ids, user_ids, ratings):
+        """Return (a copy with the given ratings set, the rows they changed).
+
+        A rating replaces the pair's previous one, and the last of duplicate
+        pairs wins. Unknown ids get new rows and columns after the existing
+        ones, so every existing row and column keeps its position.
+        """
+        worker_ids = np.asarray(worker_ids, dtype=np.int64)
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        all_worker_ids = np.concatenate([self.worker_ids, np.setdiff1d(worker_ids, self.worker_ids)])
+        all_user_ids = np.concatenate([self.user_ids, np.setdiff1d(user_ids, self.user_ids)])
+        rows = IdLookup(all_worker_ids).positions_for(worker_ids)
+        columns = IdLookup(all_user_ids).positions_for(user_ids)
+
+        existing = self.matrix.tocoo()
+        all_rows = np.concatenate([existing.row, rows])
+        all_columns = np.concatenate([existing.col, columns])
+        all_ratings = np.concatenate([existing.data, np.asarray(ratings, dtype=np.float64)])
+        pairs = all_rows.astype(np.int64) * len(all_user_ids) + all_columns
+        _, last_from_end = np.unique(pairs[::-1], return_index=True)
+        keep = len(pairs) - 1 - last_from_end
+        matrix = csr_matrix((all_ratings[keep], (all_rows[keep], all_columns[keep])),
+                            shape=(len(all_worker_ids), len(all_user_ids)))
+        return RatingMatrix(matrix=matrix, worker_ids=all_worker_ids, user_ids=all_user_ids), np.unique(rows)
+
+    def save(self, filename):
+        """Persist the CSR components and id arrays as an uncompressed .npz archive."""
+        with open(filename, "wb") as f:
+            np.savez(f, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                     shape=np.array(self.matrix.shape), worker_ids=self.worker_ids, user_ids=self.user_ids)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            matrix = csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+            return cls(matrix=matrix, worker_ids=data['worker_ids'], user_ids=data['user_ids'])
+
+def preprocess_data(ratings_df: pd.DataFrame) -> RatingMatrix:
+    """Prepares the sparse rating matrix for KNN without materializing a dense pivot."""
+    ratings_df = ratings_df.drop_duplicates(['workerId', 'userId'], keep='last')
+
+    # Contiguous codes in sorted id order, so rows line up with the old pivot index
+    worker_codes, worker_ids = pd.factorize(ratings_df['workerId'], sort=True)
+    user_codes, user_ids = pd.factorize(ratings_df['userId'], sort=True)
+
+    matrix = csr_matrix(
+        (ratings_df['rating'].to_numpy(dtype=np.float64), (worker_codes, user_codes)),
+        shape=(len(worker_ids), len(user_ids)),
+    )
+    return RatingMatrix(matrix=matrix, worker_ids=np.asarray(worker_ids, dtype=np.int64),
+                        user_ids=np.asarray(user_ids, dtype=np.int64))
+
+@dataclass
+class RatingsData:
+    """Parsed ratings in file order as compact columns.
+
+    Ids are stored once, sorted; each rating row holds int32 codes into them
+    and a float32 rating. The timestamp column is never loaded.
+    """
+    user_codes: np.ndarray  # int32, row -> position in user_ids
+    worker_codes: np.ndarray  # int32, row -> position in worker_ids
+    ratings: np.ndarray  # float32
+    user_ids: np.ndarray  # int64, sorted
+    worker_ids: np.ndarray  # int64, sorted
+    log_bytes: int = 0  # Leading bytes of the ratings log included after the CSV rows
+
+    def __len__(self):
+        return len(self.ratings)
+
+    @classmethod
+    def from_columns(cls, user_ids, worker_ids, ratings) -> "RatingsData":
+        """Encode raw id and rating columns."""
+        unique_users, user_codes = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+        unique_workers, worker_codes = np.unique(np.asarray(worker_ids, dtype=np.int64), return_inverse=True)
+        return cls(user_codes=user_codes.astype(np.int32), worker_codes=worker_codes.astype(np.int32),
+                   ratings=np.asarray(ratings, dtype=np.float32), user_ids=unique_users, worker_ids=unique_workers)
+
+    def concat(self, other: "RatingsData") -> "RatingsData":
+        """Append other's rows after these, re-encoding both onto the union of their ids."""
+        user_ids, user_codes = _encode_chunks([self.user_ids, other.user_ids], [self.user_codes, other.user_codes])
+        worker_ids, worker_codes = _encode_chunks([self.worker_ids, other.worker_ids],
+                                                  [self.worker_codes, other.worker_codes])
+        return RatingsData(user_codes=user_codes, worker_codes=worker_codes,
+                           ratings=np.concatenate([self.ratings, other.ratings]),
+                           user_ids=user_ids, worker_ids=worker_ids, log_bytes=other.log_bytes)
+
+    def last_rows(self) -> np.ndarray:
+        """Rows holding the last rating of each (worker, user) pair, in file order."""
+        pairs = self.worker_codes.astype(np.int64) * len(self.user_ids) + self.user_codes
+        # np.unique keeps the first occurrence, so search the reversed rows
+        _, last_from_end = np.unique(pairs[::-1], return_index=True)
+        return np.sort(len(pairs) - 1 - last_from_end)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Materialize the userId/workerId/rating frame the SVD trainer expects, one row per pair.
 
-    return final_dataset
+        Duplicate pairs keep their last rating, as in to_rating_matrix.
+        """
+        keep = self.last_rows()
+        return pd.DataFrame({
+            'userId': self.user_ids[self.user_codes[keep]],
+            'workerId': self.worker_ids[self.worker_codes[keep]],
+            'rating': self.ratings[keep],
+        })
+
+    def to_rating_matrix(self) -> RatingMatrix:
+        """Build the workers x users CSR matrix, keeping the last rating of duplicate pairs."""
+        keep = self.last_rows()
+        matrix = csr_matrix(
+            (self.ratings[keep].astype(np.float64), (self.worker_codes[keep], self.user_codes[keep])),
+            shape=(len(self.worker_ids), len(self.user_ids)),
+        )
+        return RatingMatrix(matrix=matrix, worker_ids=self.worker_ids, user_ids=self.user_ids)
+
+    def save(self, filename, source_stat=None):
+        """Persist as an uncompressed .npz, tagged with the (size, mtime) of the CSV it came from."""
+        tmp_file = f"{filename}.tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(f, user_codes=self.user_codes, worker_codes=self.worker_codes, ratings=self.ratings,
+                     user_ids=self.user_ids, worker_ids=self.worker_ids, log_bytes=np.int64(self.log_bytes),
+                     source_stat=np.array(source_stat or (-1, -1), dtype=np.int64))
+        os.replace(tmp_file, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """Return (RatingsData, source (size, mtime))."""
+        with np.load(filename) as data:
+            ratings = cls(user_codes=data['user_codes'], worker_codes=data['worker_codes'],
+                          ratings=data['ratings'], user_ids=data['user_ids'], worker_ids=data['worker_ids'],
+                          log_bytes=int(data['log_bytes']) if 'log_bytes' in data else 0)
+            return ratings, tuple(data['source_stat'].tolist())
+
+def _encode_chunks(chunk_ids, chunk_codes):
+    """Remap per-chunk codes onto the sorted union of all chunks' ids."""
+    ids = np.unique(np.concatenate(chunk_ids)) if chunk_ids else np.array([], dtype=np.int64)
+    codes = [np.searchsorted(ids, local_ids)[local_codes].astype(np.int32)
+             for local_ids, local_codes in zip(chunk_ids, chunk_codes)]
+    return ids, np.concatenate(codes) if codes else np.array([], dtype=np.int32)
+
+def stream_ratings(filename: str = RATINGS_FILE, chunksize: int = RATINGS_CHUNK_ROWS) -> RatingsData:
+    """Parse the ratings CSV chunk by chunk into RatingsData.
+
+    Each chunk is factorized right away, so only int32 codes, float32 ratings
+    and the chunk's distinct ids are kept while the rest of the file is read.
+    """
+    user_chunks, user_codes, worker_chunks, worker_codes, ratings = [], [], [], [], []
+    for chunk in pd.read_csv(filename, usecols=list(RATINGS_DTYPES), dtype=RATINGS_DTYPES, chunksize=chunksize):
+        local_users, codes = np.unique(chunk['userId'].to_numpy(), return_inverse=True)
+        user_chunks.append(local_users)
+        user_codes.append(codes.astype(np.int32))
+        local_workers, codes = np.unique(chunk['movieId'].to_numpy(), return_inverse=True)
+        worker_chunks.append(local_workers)
+        worker_codes.append(codes.astype(np.int32))
+        ratings.append(chunk['rating'].to_numpy())
+
+    user_ids, user_codes = _encode_chunks(user_chunks, user_codes)
+    worker_ids, worker_codes = _encode_chunks(worker_chunks, worker_codes)
+    ratings = np.concatenate(ratings) if ratings else np.array([], dtype=np.float32)
+    return RatingsData(user_codes=user_codes, worker_codes=worker_codes, ratings=ratings,
+                       user_ids=user_ids, worker_ids=worker_ids)
+
+def append_ratings_log(user_ids, worker_ids, ratings, timestamps=None, filename: str = RATINGS_LOG_FILE) -> int:
+    """Append ratings to the log in one O_APPEND write and return the log's size after it.
+
+    One write per batch keeps batches from different processes from interleaving.
+    """
+    if timestamps is None:
+        timestamps = np.full(len(ratings), int(time.time()), dtype=np.int64)
+    data = "".join(f"{int(user_id)},{int(worker_id)},{float(rating)},{int(timestamp)}\n"
+                   for user_id, worker_id, rating, timestamp in zip(user_ids, worker_ids, ratings, timestamps))
+    fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data.encode())
+        os.fsync(fd)
+        return os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+def read_ratings_log(start: int = 0, end: Optional[int] = None, filename: str = RATINGS_LOG_FILE) -> RatingsData:
+    """Parse the log's complete lines between two byte offsets; log_bytes is where parsing stopped."""
+    if not os.path.exists(filename):
+        return RatingsData.from_columns([], [], [])
+    with open(filename, "rb") as f:
+        f.seek(start)
+        data = f.read(-1 if end is None else max(end - start, 0))
+    # A line still being appended by another process is left for the next read
+    data = data[:data.rfind(b"\n") + 1]
+    frame = pd.read_csv(io.BytesIO(data), header=None, names=RATINGS_LOG_COLUMNS, usecols=list(RATINGS_DTYPES),
+                        dtype=RATINGS_DTYPES) if data else pd.DataFrame(columns=list(RATINGS_DTYPES))
+    ratings = RatingsData.from_columns(frame['userId'], frame['movieId'], frame['rating'])
+    ratings.log_bytes = start + len(data)
+    return ratings
+
+def load_ratings(use_cache: bool = RATINGS_CACHE_ENABLED, filename: str = RATINGS_FILE,
+                 cache_file: str = RATINGS_CACHE_FILE, log_file: str = RATINGS_LOG_FILE) -> RatingsData:
+    """Load the ratings once for both trainers, from the binary cache while the inputs are unchanged.
+
+    Ratings ingested online (the log) come after the CSV's, so they win over
+    older ratings of the same pair once to_frame or to_rating_matrix drops the
+    duplicates.
+    """
+    stat = os.stat(filename)
+    # The log is append-only, so its size identifies its content
+    log_bytes = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+    source_stat = (stat.st_size, stat.st_mtime_ns, log_bytes)
+    if use_cache and os.path.exists(cache_file):
+        try:
+            ratings, cached_stat = RatingsData.load(cache_file)
+            if cached_stat == source_stat:
+                logger.info(f"Loaded {len(ratings)} ratings from {cache_file}")
+                return ratings
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable ratings cache: {e}")
+
+    ratings = stream_ratings(filename)
+    logger.info(f"Parsed {len(ratings)} ratings from {filename}")
+    if log_bytes:
+        log = read_ratings_log(0, log_bytes, log_file)
+        ratings = ratings.concat(log)
+        logger.info(f"Added {len(log)} ratings from {log_file}")
+    if use_cache:
+        ratings.save(cache_file, source_stat)
+    return ratings
 
 def get_all_genres() -> list[str]:
     """Get all unique genres from the dataset."""
@@ -35,6 +275,20 @@ def get_all_genres() -> list[str]:
             all_genres.update(genres)
     return sorted(all_genres)
 
+def normalize_genre(genre: str) -> str:
+    """Normalize a genre token for index lookups."""
+    return genre.strip().lower()
+
+def build_genre_index(workers_df: pd.DataFrame) -> dict[str, np.ndarray]:
+    """Map each normalized genre to the sorted row positions of its workers."""
+    members = {}
+    # Split genres the same way get_all_genres does
+    for position, genres in enumerate(workers_df['genres'].str.split('|')):
+        if isinstance(genres, list):
+            for genre in genres:
+                members.setdefault(normalize_genre(genre), set()).add(position)
+    return {genre: np.array(sorted(rows), dtype=np.int64) for genre, rows in members.items()}
+
 if __name__ == '__main__':
     #print(load_ratings_data().head())
     print(get_all_genres())
\ No newline at end of file
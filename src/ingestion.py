@@ -0,0 +1,152 @@
+"""Online rating ingestion.
+
+Rating events are appended to the ratings log (RATINGS_LOG_FILE) and folded
+into the serving models within the request: the rating matrix, the neighbor
+table rows they touch and the SVD factors of the users and workers involved
+are updated without retraining (HybridRecommender.with_ratings), and the
+result is swapped in as a new snapshot.
+
+The log is the source of truth. A snapshot records how much of it its models
+include, and catching up applies whatever lies past that offset: ratings
+from this process, from another process sharing the file (the REST and gRPC
+servers; found by polling the log's size every RATINGS_LOG_POLL_SECONDS),
+and, after a retrain is swapped in or at startup, ratings the new models were
+not trained on. Scheduled retrains read the log too.
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+import numpy as np
+from data_processing import append_ratings_log, read_ratings_log
+from model_registry import ModelRegistry, ModelSnapshot
+from recommendations import model_registry
+from config import RATINGS_LOG_FILE, RATINGS_LOG_POLL_SECONDS, RATING_SCALE
+
+logger = logging.getLogger(__name__)
+
+VERSION_SEPARATOR = "+log"
+
+
+@dataclass(frozen=True)
+class RatingUpdate:
+    """What one catch-up changed."""
+    snapshot: ModelSnapshot  # The snapshot now serving, with the ratings folded in
+    ratings: int
+    user_ids: np.ndarray
+    worker_ids: np.ndarray  # Workers whose recommendations may have changed
+    seconds: float
+
+
+class RatingIngestor:
+    """Appends rating events to the log and folds them into the serving snapshot.
+
+    Updates are serialized; each one builds a new snapshot from the current
+    one, so requests in flight finish on the models they started with.
+    """
+
+    def __init__(self, registry: ModelRegistry = model_registry, log_file: str = RATINGS_LOG_FILE,
+                 poll_interval: float = RATINGS_LOG_POLL_SECONDS):
+        self.registry = registry
+        self.log_file = log_file
+        self.poll_interval = poll_interval
+        self.updates = 0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[RatingUpdate], None]] = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def add_listener(self, callback: Callable[[RatingUpdate], None]):
+        """Register a callback run after every update (e.g. cache invalidation)."""
+        self._listeners.append(callback)
+
+    def start(self) -> Optional[RatingUpdate]:
+        """Fold in the log tail the loaded models lack, and do so again after every reload.
+
+        Called once at server startup, after the other registry listeners are
+        registered, so a reload has been fully handled before its catch-up.
+        A background thread then polls the log for other processes' ratings.
+        """
+        if self._thread is None:
+            self.registry.add_listener(lambda snapshot: self.catch_up())
+            self._thread = threading.Thread(target=self._run, name="ratings-log-poll", daemon=True)
+            self._thread.start()
+        return self.catch_up()
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self) -> Optional[RatingUpdate]:
+        """Catch up if the log grew past what the serving snapshot includes (a stat when it did not)."""
+        try:
+            size = os.path.getsize(self.log_file)
+        except FileNotFoundError:
+            return None
+        if size <= self.registry.current().ratings_log_bytes:
+            return None
+        return self.catch_up()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error polling the ratings log: {e}")
+
+    def ingest(self, user_ids, worker_ids, ratings, timestamps=None) -> Optional[RatingUpdate]:
+        """Validate and log rating events, then fold them (and any other pending ones) in."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        worker_ids = np.asarray(worker_ids, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        if not (len(user_ids) == len(worker_ids) == len(ratings)):
+            raise ValueError("user_ids, worker_ids and ratings must have the same length")
+        lower_bound, higher_bound = RATING_SCALE
+        if ((ratings < lower_bound) | (ratings > higher_bound) | np.isnan(ratings)).any():
+            raise ValueError(f"Ratings must be between {lower_bound} and {higher_bound}")
+        if not len(ratings):
+            return None
+        with self._lock:
+            append_ratings_log(user_ids, worker_ids, ratings, timestamps, filename=self.log_file)
+            return self._catch_up()
+
+    def catch_up(self) -> Optional[RatingUpdate]:
+        """Fold in the log entries the serving snapshot does not include yet."""
+        with self._lock:
+            return self._catch_up()
+
+    def _catch_up(self) -> Optional[RatingUpdate]:
+        while True:
+            start = time.perf_counter()
+            snapshot = self.registry.current()
+            pending = read_ratings_log(snapshot.ratings_log_bytes, filename=self.log_file)
+            if not len(pending):
+                return None
+            user_ids = pending.user_ids[pending.user_codes]
+            worker_ids = pending.worker_ids[pending.worker_codes]
+            recommender, affected = snapshot.recommender.with_ratings(user_ids, worker_ids, pending.ratings)
+
+            base_version = snapshot.version.split(VERSION_SEPARATOR)[0]
+            updated = ModelSnapshot(version=f"{base_version}{VERSION_SEPARATOR}{pending.log_bytes}",
+                                    recommender=recommender, ratings_log_bytes=pending.log_bytes)
+            if self.registry.replace(snapshot, updated):
+                break
+            # A retrained version was swapped in meanwhile; fold into that one instead
+            logger.info("Models reloaded during a rating update, retrying on the new version")
+
+        self.updates += 1
+        update = RatingUpdate(snapshot=updated, ratings=len(pending), user_ids=np.unique(user_ids),
+                              worker_ids=affected, seconds=time.perf_counter() - start)
+        logger.info(f"Folded in {update.ratings} ratings in {update.seconds:.3f}s "
+                    f"({len(update.worker_ids)} workers affected)")
+        for callback in self._listeners:
+            try:
+                callback(update)
+            except Exception as e:
+                logger.error(f"Error in rating update listener: {e}")
+        return update
+
+
+# Create a global ingestor; servers call start() once they are set up
+rating_ingestor = RatingIngestor()
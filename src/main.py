@@ -1,19 +1,47 @@
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Response
 from cache_service import recommendation_cache
-from data_processing import get_all_genres as get_all_genres_data
-from recommendations import get_top_workers_by_genre
-from schemas import RecommendationResponse, TrainingResponse, CacheStatusResponse
-from typing import List
-from models_training import train_svd, train_knn
+from catalog import catalog_service
+from recommendations import model_registry, to_recommendation_response, GenreFilter, GenreSpec, canonical_genre
+from schemas import (RecommendationResponse, TrainingResponse, CacheStatusResponse, GenreCount,
+                     RatingIngestRequest, RatingIngestResponse, TrainingJobResponse, TrainingJobStatus)
+from typing import List, Literal, Optional, Union
+from training_jobs import TrainingJobManager, TrainingJob, TrainingConflict
+from ingestion import rating_ingestor
+from scoring_pool import ScoringPool, PoolOverloaded
+from coalescing import SingleFlight
 import logging
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Query
+from config import WEIGHT_KNN, WEIGHT_SVD
+from metrics import registry, profiler, REQUESTS, CONTENT_TYPE
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Live scoring runs here so cache hits, /genres and /cache-status stay responsive
+scoring_pool = ScoringPool()
+# Concurrent misses for the same genre share a single computation
+recommendation_flights = SingleFlight("recommendations")
+# One training job at a time; repeated triggers join the running one
+training_jobs = TrainingJobManager(model_registry)
+registry.register_callback("scoring_pool_in_flight", "Scoring jobs running or queued", "gauge",
+                           lambda: [({}, scoring_pool.in_flight)])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the catalog and keep checking it off the request path (its reloads reach the serving models)
+    await asyncio.to_thread(catalog_service.start)
+    # Fold in ratings logged after the serving models were trained
+    await asyncio.to_thread(rating_ingestor.start)
+    yield
+    catalog_service.stop()
+    rating_ingestor.stop()
+    scoring_pool.shutdown(wait=False)
+    recommendation_cache.flush()
+
+app = FastAPI(lifespan=lifespan)
 # Set up CORS
 app.add_middleware(
     CORSMiddleware,
@@ -26,52 +54,98 @@ app.add_middleware(
 
 @app.get("/recommendations", response_model=RecommendationResponse)
 async def get_recommendations(
-    genre_name: str = Query(..., description="Genre to get recommendations for"),
+    genre_name: List[str] = Query(..., description="Genre to get recommendations for; repeat for several genres"),
+    match: Literal["any", "all"] = Query("any", description="With several genres: workers in any of them (OR) "
+                                                            "or in all of them (AND)"),
+    user_id: int = Query(1, description="User to personalize the SVD part of the score for"),
+    weight_knn: float = Query(WEIGHT_KNN, description="Weight of the KNN similarity part of the score"),
+    weight_svd: float = Query(WEIGHT_SVD, description="Weight of the SVD rating part of the score"),
+    top_n: int = Query(8, ge=0, description="Number of workers to return"),
+    offset: int = Query(0, ge=0, description="Rank of the first worker to return, for paging"),
+    limit: Optional[int] = Query(None, ge=0, description="Page size; overrides top_n"),
     use_cache: bool = Query(True, description="Whether to use cached results")
 ):
-    """Get worker recommendations for a specific genre."""
-    logger.info(f"Received recommendation request for genre: {genre_name}")
+    """Get worker recommendations for one or more genres, optionally one page of the full ranking."""
+    limit = top_n if limit is None else limit
+    genre = genre_name[0] if len(genre_name) == 1 else GenreFilter.of(genre_name, match)
+    weights = {"weight_knn": weight_knn, "weight_svd": weight_svd}
+    logger.info(f"Received recommendation request for genre: {genre}, user: {user_id}, "
+                f"offset: {offset}, limit: {limit}")
     
-    if use_cache and recommendation_cache.is_cache_fresh():
-        cached = recommendation_cache.get_cached_recommendations(genre_name)
+    if use_cache:
+        cached = recommendation_cache.get_page(genre, offset, limit, user_id=user_id, **weights)
         if cached:
             logger.info("Returning cached results")
+            REQUESTS.inc("cache")
             return cached
     
-    # Fall back to live generation
+    # Fall back to live generation, joining an identical computation if one is running
     logger.info("Generating fresh recommendations")
-    result = get_top_workers_by_genre(genre_name)
-    
-    # Update cache if needed
-    if use_cache:
-        recommendation_cache.cache_data[genre_name] = result.model_dump()
-        recommendation_cache._save_cache()
-    
-    return result
+    try:
+        future = recommendation_flights.submit(
+            (canonical_genre(genre), user_id, offset, limit, weight_knn, weight_svd, use_cache),
+            lambda: scoring_pool.submit(compute_recommendations, genre, user_id, offset, limit, use_cache, weights),
+        )
+        # Shielded: a caller timing out must not cancel the work other callers wait on
+        result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), scoring_pool.timeout)
+        REQUESTS.inc("computed")
+        return result
+    except PoolOverloaded:
+        REQUESTS.inc("overloaded")
+        logger.warning(f"Scoring pool full, rejecting request for genre: {genre}")
+        raise HTTPException(status_code=503, detail="Too many recommendation requests in progress, retry later")
+    except asyncio.TimeoutError:
+        REQUESTS.inc("timeout")
+        logger.warning(f"Scoring timed out for genre: {genre}")
+        raise HTTPException(status_code=504, detail="Generating recommendations timed out")
 
-@app.get("/genres", response_model=List[str])
-async def get_all_genres():
-    """Get all available genres."""
-    return get_all_genres_data()
+def compute_recommendations(genre: GenreSpec, user_id: int, offset: int, limit: int,
+                            use_cache: bool, weights: dict) -> RecommendationResponse:
+    """Score a genre query and update the cache (runs once per coalesced group, in the scoring pool)."""
+    snapshot = model_registry.current()
+    recommender = snapshot.recommender
+    if not use_cache:
+        # Only the requested page is needed, so select just the top offset + limit
+        result = recommender.recommend(genre, user_id, top_n=offset + limit, **weights)
+        return to_recommendation_response(result.page(offset, limit))
+    # Cache the full ranking, so the following pages are slices of it
+    ranking = recommender.rank_genre(genre, user_id, **weights)
+    recommendation_cache.put_ranking(genre, ranking, snapshot, user_id=user_id, **weights)
+    return to_recommendation_response(recommender.page(ranking, offset, limit))
+
+@app.get("/genres", response_model=Union[List[str], List[GenreCount]])
+async def get_all_genres(
+    with_counts: bool = Query(False, description="Return each genre with its number of workers")
+):
+    """Get all available genres (served pre-serialized from the in-memory catalog)."""
+    catalog = catalog_service.current()
+    body = catalog.genres_with_counts_json if with_counts else catalog.genres_json
+    return Response(content=body, media_type="application/json")
 
 @app.post("/update-cache", response_model=TrainingResponse)
-async def update_cache(background_tasks: BackgroundTasks):
+async def update_cache(
+    background_tasks: BackgroundTasks,
+    full: bool = Query(True, description="Recompute every genre instead of only those affected by changed data")
+):
     """
     Trigger cache update in the background.
     Call this endpoint manually when you want to refresh the cache.
     """
-    logger.info("Manual cache update triggered via API")
-    background_tasks.add_task(update_all_recommendations)
+    logger.info(f"Manual {'full' if full else 'incremental'} cache update triggered via API")
+    background_tasks.add_task(update_all_recommendations, full)
     return TrainingResponse(
         message="Cache update started in background",
         status="started"
     )
 
-async def update_all_recommendations():
-    """Function to update all recommendations in the cache."""
+def update_all_recommendations(full: bool = True):
+    """Function to update recommendations in the cache (runs in a worker thread)."""
     try:
         logger.info("Running manual cache update")
-        count = recommendation_cache.update_all_recommendations()
+        if full:
+            count = recommendation_cache.update_all_recommendations()
+        else:
+            count = recommendation_cache.refresh_changed()
         logger.info(f"Cache updated with {count} genres")
         return True
     except Exception as e:
@@ -81,38 +155,114 @@ async def update_all_recommendations():
 @app.get("/cache-status", response_model=CacheStatusResponse)
 async def get_cache_status():
     """Get information about the cache state."""
+    last_rebuild = recommendation_cache.last_rebuild
     return {
         "last_updated": datetime.fromisoformat(recommendation_cache.last_updated) if recommendation_cache.last_updated else None,
-        "genres_cached": len(recommendation_cache.cache_data),
+        "genres_cached": len(recommendation_cache),
         "is_fresh": recommendation_cache.is_cache_fresh(),
+        "coalesced_requests": recommendation_flights.coalesced,
+        "last_rebuild_mode": last_rebuild["mode"] if last_rebuild else None,
+        "rebuild_changed_workers": last_rebuild["changed_workers"] if last_rebuild else None,
+        "last_rebuild_seconds": last_rebuild["total_seconds"] if last_rebuild else None,
+        "rebuild_shared_seconds": last_rebuild["shared_seconds"] if last_rebuild else None,
+        "rebuild_genre_seconds": last_rebuild["genre_seconds"] if last_rebuild else {},
         "message": "Call POST /update-cache to refresh recommendations"
     }
 
-@app.post("/train-models", response_model=TrainingResponse)
-async def train_models(background_tasks: BackgroundTasks):
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of the pipeline, cache and training metrics."""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+@app.post("/profiler/start", response_model=TrainingResponse)
+async def start_profiler(
+    interval: Optional[float] = Query(None, gt=0, description="Seconds between stack samples")
+):
+    """Start the sampling profiler (clears earlier samples)."""
+    started = profiler.start(interval)
+    return TrainingResponse(message=f"Sampling every {profiler.interval}s",
+                            status="started" if started else "already running")
+
+@app.post("/profiler/stop", response_model=TrainingResponse)
+async def stop_profiler():
+    """Stop the sampling profiler; the samples stay available at GET /profiler."""
+    profiler.stop()
+    return TrainingResponse(message=f"{profiler.samples} samples collected", status="stopped")
+
+@app.get("/profiler")
+async def get_profile():
+    """Collapsed stacks ("frame;frame;frame count") collected by the profiler, flamegraph-ready."""
+    return Response(content=profiler.collapsed(), media_type="text/plain")
+
+@app.post("/ratings", response_model=RatingIngestResponse)
+async def ingest_ratings(request: RatingIngestRequest):
+    """Log rating events and fold them into the serving models, without retraining."""
+    events = request.ratings
+    logger.info(f"Received {len(events)} ratings")
+    now = int(datetime.now().timestamp())
+    update = await asyncio.to_thread(
+        rating_ingestor.ingest,
+        [event.userId for event in events], [event.workerId for event in events],
+        [event.rating for event in events], [event.timestamp or now for event in events],
+    )
+    if update is None:
+        return RatingIngestResponse(ingested=0, model_version=model_registry.version, affected_workers=0, seconds=0.0)
+    return RatingIngestResponse(ingested=update.ratings, model_version=update.snapshot.version,
+                                affected_workers=len(update.worker_ids), seconds=update.seconds)
+
+def job_status(job: TrainingJob) -> TrainingJobStatus:
+    return TrainingJobStatus(
+        job_id=job.job_id, state=job.state, stage=job.stage, progress=job.progress, tasks=dict(job.tasks),
+        n_factors=job.n_factors, n_epochs=job.n_epochs, triggers=job.triggers, started_at=job.started_at,
+        finished_at=job.finished_at, duration_seconds=job.duration_seconds, version=job.version, error=job.error,
+    )
+
+@app.post("/train-models", response_model=TrainingJobResponse)
+async def train_models(
+    n_factors: Optional[int] = Query(None, ge=1, description="SVD latent factors (default SVD_N_FACTORS)"),
+    n_epochs: Optional[int] = Query(None, ge=1, description="SVD training epochs (default SVD_N_EPOCHS)"),
+):
     """
     Trigger background model training.
-    
+
+    Starts a training job unless one is running, in which case the trigger
+    joins it (409 if it asks for different overrides).
+
     Returns:
-        TrainingResponse: Status message about the training process
+        TrainingJobResponse: Status message and the job the trigger started or joined
     """
     logger.info("Training triggered via API...")
-    
-    # Run training in background
-    background_tasks.add_task(run_training)
-    
-    return TrainingResponse(
-        message="Model training started in background",
-        status="started"
+    try:
+        job, merged = training_jobs.submit(n_factors, n_epochs)
+    except TrainingConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return TrainingJobResponse(
+        message=f"Joined running training job {job.job_id}" if merged else "Model training started in background",
+        status="merged" if merged else "started",
+        job=job_status(job),
     )
 
-def run_training():
-    """Run both models in sequence (background task)."""
-    try:
-        logger.info("Starting model training...")
-        train_svd()
-        train_knn()
-        logger.info("Model training completed successfully!")
-    except Exception as e:
-        logger.error(f"Error during training: {e}")
-        raise
\ No newline at end of file
+@app.get("/train-models", response_model=TrainingJobStatus)
+async def get_training_status():
+    """Status of the running training job, or else of the latest one."""
+    job = training_jobs.get()
+    if job is None:
+        raise HTTPException(status_code=404, detail="No training job has run yet")
+    return job_status(job)
+
+@app.get("/train-models/{job_id}", response_model=TrainingJobStatus)
+async def get_training_job(job_id: str):
+    """Status of a training job: stage, progress and duration."""
+    job = training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown training job {job_id}")
+    return job_status(job)
+
+@app.post("/train-models/{job_id}/cancel", response_model=TrainingJobStatus)
+async def cancel_training_job(job_id: str):
+    """Cancel a training job; it stops (killing its trainers) unless its models are already published."""
+    job = training_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown training job {job_id}")
+    return job_status(job)
\ No newline at end of file
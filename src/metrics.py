@@ -0,0 +1,331 @@
+"""Lightweight in-process metrics with Prometheus text exposition.
+
+Counters and histograms are plain Python objects updated under a lock (a few
+hundred nanoseconds per observation), cheap enough to leave on in the hot
+path. Values that other components already count (cache hits, coalesced
+requests) are read through callbacks at scrape time instead. An optional
+sampling profiler can be switched on and off at runtime.
+"""
+import asyncio
+import inspect
+import logging
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Tuple
+from config import PROFILER_SAMPLE_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Seconds; tuned for stages from microseconds (ranking) to minutes (training)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, 300.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations (or any values) with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_label = f'le="{le}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, bucket_label)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {series[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}"
+
+
+class Registry:
+    """Collects metrics and scrape-time callbacks and renders the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._callbacks = []
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_callback(self, name: str, help_text: str, metric_type: str,
+                          collect: Callable[[], Iterable[Tuple[dict, float]]]):
+        """Add a metric whose samples ({label: value}, value) are read from collect() at scrape time."""
+        self._callbacks.append((name, help_text, metric_type, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_text, metric_type, collect in self._callbacks:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            try:
+                for labels, value in collect():
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+            except Exception as e:
+                logger.error(f"Error collecting {name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Recommendation pipeline
+STAGE_SECONDS = registry.histogram(
+    "recommendation_stage_seconds", "Time spent per recommendation pipeline stage", ("stage",))
+TRAINING_SECONDS = registry.histogram(
+    "training_stage_seconds", "Time spent per model training stage", ("stage",))
+TRAINING_RUNS = registry.counter("training_runs_total", "Training runs by outcome", ("outcome",))
+CACHE_REBUILD_SECONDS = registry.histogram(
+    "recommendation_cache_rebuild_seconds", "Cache rebuild duration", ("mode",))
+REQUESTS = registry.counter(
+    "recommendation_requests_total", "REST recommendation requests by where the answer came from", ("source",))
+# gRPC handlers
+GRPC_REQUESTS = registry.counter("grpc_requests_total", "gRPC calls by method and status", ("method", "status"))
+GRPC_SECONDS = registry.histogram("grpc_request_seconds", "gRPC call duration", ("method",))
+
+
+@contextmanager
+def stage(name: str):
+    """Time one recommendation pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, name)
+
+
+def _grpc_status(args, error: BaseException) -> str:
+    """Status name of a failed call: the code set via context.abort, else the error's own code."""
+    for source in (args[-1] if args else None, error):  # Handlers take (self, request, context)
+        code = getattr(source, "code", None)
+        if callable(code):
+            try:
+                code = code()
+            except Exception:
+                code = None
+        if getattr(code, "name", None):
+            return code.name
+    if isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+        return "CANCELLED"
+    return "UNKNOWN"
+
+
+def rpc_metrics(method: str):
+    """Decorate a gRPC handler (sync/async, unary/streaming) to count calls and time them."""
+    def finish(start, status):
+        GRPC_SECONDS.observe(time.perf_counter() - start, method)
+        GRPC_REQUESTS.inc(method, status)
+
+    def decorator(handler):
+        if inspect.isasyncgenfunction(handler):
+            @wraps(handler)
+            async def wrapper(*args, **kwargs):
+                start, status = time.perf_counter(), "OK"
+                try:
+                    async for item in handler(*args, **kwargs):
+                        yield item
+                except BaseException as e:
+                    status = _grpc_status(args, e)
+                    raise
+                finally:
+                    finish(start, status)
+        elif inspect.iscoroutinefunction(handler):
+            @wraps(handler)
+            async def wrapper(*args, **kwargs):
+                start, status = time.perf_counter(), "OK"
+                try:
+                    return await handler(*args, **kwargs)
+                except BaseException as e:
+                    status = _grpc_status(args, e)
+                    raise
+                finally:
+                    finish(start, status)
+        elif inspect.isgeneratorfunction(handler):
+            @wraps(handler)
+            def wrapper(*args, **kwargs):
+                start, status = time.perf_counter(), "OK"
+                try:
+                    yield from handler(*args, **kwargs)
+                except BaseException as e:
+                    status = _grpc_status(args, e)
+                    raise
+                finally:
+                    finish(start, status)
+        else:
+            @wraps(handler)
+            def wrapper(*args, **kwargs):
+                start, status = time.perf_counter(), "OK"
+                try:
+                    return handler(*args, **kwargs)
+                except BaseException as e:
+                    status = _grpc_status(args, e)
+                    raise
+                finally:
+                    finish(start, status)
+        return wrapper
+    return decorator
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval while enabled.
+
+    Off by default and costs nothing then; when on, a daemon thread records
+    collapsed stacks ("outer;inner;leaf count"), the flamegraph input format.
+    """
+
+    def __init__(self, interval: float = PROFILER_SAMPLE_INTERVAL_SECONDS, max_depth: int = 40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks = StackCounter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = None) -> bool:
+        """Start sampling (clearing earlier samples); returns False if it was already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = interval or self.interval
+            self._stacks.clear()
+            self.samples = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:.1f} ms interval)")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    stack = traceback.extract_stack(frame, limit=self.max_depth)
+                    self._stacks[";".join(f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                                          for entry in stack)] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        """Return the collected stacks, most frequent first."""
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common()) + "\n"
+
+
+profiler = SamplingProfiler()
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve registry.render() on http://host:port/metrics from a daemon thread (for non-FastAPI processes)."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics served on port {port}")
+    return server
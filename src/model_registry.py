@@ -0,0 +1,73 @@
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ModelSnapshot:
+    """An immutable set of loaded models, tagged with the artifact version it came from."""
+    version: str
+    recommender: Any
+    loaded_at: datetime = field(default_factory=datetime.now)
+    ratings_log_bytes: int = 0  # How much of the ratings log the models include
+
+
+class ModelRegistry:
+    """Holds the snapshot serving traffic and swaps it atomically after retraining.
+
+    Requests call current() once and keep using that snapshot, so in-flight work
+    finishes on the old models while new requests see the new ones. Swapping is
+    a single reference assignment; the lock only serializes reloads.
+    """
+
+    def __init__(self, loader: Callable[[], ModelSnapshot]):
+        self._loader = loader
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[ModelSnapshot], None]] = []
+        self._snapshot = loader()
+        logger.info(f"Serving model version {self._snapshot.version}")
+
+    def current(self) -> ModelSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> str:
+        return self._snapshot.version
+
+    def add_listener(self, callback: Callable[[ModelSnapshot], None]):
+        """Register a callback run after every swap (e.g. cache invalidation)."""
+        self._listeners.append(callback)
+
+    def replace(self, expected: ModelSnapshot, snapshot: ModelSnapshot) -> bool:
+        """Swap in an update of the expected snapshot, unless a reload replaced it meanwhile.
+
+        Listeners are not called: an update changes part of the models, and its
+        producer tells the parties that care what changed.
+        """
+        with self._reload_lock:
+            if self._snapshot is not expected:
+                return False
+            self._snapshot = snapshot
+        logger.info(f"Updated model version {expected.version} -> {snapshot.version}")
+        return True
+
+    def reload(self) -> ModelSnapshot:
+        """Load the published artifacts and swap them in if the version changed."""
+        with self._reload_lock:
+            snapshot = self._loader()
+            if snapshot.version == self._snapshot.version:
+                logger.info(f"Model version {snapshot.version} already active")
+                return self._snapshot
+            previous, self._snapshot = self._snapshot, snapshot
+            logger.info(f"Swapped model version {previous.version} -> {snapshot.version}")
+
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Error in model swap listener: {e}")
+        return snapshot
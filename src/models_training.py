@@ -1,60 +1,212 @@
 from surprise import SVD, Dataset, Reader, accuracy
 from surprise.model_selection import train_test_split
-from scipy.sparse import csr_matrix
-from sklearn.neighbors import NearestNeighbors
+import multiprocessing
+import os
 import pickle
-from data_processing import load_ratings_data, preprocess_data
-from config import RATING_SCALE, TEST_SIZE, SVD_MODEL_FILE, KNN_MODEL_FILE, FINAL_DATASET_FILE
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+from data_processing import load_ratings, load_final_data, RatingsData
+from neighbors import compute_neighbors, save_neighbor_table
+from neighbor_index import make_neighbor_index
+from metrics import TRAINING_SECONDS, TRAINING_RUNS
+from artifacts import (export_svd, export_knn, export_workers, has_bundle, new_version_folder,
+                       publish_version)
+from config import (RATING_SCALE, TEST_SIZE, SVD_MODEL_FILE, KNN_MODEL_FILE, RATING_MATRIX_FILE,
+                    NEIGHBOR_TABLE_FILE, ARTIFACTS_FOLDER, KNN_BACKEND, SVD_N_FACTORS, SVD_N_EPOCHS,
+                    TRAINING_START_METHOD)
+
+logger = logging.getLogger(__name__)
+
+# Steps each trainer reports as it starts them, in order (progress is counted in steps)
+TRAINING_STEPS = {
+    "svd": ("fit", "evaluate", "export"),
+    "knn": ("fit", "neighbors", "export"),
+}
+DONE = "done"
+
+
+class TrainingCancelled(Exception):
+    """Raised by train_models when it was cancelled before both trainers finished."""
 
 
 def save_model(model, filename):
-    """ Save the model using pickle. """
-    with open(filename, "wb") as f:
+    """ Save the model using pickle (through a temp file, so a killed trainer leaves no partial file). """
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "wb") as f:
         pickle.dump(model, f)
-
-def train_svd():
-    """Trains and returns an SVD model."""
-    ratings_df = load_ratings_data()
+    os.replace(tmp_filename, filename)
+
+def _report(report: Optional[Callable[[str], None]], step: str):
+    if report is not None:
+        report(step)
+
+def _publish_if_complete(folder):
+    """Publish a standalone training run's version once it holds a complete bundle."""
+    if has_bundle(folder):
+        publish_version(ARTIFACTS_FOLDER, folder)
+    else:
+        logger.warning(f"Artifact version {folder} is incomplete (train both models), not publishing")
+
+def train_svd(artifacts_folder: Optional[str] = None, ratings: Optional[RatingsData] = None,
+              n_factors: Optional[int] = None, n_epochs: Optional[int] = None,
+              report: Optional[Callable[[str], None]] = None):
+    """Trains and returns an SVD model.
+
+    Exports into artifacts_folder when given; otherwise into a new artifact
+    version that is published right away. ratings defaults to load_ratings();
+    n_factors and n_epochs default to SVD_N_FACTORS and SVD_N_EPOCHS. report
+    is called with each step of TRAINING_STEPS["svd"] as it starts.
+    """
+    ratings = ratings if ratings is not None else load_ratings()
+    ratings_df = ratings.to_frame()
 
     reader = Reader(rating_scale=RATING_SCALE)
     data = Dataset.load_from_df(ratings_df[['userId', 'workerId', 'rating']], reader)
 
     trainset, testset = train_test_split(data, test_size=TEST_SIZE, random_state=42)
 
-    svd = SVD()
+    _report(report, "fit")
+    svd = SVD(n_factors=n_factors or SVD_N_FACTORS, n_epochs=n_epochs or SVD_N_EPOCHS)
     svd.fit(trainset)
 
     # Evaluate SVD
+    _report(report, "evaluate")
     test_predictions = svd.test(testset)
     rmse = accuracy.rmse(test_predictions)
     mae = accuracy.mae(test_predictions)
 
     # Save trained model
+    _report(report, "export")
     save_model(svd, SVD_MODEL_FILE)
+    standalone = artifacts_folder is None
+    artifacts_folder = new_version_folder(ARTIFACTS_FOLDER) if standalone else artifacts_folder
+    export_svd(svd, artifacts_folder, ratings_log_bytes=ratings.log_bytes)
+    if standalone:
+        _publish_if_complete(artifacts_folder)
 
     print('SVD model trained and saved.')
 
     return svd, rmse, mae
 
-def train_knn():
-    """Trains and returns a KNN model."""
-    ratings_df = load_ratings_data()
-    final_dataset = preprocess_data(ratings_df)
+def train_knn(artifacts_folder: Optional[str] = None, ratings: Optional[RatingsData] = None,
+              report: Optional[Callable[[str], None]] = None):
+    """Trains and returns a KNN model.
 
-    csr_data = csr_matrix(final_dataset.values)
+    Exports into artifacts_folder when given; otherwise into a new artifact
+    version that is published right away. ratings defaults to load_ratings().
+    report is called with each step of TRAINING_STEPS["knn"] as it starts.
+    """
+    rating_matrix = (ratings if ratings is not None else load_ratings()).to_rating_matrix()
+    csr_data = rating_matrix.matrix
 
-    knn = NearestNeighbors(metric='cosine', algorithm='brute', n_neighbors=20, n_jobs=-1)
+    _report(report, "fit")
+    knn = make_neighbor_index(KNN_BACKEND)
     knn.fit(csr_data)
 
+    # Precompute every worker's neighbors so serving never runs kneighbors
+    _report(report, "neighbors")
+    indices, similarities = compute_neighbors(knn, csr_data)
+
     # Save trained model
+    _report(report, "export")
     save_model(knn, KNN_MODEL_FILE)
-    save_model(final_dataset, FINAL_DATASET_FILE)
+    rating_matrix.save(RATING_MATRIX_FILE)
+    save_neighbor_table(indices, similarities, NEIGHBOR_TABLE_FILE)
+    standalone = artifacts_folder is None
+    artifacts_folder = new_version_folder(ARTIFACTS_FOLDER) if standalone else artifacts_folder
+    export_knn(rating_matrix, indices, similarities, artifacts_folder, backend=KNN_BACKEND)
+    export_workers(load_final_data(), artifacts_folder)
+    if standalone:
+        _publish_if_complete(artifacts_folder)
 
     print('KNN model trained and saved.')
 
     return knn
 
+def _run_trainer(name: str, train: Callable, events, kwargs: dict):
+    """Child process entry point: run one trainer, reporting its steps to the parent."""
+    try:
+        train(report=lambda step: events.put((name, step, None)), **kwargs)
+    except BaseException as e:
+        events.put((name, None, f"{type(e).__name__}: {e}"))
+        raise
+    events.put((name, DONE, None))
+
+def train_models(folder: str, ratings: RatingsData, n_factors: Optional[int] = None, n_epochs: Optional[int] = None,
+                 report: Optional[Callable[[str, str], None]] = None,
+                 cancelled: Optional[threading.Event] = None) -> Dict[str, float]:
+    """Fit SVD and KNN in two child processes at once, both exporting into folder.
+
+    The trainers are independent (they share only the ratings and write
+    different files), so with two free cores this takes as long as the slower of
+    the two instead of their sum. report(trainer, step) is called from this thread as the children
+    start their steps; when cancelled is set the children are killed and
+    TrainingCancelled is raised. Returns each trainer's duration in seconds.
+    """
+    context = multiprocessing.get_context(TRAINING_START_METHOD)
+    if TRAINING_START_METHOD == "forkserver":
+        # The fork server imports the trainers once; every later job forks them warm
+        context.set_forkserver_preload(["models_training"])
+    events = context.Queue()
+    trainers = {
+        "svd": (train_svd, dict(artifacts_folder=folder, ratings=ratings, n_factors=n_factors, n_epochs=n_epochs)),
+        "knn": (train_knn, dict(artifacts_folder=folder, ratings=ratings)),
+    }
+    start = time.perf_counter()
+    processes = {name: context.Process(target=_run_trainer, args=(name, train, events, kwargs),
+                                       name=f"train-{name}")
+                 for name, (train, kwargs) in trainers.items()}
+    for process in processes.values():
+        process.start()
+
+    durations = {}
+    try:
+        while len(durations) < len(processes):
+            if cancelled is not None and cancelled.is_set():
+                raise TrainingCancelled("Training was cancelled")
+            try:
+                name, step, error = events.get(timeout=0.2)
+            except queue.Empty:
+                # A child killed from outside (e.g. by the OOM killer) never reports back
+                for name, process in processes.items():
+                    if name not in durations and process.exitcode is not None:
+                        raise RuntimeError(f"{name} trainer exited with code {process.exitcode}")
+                continue
+            if error is not None:
+                raise RuntimeError(f"{name} training failed: {error}")
+            if step == DONE:
+                durations[name] = time.perf_counter() - start
+                TRAINING_SECONDS.observe(durations[name], f"train_{name}")
+            if report is not None:
+                report(name, step)
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in processes.values():
+            process.join()
+        events.close()
+    return durations
+
+def train_and_publish(n_factors: Optional[int] = None, n_epochs: Optional[int] = None) -> str:
+    """Train both models into one new artifact version, publish it and return the version."""
+    try:
+        with TRAINING_SECONDS.time("total"):
+            folder = new_version_folder(ARTIFACTS_FOLDER)
+            # One parse of the ratings feeds both trainers
+            with TRAINING_SECONDS.time("load_ratings"):
+                ratings = load_ratings()
+            train_models(folder, ratings, n_factors, n_epochs)
+            version = publish_version(ARTIFACTS_FOLDER, folder)
+    except Exception:
+        TRAINING_RUNS.inc("failure")
+        raise
+    TRAINING_RUNS.inc("success")
+    return version
+
 
 if __name__ == '__main__':
-    x,y,z = train_svd()
-    i = train_knn()
\ No newline at end of file
+    train_and_publish()
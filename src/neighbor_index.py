@@ -0,0 +1,111 @@
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from sklearn.neighbors import NearestNeighbors
+from config import KNN_BACKEND, IVF_N_LISTS, IVF_N_PROBE, IVF_TRAIN_ITERATIONS
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("brute", "ivf")
+
+
+def normalize_rows(matrix) -> csr_matrix:
+    """Scale CSR rows to unit L2 norm (all-zero rows stay zero)."""
+    matrix = csr_matrix(matrix, dtype=np.float64)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return diags(1.0 / norms) @ matrix
+
+
+class IVFCosineIndex:
+    """Approximate cosine nearest neighbors with an inverted-file (clustered) index.
+
+    fit() runs spherical k-means over the L2-normalized rows and files every
+    row under its closest centroid. kneighbors() only compares a query against
+    the rows of its n_probe closest clusters, so a query costs roughly
+    n_probe / n_lists of a brute-force scan. Mirrors the parts of the sklearn
+    NearestNeighbors API that the neighbor table uses (fit, kneighbors with
+    cosine distances), so the two are interchangeable.
+    """
+
+    def __init__(self, n_lists=IVF_N_LISTS, n_probe: int = IVF_N_PROBE,
+                 n_iterations: int = IVF_TRAIN_ITERATIONS, random_state: int = 42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iterations = n_iterations
+        self.random_state = random_state
+
+    def fit(self, data):
+        rows = normalize_rows(data)
+        n_rows = rows.shape[0]
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(n_rows))), n_rows)
+
+        rng = np.random.default_rng(self.random_state)
+        centroids = rows[rng.choice(n_rows, n_lists, replace=False)].toarray()
+        for _ in range(self.n_iterations):
+            assignment = np.asarray((rows @ centroids.T).argmax(axis=1)).ravel()
+            members = csr_matrix((np.ones(n_rows), (assignment, np.arange(n_rows))), shape=(n_lists, n_rows))
+            sums = np.asarray((members @ rows).todense())
+            norms = np.linalg.norm(sums, axis=1)
+            # Empty clusters keep their previous centroid
+            filled = norms > 0
+            centroids[filled] = sums[filled] / norms[filled, None]
+
+        assignment = np.asarray((rows @ centroids.T).argmax(axis=1)).ravel()
+        self.rows_ = rows
+        self.centroids_ = centroids
+        self.list_rows_ = np.argsort(assignment, kind='stable')
+        self.list_offsets_ = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        self.n_samples_fit_ = n_rows
+        return self
+
+    def kneighbors(self, data, n_neighbors: int):
+        """Return (cosine distances, indices) of the approximate n_neighbors of each query row."""
+        queries = normalize_rows(data)
+        n_queries = queries.shape[0]
+        n_lists = self.centroids_.shape[0]
+        n_probe = min(self.n_probe, n_lists)
+
+        centroid_sims = queries @ self.centroids_.T
+        probes = np.argpartition(-centroid_sims, n_probe - 1, axis=1)[:, :n_probe] if n_probe < n_lists \
+            else np.tile(np.arange(n_lists), (n_queries, 1))
+
+        best_sims = np.full((n_queries, n_neighbors), -np.inf)
+        best_rows = np.full((n_queries, n_neighbors), -1, dtype=np.int64)
+        # One sparse product per cluster, against all queries that probe it
+        for cluster in range(n_lists):
+            query_ids = np.flatnonzero((probes == cluster).any(axis=1))
+            list_rows = self.list_rows_[self.list_offsets_[cluster]:self.list_offsets_[cluster + 1]]
+            if not len(query_ids) or not len(list_rows):
+                continue
+            sims = np.asarray((queries[query_ids] @ self.rows_[list_rows].T).todense())
+            merged_sims = np.hstack([best_sims[query_ids], sims])
+            merged_rows = np.hstack([best_rows[query_ids], np.broadcast_to(list_rows, sims.shape)])
+            keep = min(n_neighbors, merged_sims.shape[1])
+            top = np.argpartition(-merged_sims, keep - 1, axis=1)[:, :keep]
+            best_sims[query_ids] = np.take_along_axis(merged_sims, top, axis=1)
+            best_rows[query_ids] = np.take_along_axis(merged_rows, top, axis=1)
+
+        # Queries whose probed clusters held fewer than n_neighbors rows fall back to an exact scan
+        short = np.flatnonzero((best_rows < 0).any(axis=1))
+        if len(short):
+            sims = np.asarray((queries[short] @ self.rows_.T).todense())
+            top = np.argpartition(-sims, n_neighbors - 1, axis=1)[:, :n_neighbors]
+            best_sims[short] = np.take_along_axis(sims, top, axis=1)
+            best_rows[short] = top
+
+        # Closest first; ties by row, like the brute-force search
+        order = np.lexsort((best_rows, -best_sims), axis=1)
+        best_sims = np.take_along_axis(best_sims, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return 1 - best_sims, best_rows
+
+
+def make_neighbor_index(backend: str = KNN_BACKEND):
+    """Return an unfitted neighbor index for the configured backend."""
+    if backend == "brute":
+        # Exact baseline
+        return NearestNeighbors(metric='cosine', algorithm='brute', n_neighbors=20, n_jobs=-1)
+    if backend == "ivf":
+        return IVFCosineIndex()
+    raise ValueError(f"Unknown neighbor backend: {backend} (expected one of {BACKENDS})")
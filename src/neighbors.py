@@ -0,0 +1,151 @@
+import os
+import threading
+import logging
+import numpy as np
+from neighbor_index import normalize_rows
+from config import KNN_NEIGHBORS
+
+logger = logging.getLogger(__name__)
+
+MISSING = -1
+
+
+def compute_neighbors(knn, csr_data, rows=None, k: int = KNN_NEIGHBORS):
+    """Run kneighbors for the given rows (all rows by default) and return (indices, similarities)."""
+    query = csr_data if rows is None else csr_data[rows]
+    distances, indices = knn.kneighbors(query, n_neighbors=k)
+    # Convert cosine distance to similarity once, at build time
+    return indices.astype(np.int32), 1 - distances
+
+
+def _top_neighbors(rows, similarities, k: int):
+    """Keep the k most similar of each row's candidates, closest first and ties by row."""
+    rows = np.broadcast_to(rows, similarities.shape)
+    if similarities.shape[1] > k:
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        rows = np.take_along_axis(rows, top, axis=1)
+        similarities = np.take_along_axis(similarities, top, axis=1)
+    order = np.lexsort((rows, -similarities), axis=1)
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(similarities, order, axis=1)
+
+
+def save_neighbor_table(indices, similarities, filename):
+    """Persist a neighbor table as an uncompressed .npz archive."""
+    with open(filename, "wb") as f:
+        np.savez(f, indices=indices, similarities=similarities)
+
+
+class NeighborTable:
+    """Dense (n_workers, k) neighbor indices and similarities, indexed by rating matrix row.
+
+    Rows that are absent from the persisted table (a stale or missing file) are
+    marked with MISSING and recomputed on first use, one batch per lookup.
+    """
+
+    def __init__(self, indices, similarities, knn=None, csr_data=None):
+        self.indices = indices
+        self.similarities = similarities
+        self.k = indices.shape[1]
+        self._knn = knn
+        self._csr_data = csr_data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, filename, knn, csr_data, k: int = KNN_NEIGHBORS):
+        """Load the persisted table, padding it with missing rows to match csr_data."""
+        n_rows = csr_data.shape[0]
+        indices = np.full((n_rows, k), MISSING, dtype=np.int32)
+        similarities = np.zeros((n_rows, k), dtype=np.float64)
+
+        if os.path.exists(filename):
+            with np.load(filename) as data:
+                stored_indices, stored_similarities = data['indices'], data['similarities']
+            if stored_indices.shape[1] == k and stored_indices.shape[0] <= n_rows:
+                n_stored = stored_indices.shape[0]
+                indices[:n_stored] = stored_indices
+                similarities[:n_stored] = stored_similarities
+                logger.info(f"Neighbor table loaded ({n_stored}/{n_rows} rows)")
+            else:
+                logger.warning(f"Neighbor table shape {stored_indices.shape} does not match "
+                               f"({n_rows}, {k}), recomputing on demand")
+        else:
+            logger.info("No neighbor table found, neighbors will be computed on demand")
+
+        return cls(indices, similarities, knn=knn, csr_data=csr_data)
+
+    def missing_rows(self, rows=None):
+        """Return the rows (of the given ones, or all) that still need to be computed."""
+        first = self.indices[:, 0] if rows is None else self.indices[rows, 0]
+        missing = first == MISSING
+        if rows is None:
+            return np.flatnonzero(missing)
+        return np.unique(np.asarray(rows)[missing])
+
+    def lookup(self, rows):
+        """Return (indices, similarities) for the given rows, filling missing ones first."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(self.missing_rows(rows)):
+            with self._lock:
+                missing = self.missing_rows(rows)
+                if len(missing):
+                    if self._knn is None:
+                        raise RuntimeError("Neighbor table is incomplete and no KNN model is available")
+                    logger.info(f"Computing neighbors for {len(missing)} missing rows")
+                    indices, similarities = compute_neighbors(self._knn, self._csr_data, missing, self.k)
+                    # Similarities first so readers never see a filled index with a stale similarity
+                    self.similarities[missing] = similarities
+                    self.indices[missing] = indices
+        return self.indices[rows], self.similarities[rows]
+
+    def with_changed_rows(self, csr_data, changed_rows):
+        """Return (a table for csr_data after the given rows changed, the rows whose neighbors changed).
+
+        Cosine similarity only changes for pairs involving a changed row, so one
+        (changed x all) product is enough: changed rows get fresh neighbor lists,
+        and every other list drops its changed entries and merges in the new
+        similarities to the changed rows. Lists that lost a neighbor to a lower
+        similarity, whose replacement may be a row outside the list, and rows
+        that were never computed are searched in full. csr_data may have more
+        rows than this table (appended workers); they count as changed.
+        """
+        n_rows = csr_data.shape[0]
+        n_old = self.indices.shape[0]
+        changed = np.union1d(np.asarray(changed_rows, dtype=np.int64), np.arange(n_old, n_rows))
+        indices = np.full((n_rows, self.k), MISSING, dtype=np.int32)
+        similarities = np.zeros((n_rows, self.k), dtype=np.float64)
+        indices[:n_old] = self.indices
+        similarities[:n_old] = self.similarities
+
+        if not len(changed):
+            return self, changed
+        normalized = normalize_rows(csr_data)
+        changed_similarities = np.asarray((normalized[changed] @ normalized.T).todense())
+        all_rows = np.arange(n_rows)
+        indices[changed], similarities[changed] = _top_neighbors(all_rows, changed_similarities, self.k)
+
+        others = np.setdiff1d(np.arange(n_old), changed)
+        others = others[indices[others, 0] != MISSING]
+        old_rows = indices[others].astype(np.int64)
+        old_similarities = similarities[others]
+        position = np.searchsorted(changed, old_rows).clip(max=len(changed) - 1)
+        stale = changed[position] == old_rows
+        new_similarities = changed_similarities[:, others].T
+        # A stale neighbor that got less similar may now rank below rows the list never kept
+        dropped = (stale & (np.take_along_axis(new_similarities, position, axis=1) < old_similarities)).any(axis=1)
+
+        merged_rows, merged_similarities = _top_neighbors(
+            np.hstack([old_rows, np.broadcast_to(changed, new_similarities.shape)]),
+            np.hstack([np.where(stale, -np.inf, old_similarities), new_similarities]), self.k)
+        indices[others] = merged_rows
+        similarities[others] = merged_similarities
+
+        full = np.union1d(others[dropped], np.flatnonzero(indices[:, 0] == MISSING))
+        for start in range(0, len(full), 1024):
+            rows = full[start:start + 1024]
+            row_similarities = np.asarray((normalized[rows] @ normalized.T).todense())
+            indices[rows], similarities[rows] = _top_neighbors(all_rows, row_similarities, self.k)
+
+        # Compare sets: the rebuilt lists order tied neighbors by row, unlike the trained table
+        relinked = np.flatnonzero((np.sort(indices[:n_old], axis=1) != np.sort(self.indices, axis=1)).any(axis=1))
+        table = NeighborTable(indices, similarities, csr_data=csr_data)
+        return table, np.union1d(changed, relinked)
@@ -1,194 +1,511 @@
+import os
 import pickle
-from dataclasses import dataclass
-from data_processing import load_final_data
-from scipy.sparse import csr_matrix
-from config import WEIGHT_KNN, WEIGHT_SVD, KNN_MODEL_FILE, SVD_MODEL_FILE, FINAL_DATASET_FILE
-from schemas import WorkerRecommendation, RecommendationResponse
+import logging
+import time
+from dataclasses import dataclass, replace
+from functools import lru_cache, reduce
+from typing import Optional, Union
+import numpy as np
+import pandas as pd
+from data_processing import load_final_data, build_genre_index, normalize_genre, RatingMatrix
+from neighbors import NeighborTable
+from worker_index import WorkerIndex
+from svd_scoring import BatchSVDScorer
+from model_registry import ModelRegistry, ModelSnapshot
+from catalog import catalog_service, CatalogSnapshot
+from metrics import stage
+import artifacts
+from config import (WEIGHT_KNN, WEIGHT_SVD, KNN_MODEL_FILE, SVD_MODEL_FILE, RATING_MATRIX_FILE,
+                    NEIGHBOR_TABLE_FILE, GENRE_MATCH_MODE, ARTIFACTS_FOLDER)
+from schemas import RecommendationResponse
 import service_pb2
 
+logger = logging.getLogger(__name__)
+
+NO_ROWS = np.array([], dtype=np.int64)
+GENRE_MATCHES = ("any", "all")
+
 @dataclass
 class WorkerRecommendation:
     workerId: int
     name: str
     score: float
 
+@dataclass(frozen=True)
+class ScoredWorkers:
+    """Raw engine output: ranked worker ids with their hybrid scores and names."""
+    ids: np.ndarray
+    scores: np.ndarray
+    names: np.ndarray
+
+    def __len__(self):
+        return len(self.ids)
+
+    def head(self, n: int) -> "ScoredWorkers":
+        return self.page(0, n)
+
+    def page(self, offset: int, limit: int) -> "ScoredWorkers":
+        end = offset + limit
+        return ScoredWorkers(ids=self.ids[offset:end], scores=self.scores[offset:end], names=self.names[offset:end])
+
+@dataclass(frozen=True)
+class GenreRanking:
+    """Every candidate of a query, best first, as compact int32 dataset rows and their scores.
+
+    Computed once and paged without rescoring; worker ids and names are only
+    resolved for the rows of a requested page (HybridRecommender.page).
+    """
+    rows: np.ndarray
+    scores: np.ndarray
+
+    def __len__(self):
+        return len(self.rows)
+
+@dataclass(frozen=True)
+class GenreFilter:
+    """Several genres combined with OR ("any") or AND ("all").
+
+    Build it with of(), which normalizes, deduplicates and sorts the genres,
+    so equivalent queries compare, hash and print (as cache keys) the same.
+    """
+    genres: tuple
+    match: str = "any"
+
+    @classmethod
+    def of(cls, genres, match: str = "any") -> "GenreFilter":
+        if match not in GENRE_MATCHES:
+            raise ValueError(f"Unknown genre match: {match} (expected one of {GENRE_MATCHES})")
+        genres = tuple(sorted({normalize_genre(genre) for genre in genres if genre.strip()}))
+        # With a single genre, any and all select the same workers
+        return cls(genres, match if len(genres) > 1 else "any")
+
+    def __str__(self):
+        if len(self.genres) == 1:
+            return self.genres[0]
+        return f"{self.match}({'|'.join(self.genres)})"
+
+GenreSpec = Union[str, GenreFilter]  # A genre name or several combined
+
+def canonical_genre(genre: GenreSpec) -> str:
+    """Text of a genre or GenreFilter that is equal for equivalent queries."""
+    return str(genre) if isinstance(genre, GenreFilter) else normalize_genre(genre)
+
+def member_genres(canonical: str) -> list[str]:
+    """The genres a canonical_genre text is made of."""
+    for match in GENRE_MATCHES:
+        if canonical.startswith(f"{match}(") and canonical.endswith(")"):
+            return canonical[len(match) + 1:-1].split("|")
+    return [canonical]
+
+@dataclass(frozen=True)
+class RecommendationQuery:
+    """One (genre, user) query with its ranking parameters, as used by batch requests."""
+    genre: GenreSpec
+    user_id: int = 1
+    top_n: int = 8
+    weight_knn: float = WEIGHT_KNN
+    weight_svd: float = WEIGHT_SVD
+
+EMPTY_RESULT = ScoredWorkers(ids=NO_ROWS, scores=np.array([], dtype=np.float64),
+                             names=np.array([], dtype=object))
+EMPTY_RANKING = GenreRanking(rows=np.array([], dtype=np.int32), scores=np.array([], dtype=np.float64))
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, highest first; ties keep position order.
+
+    Same result as np.argsort(-scores, kind='stable')[:k], but argpartition
+    finds the top k in linear time and only those k get sorted.
+    """
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    if k <= 0:
+        return NO_ROWS
+    threshold = -np.partition(-scores, k - 1)[k - 1]
+    above = np.flatnonzero(scores > threshold)
+    # Among scores tied at the cut, the earliest positions make it in
+    tied = np.flatnonzero(scores == threshold)[:k - len(above)]
+    selected = np.concatenate([above, tied])
+    return selected[np.lexsort((selected, -scores[selected]))]
+
+
+class HybridRecommender:
+    """KNN + SVD hybrid scoring engine shared by the REST, gRPC and dataclass adapters.
+
+    All state is precomputed at construction: the genre index, the worker_df row
+    to dataset row mapping and the SVD inner id of every dataset row. Rows are
+    rating matrix row positions throughout.
+    """
+
+    def __init__(self, worker_df: pd.DataFrame, worker_index: WorkerIndex,
+                 neighbor_table: NeighborTable, svd_scorer: BatchSVDScorer,
+                 rating_matrix: Optional[RatingMatrix] = None, genre_index: Optional[dict] = None,
+                 catalog_digest: Optional[str] = None):
+        self.worker_df = worker_df
+        self.catalog_digest = catalog_digest  # Digest of the catalog file worker_df came from, if it did
+        self.worker_index = worker_index
+        self.neighbor_table = neighbor_table
+        self.svd_scorer = svd_scorer
+        self.rating_matrix = rating_matrix  # Only needed to fold in new ratings
+        self.genre_index = genre_index if genre_index is not None else build_genre_index(worker_df)
+        self.worker_rows = worker_index.rows_for(worker_df['workerId'].to_numpy())
+        self.row_items = svd_scorer.inner_items(worker_index.row_ids)
+        self._substring_genre_rows = lru_cache(maxsize=256)(self._scan_genre_substring)
+
+    def _scan_genre_substring(self, genre_name: str) -> np.ndarray:
+        """Legacy matching: case-insensitive str.contains over the raw genres column."""
+        mask = self.worker_df['genres'].str.contains(genre_name, case=False, na=False)
+        return np.flatnonzero(mask.to_numpy())
+
+    def find_genre_rows(self, genre_name: GenreSpec, match_mode: str = GENRE_MATCH_MODE) -> np.ndarray:
+        """Return the sorted worker_df row positions of the workers in a genre (or a GenreFilter)."""
+        if isinstance(genre_name, GenreFilter):
+            # Union or intersection of the member sets, so the query is scored in a single pass
+            member_rows = [self.find_genre_rows(genre, match_mode) for genre in genre_name.genres]
+            if not member_rows:
+                return NO_ROWS
+            return reduce(np.union1d if genre_name.match == "any" else np.intersect1d, member_rows)
+        if match_mode == "substring":
+            return self._substring_genre_rows(genre_name)
+        if match_mode != "exact":
+            raise ValueError(f"Unknown genre match mode: {match_mode}")
+        return self.genre_index.get(normalize_genre(genre_name), NO_ROWS)
+
+    def genre_candidate_rows(self, genre_name: GenreSpec, match_mode: str = GENRE_MATCH_MODE) -> np.ndarray:
+        """Return the dataset rows of a genre's workers, deduplicated in worker_df order."""
+        rows = self.worker_rows[self.find_genre_rows(genre_name, match_mode)]
+        # Workers without ratings have no row in the dataset
+        return pd.unique(rows[rows >= 0])
+
+    def with_ratings(self, user_ids, worker_ids, ratings):
+        """Return (an engine with the given ratings folded in, the workers whose results may change).
+
+        The rating matrix gets the new ratings, the neighbor table is updated
+        for the rows they changed and the SVD factors of the users and workers
+        involved are refit; nothing is retrained and this engine is unchanged.
+        """
+        if self.rating_matrix is None:
+            raise RuntimeError("This engine was built without its rating matrix and cannot fold in ratings")
+        rating_matrix, changed_rows = self.rating_matrix.with_ratings(worker_ids, user_ids, ratings)
+        neighbor_table, affected_rows = self.neighbor_table.with_changed_rows(rating_matrix.matrix, changed_rows)
+        svd_scorer = self.svd_scorer.fold_in(rating_matrix, user_ids, worker_ids)
+        worker_index = self.worker_index
+        if len(rating_matrix.worker_ids) != len(worker_index):
+            worker_index = WorkerIndex.build(rating_matrix.worker_ids, self.worker_df)
+        recommender = HybridRecommender(self.worker_df, worker_index, neighbor_table, svd_scorer,
+                                        rating_matrix=rating_matrix, genre_index=self.genre_index,
+                                        catalog_digest=self.catalog_digest)
+        return recommender, rating_matrix.worker_ids[affected_rows]
+
+    def with_workers(self, catalog: CatalogSnapshot) -> "HybridRecommender":
+        """Return an engine with this one's models and the catalog's worker table and genre index."""
+        worker_index = WorkerIndex.build(self.worker_index.row_ids, catalog.workers)
+        return HybridRecommender(catalog.workers, worker_index, self.neighbor_table, self.svd_scorer,
+                                 rating_matrix=self.rating_matrix, genre_index=catalog.genre_index,
+                                 catalog_digest=catalog.digest)
+
+    def affected_genres(self, worker_ids) -> set[str]:
+        """Return the genres whose results can depend on the given workers.
+
+        That is every genre a worker belongs to, plus every genre containing a
+        worker that lists one of them as a KNN neighbor (and so scores it as a
+        candidate). Genres are returned as raw tokens, as get_all_genres does.
+        """
+        worker_ids = np.asarray(worker_ids, dtype=np.int64)
+        if not len(worker_ids):
+            return set()
+        rows = self.worker_index.rows_for(worker_ids)
+        rows = rows[rows >= 0]
+        referencing = np.flatnonzero(np.isin(self.neighbor_table.indices, rows).any(axis=1))
+        dataset_rows = np.union1d(rows, referencing)
+
+        affected_rows = (np.isin(self.worker_rows, dataset_rows)
+                         | self.worker_df['workerId'].isin(worker_ids).to_numpy())
+        genres = set()
+        for tokens in self.worker_df['genres'][affected_rows].str.split('|'):
+            if isinstance(tokens, list):
+                genres.update(tokens)
+        return genres
+
+    def predict_all(self, user_id: int = 1) -> np.ndarray:
+        """SVD predictions of one user for every dataset row."""
+        with stage("svd"):
+            return self.svd_scorer.score_inner(self.svd_scorer.inner_user(int(user_id)), self.row_items)
+
+    def score_rows(self, rows, user_id: int = 1, weight_knn: float = WEIGHT_KNN,
+                   weight_svd: float = WEIGHT_SVD, predicted_ratings: Optional[np.ndarray] = None):
+        """Score the neighborhood of the given rows for one user and return (candidate rows, scores).
+
+        A one-user score_rows_many; predicted_ratings, the output of predict_all,
+        saves re-scoring SVD when many row sets are scored for the same user.
+        """
+        if predicted_ratings is not None:
+            predicted_ratings = predicted_ratings[np.newaxis]
+        candidates, scores = self.score_rows_many(rows, [user_id], weight_knn, weight_svd, predicted_ratings)
+        return candidates, scores[0]
+
+    def score_rows_many(self, rows, user_ids, weight_knn: float = WEIGHT_KNN,
+                        weight_svd: float = WEIGHT_SVD, predicted_ratings: Optional[np.ndarray] = None):
+        """Score the neighborhood of the given rows for many users and return (candidate rows, scores).
+
+        Candidates come back in first-encounter order, matching the order the
+        previous dict-based implementation inserted them in. The KNN part is
+        shared by all users; the SVD part is one (users x candidates) factor
+        product. predicted_ratings, if given, holds one predict_all row per user.
+        """
+        if not len(rows):
+            return NO_ROWS, np.empty((len(user_ids), 0), dtype=np.float64)
+
+        with stage("knn"):
+            neighbor_indices, similarities = self.neighbor_table.lookup(rows)
+            flat_neighbors = neighbor_indices.ravel()
+
+            # KNN part: sum weighted similarities per neighbor, in traversal order
+            candidates, first_seen, inverse = np.unique(flat_neighbors, return_index=True, return_inverse=True)
+            knn_scores = np.bincount(inverse, weights=weight_knn * similarities.ravel(), minlength=len(candidates))
+            order = np.argsort(first_seen, kind='stable')
+            candidates, knn_scores = candidates[order], knn_scores[order]
+
+        # SVD part: one vectorized prediction for every (user, candidate) pair
+        with stage("svd"):
+            if predicted_ratings is None:
+                inner_users = self.svd_scorer.inner_users(np.asarray(user_ids, dtype=np.int64))
+                candidate_ratings = self.svd_scorer.score_inner_many(inner_users, self.row_items[candidates])
+            else:
+                candidate_ratings = predicted_ratings[:, candidates]
+
+        return candidates, knn_scores + weight_svd * candidate_ratings
+
+    def rank(self, rows, scores, top_n: int = 8) -> ScoredWorkers:
+        """Keep the top_n highest scores (ties keep candidate order) and resolve ids and names."""
+        with stage("rank"):
+            order = top_k(scores, top_n)
+            top_rows = rows[order]
+        with stage("names"):
+            return ScoredWorkers(ids=self.worker_index.ids_for(top_rows), scores=scores[order],
+                                 names=self.worker_index.names_for(top_rows))
+
+    def rank_all(self, rows, scores) -> GenreRanking:
+        """Order every candidate like rank() does, keeping only rows and scores."""
+        with stage("rank"):
+            order = np.argsort(-scores, kind='stable')
+            return GenreRanking(rows=rows[order].astype(np.int32), scores=scores[order])
+
+    def page(self, ranking: GenreRanking, offset: int = 0, limit: int = 8) -> ScoredWorkers:
+        """Resolve ids and names for one page of a ranking."""
+        rows = ranking.rows[offset:offset + limit]
+        with stage("names"):
+            return ScoredWorkers(ids=self.worker_index.ids_for(rows), scores=ranking.scores[offset:offset + limit],
+                                 names=self.worker_index.names_for(rows))
+
+    def rank_genre(self, genre_name: GenreSpec, user_id: int = 1, weight_knn: float = WEIGHT_KNN,
+                   weight_svd: float = WEIGHT_SVD, match_mode: str = GENRE_MATCH_MODE) -> GenreRanking:
+        """Rank every candidate of a genre for one user, for paging."""
+        with stage("genre_filter"):
+            genre_rows = self.genre_candidate_rows(genre_name, match_mode)
+        if not len(genre_rows):
+            return EMPTY_RANKING
+        rows, scores = self.score_rows(genre_rows, user_id, weight_knn, weight_svd)
+        return self.rank_all(rows, scores)
+
+    def recommend(self, genre_name: GenreSpec, user_id: int = 1, weight_knn: float = WEIGHT_KNN,
+                  weight_svd: float = WEIGHT_SVD, top_n: int = 8,
+                  match_mode: str = GENRE_MATCH_MODE) -> ScoredWorkers:
+        """Get the top_n hybrid-scored workers for a genre."""
+        return self.recommend_users(genre_name, [user_id], weight_knn, weight_svd, top_n, match_mode)[0]
+
+    def recommend_users(self, genre_name: GenreSpec, user_ids, weight_knn: float = WEIGHT_KNN,
+                        weight_svd: float = WEIGHT_SVD, top_n: int = 8,
+                        match_mode: str = GENRE_MATCH_MODE) -> list[ScoredWorkers]:
+        """Get the top_n hybrid-scored workers of a genre for each of many users."""
+        with stage("genre_filter"):
+            genre_rows = self.genre_candidate_rows(genre_name, match_mode)
+        if not len(genre_rows):
+            return [EMPTY_RESULT] * len(user_ids)
+        rows, scores = self.score_rows_many(genre_rows, user_ids, weight_knn, weight_svd)
+        return [self.rank(rows, user_scores, top_n) for user_scores in scores]
+
+    def recommend_many(self, genres, user_id: int = 1, weight_knn: float = WEIGHT_KNN,
+                       weight_svd: float = WEIGHT_SVD, top_n: int = 8,
+                       match_mode: str = GENRE_MATCH_MODE):
+        """Recommend for many genres at once, sharing the per-user work.
+
+        SVD predictions for every worker are computed once and the neighbor
+        table is filled for all member rows up front; each genre then only
+        gathers and ranks. Returns ({genre: ScoredWorkers}, {genre: seconds}).
+        """
+        return self._score_genres(genres, user_id, weight_knn, weight_svd, match_mode, EMPTY_RESULT,
+                                  lambda rows, scores: self.rank(rows, scores, top_n))
+
+    def rank_many(self, genres, user_id: int = 1, weight_knn: float = WEIGHT_KNN,
+                  weight_svd: float = WEIGHT_SVD, match_mode: str = GENRE_MATCH_MODE):
+        """Like recommend_many, but return each genre's full GenreRanking."""
+        return self._score_genres(genres, user_id, weight_knn, weight_svd, match_mode, EMPTY_RANKING,
+                                  self.rank_all)
+
+    def _score_genres(self, genres, user_id, weight_knn, weight_svd, match_mode, empty, finish):
+        results, timings = {}, {}
+        start = time.perf_counter()
+        predicted_ratings = self.predict_all(user_id)
+        with stage("genre_filter"):
+            candidate_rows = {genre: self.genre_candidate_rows(genre, match_mode) for genre in genres}
+        all_rows = [rows for rows in candidate_rows.values() if len(rows)]
+        if all_rows:
+            self.neighbor_table.lookup(np.unique(np.concatenate(all_rows)))
+        timings["_shared"] = time.perf_counter() - start
+
+        for genre, genre_rows in candidate_rows.items():
+            genre_start = time.perf_counter()
+            if len(genre_rows):
+                rows, scores = self.score_rows(genre_rows, user_id, weight_knn, weight_svd, predicted_ratings)
+                results[genre] = finish(rows, scores)
+            else:
+                results[genre] = empty
+            timings[genre] = time.perf_counter() - genre_start
+        return results, timings
+
+    def recommend_batch(self, queries, match_mode: str = GENRE_MATCH_MODE):
+        """Yield (index, ScoredWorkers) for a list of RecommendationQuery, as each is ready.
+
+        Work is shared across the batch: candidate sets are built once per genre,
+        the neighbor table is filled for all of them up front, all users asking
+        for the same genre and weights are scored with one factor product, and
+        queries differing only in top_n are ranked once (a shorter list is a
+        prefix of a longer one). Results come out grouped by genre and weights.
+        """
+        groups = {}
+        for index, query in enumerate(queries):
+            users = groups.setdefault((query.genre, float(query.weight_knn), float(query.weight_svd)), {})
+            users.setdefault(int(query.user_id), []).append((index, int(query.top_n)))
+
+        with stage("genre_filter"):
+            candidate_rows = {genre: self.genre_candidate_rows(genre, match_mode) for genre, _, _ in groups}
+        all_rows = [rows for rows in candidate_rows.values() if len(rows)]
+        if all_rows:
+            self.neighbor_table.lookup(np.unique(np.concatenate(all_rows)))
+
+        for (genre, weight_knn, weight_svd), users in groups.items():
+            genre_rows = candidate_rows[genre]
+            if not len(genre_rows):
+                for members in users.values():
+                    for index, _ in members:
+                        yield index, EMPTY_RESULT
+                continue
+            rows, scores = self.score_rows_many(genre_rows, list(users), weight_knn, weight_svd)
+            for user_scores, members in zip(scores, users.values()):
+                ranked = self.rank(rows, user_scores, max(top_n for _, top_n in members))
+                for index, top_n in members:
+                    yield index, ranked.head(top_n)
+
+def to_recommendation_response(result: ScoredWorkers) -> RecommendationResponse:
+    """Adapt engine output to the REST (pydantic) response."""
+    return RecommendationResponse(recommendations=[
+        {"workerId": worker_id, "name": name, "score": score}
+        for worker_id, name, score in zip(result.ids.tolist(), result.names, result.scores.tolist())
+    ])
+
+def to_grpc_response(result: ScoredWorkers) -> service_pb2.RecommendationResponse:
+    """Adapt engine output to the protobuf response."""
+    return service_pb2.RecommendationResponse(recommendations=[
+        service_pb2.WorkerRecommendation(workerId=worker_id, name=name, score=score)
+        for worker_id, name, score in zip(result.ids.tolist(), result.names, result.scores.tolist())
+    ])
+
+def to_worker_recommendations(result: ScoredWorkers) -> list[WorkerRecommendation]:
+    """Adapt engine output to a list of WorkerRecommendation dataclasses."""
+    return [
+        WorkerRecommendation(workerId=worker_id, name=name, score=score)
+        for worker_id, name, score in zip(result.ids.tolist(), result.names, result.scores.tolist())
+    ]
+
+
 def load_model(filename):
     with open(filename, "rb") as f:
         return pickle.load(f)
 
-# Load models and data
-knn = load_model(KNN_MODEL_FILE)
-svd = load_model(SVD_MODEL_FILE)
-final_dataset = load_model(FINAL_DATASET_FILE)
-
-worker_df = load_final_data()
-csr_data = csr_matrix(final_dataset.values)
-
-def get_top_workers_by_genre(genre_name: str, user_id: int = 1, weight_knn: float = WEIGHT_KNN, 
-                           weight_svd: float = WEIGHT_SVD, top_n: int = 8) -> RecommendationResponse:
+def load_recommender_from_pickles() -> HybridRecommender:
+    """Build the engine from the pickled models, the .npz files and the workers CSV."""
+    knn = load_model(KNN_MODEL_FILE)
+    svd = load_model(SVD_MODEL_FILE)
+    rating_matrix = RatingMatrix.load(RATING_MATRIX_FILE)
+
+    worker_df = load_final_data()
+    worker_index = WorkerIndex.build(rating_matrix.worker_ids, worker_df)
+    neighbor_table = NeighborTable.load(NEIGHBOR_TABLE_FILE, knn, rating_matrix.matrix)
+    return HybridRecommender(worker_df, worker_index, neighbor_table, BatchSVDScorer.from_svd(svd),
+                             rating_matrix=rating_matrix)
+
+def load_recommender_from_bundle(folder: str = ARTIFACTS_FOLDER) -> HybridRecommender:
+    """Build the engine from a memory-mapped artifact bundle (no unpickling or CSV parsing)."""
+    rating_matrix = artifacts.load_rating_matrix(folder)
+    worker_df = artifacts.load_workers(folder)
+    worker_index = WorkerIndex.build(rating_matrix.worker_ids, worker_df)
+    indices, similarities = artifacts.load_neighbor_arrays(folder)
+    # The exported table is complete, so no KNN model is needed for fallbacks
+    neighbor_table = NeighborTable(indices, similarities, csr_data=rating_matrix.matrix)
+    svd_scorer = BatchSVDScorer(**artifacts.load_svd_arrays(folder))
+    return HybridRecommender(worker_df, worker_index, neighbor_table, svd_scorer, rating_matrix=rating_matrix)
+
+def load_snapshot() -> ModelSnapshot:
+    """Load the published artifact bundle, falling back to the pickles."""
+    folder = artifacts.current_bundle_folder(ARTIFACTS_FOLDER)
+    if folder:
+        # A bundle exported before versioning sits directly in ARTIFACTS_FOLDER
+        version = "unversioned" if folder == ARTIFACTS_FOLDER else os.path.basename(os.path.normpath(folder))
+        # Ratings the models were trained on include the log up to this offset
+        log_bytes = artifacts.load_metadata(folder, "svd").get("ratings_log_bytes", 0)
+        return ModelSnapshot(version=version, recommender=load_recommender_from_bundle(folder),
+                             ratings_log_bytes=log_bytes)
+    logger.info("No artifact bundle found, loading pickled models")
+    return ModelSnapshot(version="pickles", recommender=load_recommender_from_pickles())
+
+# Load models and data; reload() swaps in newly trained versions
+model_registry = ModelRegistry(load_snapshot)
+
+def serve_catalog(catalog: CatalogSnapshot):
+    """Swap the catalog's worker table into the serving snapshot, keeping its models.
+
+    Names and genre membership then come from the same table /genres and the
+    cache rebuild list, instead of the one exported when the models were
+    trained. The version is unchanged: only a retrain changes the models.
+    """
+    while True:
+        snapshot = model_registry.current()
+        if snapshot.recommender.catalog_digest == catalog.digest:
+            return
+        updated = replace(snapshot, recommender=snapshot.recommender.with_workers(catalog))
+        if model_registry.replace(snapshot, updated):
+            return
+
+# Catalog reloads reach the serving models, and newly loaded models get the current catalog
+catalog_service.add_listener(lambda previous, catalog: serve_catalog(catalog))
+model_registry.add_listener(lambda snapshot: serve_catalog(catalog_service.current()))
+
+def get_recommender() -> HybridRecommender:
+    """Return the engine of the snapshot currently being served."""
+    return model_registry.current().recommender
+
+def get_top_workers_by_genre(genre_name: GenreSpec, user_id: int = 1, weight_knn: float = WEIGHT_KNN,
+                           weight_svd: float = WEIGHT_SVD, top_n: int = 8,
+                           match_mode: str = GENRE_MATCH_MODE) -> RecommendationResponse:
     """Get worker recommendations for a specific genre."""
-    # Find workers in the specified genre
-    workers_in_genre = worker_df[worker_df['genres'].str.contains(genre_name, case=False, na=False)]
-
-    if not workers_in_genre.empty:
-        # Ensure workerId is treated as an integer
-        genre_worker_ids = workers_in_genre['workerId'].astype(int).unique()
-
-        # Get KNN similarities
-        distances, indices = knn.kneighbors(csr_data, n_neighbors=11)
-
-        worker_scores = {}
-
-        for worker_id in genre_worker_ids:
-            worker_id = int(worker_id)
-
-            if worker_id in final_dataset['workerId'].values:
-                worker_idx = final_dataset[final_dataset['workerId'] == worker_id].index[0]
-
-                # KNN Similarity (convert distance to similarity)
-                for i, idx in enumerate(indices[worker_idx]):
-                    neighbor_id = int(final_dataset.iloc[idx]['workerId'])
-                    similarity = 1 - distances[worker_idx][i]
-                    worker_scores[neighbor_id] = worker_scores.get(neighbor_id, 0) + (weight_knn * similarity)
-
-        # Get SVD Predicted Ratings
-        for worker_id in list(worker_scores.keys()):
-            worker_id = int(worker_id)
-            predicted_rating = svd.predict(uid=int(user_id), iid=worker_id).est
-            worker_scores[worker_id] += weight_svd * predicted_rating
-
-        # Rank workers by final score
-        ranked_workers = sorted(worker_scores.items(), key=lambda x: -x[1])
-
-        # Prepare the recommendations
-        recommendations = []
-        for worker_id, score in ranked_workers[:top_n]:
-            worker_id = int(worker_id)
-            worker_row = worker_df.loc[worker_df['workerId'] == worker_id, 'names']
-            worker_name = worker_row.values[0] if not worker_row.empty else "Unknown Worker"
-            # Create dictionary instead of dataclass
-            recommendations.append({
-                "workerId": worker_id,
-                "name": worker_name,
-                "score": float(score)  # Ensure score is float
-            })
-            
-        print("not from cache")
-        return RecommendationResponse(recommendations=recommendations)
-    else:
-        return RecommendationResponse(recommendations=[])
-
-
-
-def get_top_workers_by_genre_grpc(genre_name, user_id=1, weight_knn=0.4, weight_svd=0.6, top_n=8):
-
-    # Find workers in the specified genre
-    workers_in_genre = worker_df[worker_df['genres'].str.contains(genre_name, case=False, na=False)]
-
-    if not workers_in_genre.empty:
-        # Ensure workerId is treated as an integer
-        genre_worker_ids = workers_in_genre['workerId'].astype(int).unique()
-
-        # Get KNN similarities
-        distances, indices = knn.kneighbors(csr_data, n_neighbors=11)
-
-        worker_scores = {}
-
-        for worker_id in genre_worker_ids:
-            worker_id = int(worker_id)  # Ensure workerId is an integer
-
-            if worker_id in final_dataset['workerId'].values:
-                worker_idx = final_dataset[final_dataset['workerId'] == worker_id].index[0]
-
-                # KNN Similarity (convert distance to similarity)
-                for i, idx in enumerate(indices[worker_idx]):
-                    neighbor_id = int(final_dataset.iloc[idx]['workerId'])  # Force integer conversion
-                    similarity = 1 - distances[worker_idx][i]  # Higher similarity is better
-                    worker_scores[neighbor_id] = worker_scores.get(neighbor_id, 0) + (weight_knn * similarity)
-
-        # Get SVD Predicted Ratings
-        for worker_id in list(worker_scores.keys()):  # Ensure we iterate safely
-            worker_id = int(worker_id)  # Force int before prediction
-            predicted_rating = svd.predict(uid=int(user_id), iid=worker_id).est  # Force int for SVD
-            worker_scores[worker_id] += weight_svd * predicted_rating  # Ensure int key
-
-        # Rank workers by final score
-        ranked_workers = sorted(worker_scores.items(), key=lambda x: -x[1])
-
-        # Display the top N workers
-        print(f"Top {top_n} workers in '{genre_name}' using Hybrid (KNN + SVD):")
-        recommendations = []
-        for i, (worker_id, score) in enumerate(ranked_workers[:top_n], 1):
-            worker_id = int(worker_id)  # Ensure correct integer format
-
-            # 🔥 **Fix: Check if worker exists before accessing**
-            worker_row = worker_df.loc[worker_df['workerId'] == worker_id, 'names']
-            if not worker_row.empty:
-                worker_name = worker_row.values[0]  # Get name safely
-            else:
-                worker_name = "Unknown Worker"  # Fallback name
-
-            print(f"{i}. {worker_name} (WorkerID: {worker_id}) - Final Score: {score:.2f}")
-            
-            recommendations.append(service_pb2.WorkerRecommendation(
-                workerId=worker_id,
-                name=worker_name,
-                score=score
-            ))
-            
-        return service_pb2.RecommendationResponse(recommendations=recommendations)
-
-    else:
-        print(f"No workers found for the genre '{genre_name}'.")
-        return service_pb2.RecommendationResponse(recommendations=[])
-
-def get_top_workers_by_genre2(genre_name:str, user_id=1, top_n=8):
-
-    # Find workers in the specified genre
-    workers_in_genre = worker_df[worker_df['genres'].str.contains(genre_name, case=False, na=False)]
-
-    if workers_in_genre.empty:
-        return []
-
-    # Ensure workerId is treated as an integer
-    genre_worker_ids = workers_in_genre['workerId'].astype(int).unique()
-
-    # Get KNN similarities
-    distances, indices = knn.kneighbors(csr_data, n_neighbors=11)
-
-    worker_scores = {}
-
-    for worker_id in genre_worker_ids:
-        worker_id = int(worker_id)
-
-        if worker_id in final_dataset['workerId'].values:
-            worker_idx = final_dataset[final_dataset['workerId'] == worker_id].index[0]
-
-            # KNN Similarity (convert distance to similarity)
-            for i, idx in enumerate(indices[worker_idx]):
-                neighbor_id = int(final_dataset.iloc[idx]['workerId'])
-                similarity = 1 - distances[worker_idx][i]  # Higher similarity is better
-                worker_scores[neighbor_id] = worker_scores.get(neighbor_id, 0) + (WEIGHT_KNN * similarity)
-
-    # Get SVD Predicted Ratings
-    for worker_id in list(worker_scores.keys()):
-        worker_id = int(worker_id)
-        predicted_rating = svd.predict(uid=int(user_id), iid=worker_id).est
-        worker_scores[worker_id] += WEIGHT_SVD * predicted_rating
-
-    # Rank workers by final score
-    ranked_workers = sorted(worker_scores.items(), key=lambda x: -x[1])[:top_n]
-
-    # Build the result list
-    recommendations = []
-    for worker_id, score in ranked_workers:
-        worker_id = int(worker_id)
-
-        # Check if worker exists
-        worker_row = worker_df.loc[worker_df['workerId'] == worker_id, 'names']
-        worker_name = worker_row.values[0] if not worker_row.empty else "Unknown Worker"
-
-        # Create a recommendation object
-        recommendations.append(WorkerRecommendation(workerId=worker_id, name=worker_name, score=score))
-
-    return recommendations
\ No newline at end of file
+    result = get_recommender().recommend(genre_name, user_id, weight_knn, weight_svd, top_n, match_mode)
+    return to_recommendation_response(result)
+
+def get_top_workers_by_genre_grpc(genre_name, user_id=1, weight_knn=WEIGHT_KNN, weight_svd=WEIGHT_SVD, top_n=8,
+                                  match_mode=GENRE_MATCH_MODE):
+    """Get worker recommendations for a specific genre as a protobuf response."""
+    result = get_recommender().recommend(genre_name, user_id, weight_knn, weight_svd, top_n, match_mode)
+    if not len(result):
+        logger.info(f"No workers found for the genre '{genre_name}'.")
+    return to_grpc_response(result)
+
+def get_batch_recommendations_grpc(queries, match_mode=GENRE_MATCH_MODE):
+    """Yield (index, protobuf response) for a list of RecommendationQuery, in completion order."""
+    for index, result in get_recommender().recommend_batch(queries, match_mode):
+        yield index, to_grpc_response(result)
+
+def get_top_workers_by_genre2(genre_name:str, user_id=1, top_n=8, match_mode=GENRE_MATCH_MODE):
+    """Get worker recommendations for a specific genre as dataclasses."""
+    result = get_recommender().recommend(genre_name, user_id, WEIGHT_KNN, WEIGHT_SVD, top_n, match_mode)
+    return to_worker_recommendations(result)
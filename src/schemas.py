@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 from datetime import datetime
+from config import RATING_SCALE
 
 class WorkerRecommendation(BaseModel):
     workerId: int
@@ -10,11 +11,54 @@ class WorkerRecommendation(BaseModel):
 class RecommendationResponse(BaseModel):
     recommendations: List[WorkerRecommendation]
 
+class RatingEvent(BaseModel):
+    userId: int
+    workerId: int
+    rating: float = Field(ge=RATING_SCALE[0], le=RATING_SCALE[1])
+    timestamp: Optional[int] = None  # Epoch seconds; defaults to the time of ingestion
+
+class RatingIngestRequest(BaseModel):
+    ratings: List[RatingEvent]
+
+class RatingIngestResponse(BaseModel):
+    ingested: int  # Ratings folded in, including any other pending ones from the log
+    model_version: str
+    affected_workers: int
+    seconds: float
+
+class GenreCount(BaseModel):
+    genre: str
+    workers: int
+
 class TrainingResponse(BaseModel):
     message: str
     status: str
 
+class TrainingJobStatus(BaseModel):
+    job_id: str
+    state: str  # running, succeeded, failed or cancelled
+    stage: str
+    progress: float  # Fraction of the job's steps completed
+    tasks: Dict[str, str] = {}  # Step each trainer (svd, knn) is on
+    n_factors: Optional[int] = None
+    n_epochs: Optional[int] = None
+    triggers: int  # Trigger calls merged into the job
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    duration_seconds: float
+    version: Optional[str] = None
+    error: Optional[str] = None
+
+class TrainingJobResponse(TrainingResponse):
+    job: TrainingJobStatus
+
 class CacheStatusResponse(BaseModel):
     last_updated: Optional[datetime]
     genres_cached: int
-    is_fresh: bool
\ No newline at end of file
+    is_fresh: bool
+    coalesced_requests: int = 0
+    last_rebuild_mode: Optional[str] = None
+    rebuild_changed_workers: Optional[int] = None
+    last_rebuild_seconds: Optional[float] = None
+    rebuild_shared_seconds: Optional[float] = None
+    rebuild_genre_seconds: Dict[str, float] = {}
\ No newline at end of file
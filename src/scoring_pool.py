@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+from config import SCORING_MAX_WORKERS, SCORING_MAX_QUEUE, SCORING_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class PoolOverloaded(Exception):
+    """Raised when a job is submitted while the pool and its queue are full."""
+
+
+class ScoringPool:
+    """Bounded thread pool that runs CPU-bound scoring off the event loop.
+
+    Threads share the loaded models (the heavy lifting is NumPy, which releases
+    the GIL). At most max_workers jobs run and max_queue more wait; beyond that
+    run() fails fast with PoolOverloaded instead of letting latency pile up.
+    """
+
+    def __init__(self, max_workers: int = SCORING_MAX_WORKERS, max_queue: int = SCORING_MAX_QUEUE,
+                 timeout: Optional[float] = SCORING_TIMEOUT_SECONDS):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scoring")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Jobs currently running or queued."""
+        return self._in_flight
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Submit a job and return its concurrent Future, or raise PoolOverloaded."""
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                raise PoolOverloaded(f"{self._in_flight} scoring jobs in flight")
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(None)
+            raise
+        # Released when the job really finishes (or is cancelled before starting),
+        # not when a caller stops waiting for it
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, timeout: Optional[float] = None, **kwargs):
+        """Run fn in the pool and await it, raising asyncio.TimeoutError after the timeout.
+
+        A job that times out while still queued is cancelled; one that already
+        started runs to completion in the background (threads cannot be killed).
+        timeout=None means the pool's default; a timeout that has already run
+        out (<= 0, e.g. a passed gRPC deadline) fails without submitting.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is not None and timeout <= 0:
+            raise asyncio.TimeoutError("Timeout expired before the job was submitted")
+        future = self.submit(fn, *args, **kwargs)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
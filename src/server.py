@@ -1,47 +1,319 @@
+import asyncio
+import signal
+import sys
 import grpc
 from concurrent import futures
-import threading
+import time
+from typing import Optional
 import service_pb2 as pb2
 import service_pb2_grpc as pb2_grpc
-from models_training import train_svd, train_knn
-from recommendations import get_top_workers_by_genre_grpc
+from ingestion import rating_ingestor
+from catalog import catalog_service
+from training_jobs import TrainingJobManager, TrainingJob, TrainingConflict
+from recommendations import (get_top_workers_by_genre_grpc, get_batch_recommendations_grpc, model_registry,
+                             RecommendationQuery, GenreFilter, canonical_genre)
+from coalescing import SingleFlight
+from scoring_pool import ScoringPool, PoolOverloaded
+from metrics import rpc_metrics, start_http_server
+from config import (WEIGHT_KNN, WEIGHT_SVD, GRPC_SERVER_MODE, GRPC_PORT, GRPC_MAX_WORKERS, GRPC_MAX_CONCURRENT_RPCS,
+                    GRPC_MAX_RECEIVE_MESSAGE_BYTES, GRPC_MAX_SEND_MESSAGE_BYTES, GRPC_SHUTDOWN_GRACE_SECONDS,
+                    GRPC_METRICS_PORT)
+
+
+def query_from_request(request) -> RecommendationQuery:
+    """Map a RecommendationRequest to an engine query, filling unset fields with the defaults."""
+    genre = request.query
+    if request.genres:
+        match = "all" if request.match == pb2.ALL else "any"
+        genre = GenreFilter.of([request.query, *request.genres], match)
+    return RecommendationQuery(
+        genre=genre,
+        user_id=request.user_id if request.HasField("user_id") else 1,
+        top_n=request.top_n if request.HasField("top_n") else 8,
+        weight_knn=request.weight_knn if request.HasField("weight_knn") else WEIGHT_KNN,
+        weight_svd=request.weight_svd if request.HasField("weight_svd") else WEIGHT_SVD,
+    )
+
+def query_error(queries) -> Optional[str]:
+    """Return why a list of queries is invalid, or None."""
+    for query in queries:
+        if query.top_n < 0:
+            return f"top_n must be >= 0, got {query.top_n}"
+    return None
+
+def batch_response(queries) -> pb2.BatchRecommendationResponse:
+    """Score a batch and return its results in request order."""
+    results = [None] * len(queries)
+    for index, response in get_batch_recommendations_grpc(queries):
+        results[index] = pb2.RecommendationResult(index=index, response=response)
+    return pb2.BatchRecommendationResponse(results=results)
+
+def ingest_ratings(request) -> pb2.IngestRatingsResponse:
+    """Log and fold in the ratings of an IngestRatingsRequest (raises ValueError for invalid ones)."""
+    now = int(time.time())
+    update = rating_ingestor.ingest(
+        [item.user_id for item in request.ratings], [item.worker_id for item in request.ratings],
+        [item.rating for item in request.ratings],
+        [item.timestamp if item.HasField("timestamp") else now for item in request.ratings],
+    )
+    if update is None:
+        return pb2.IngestRatingsResponse(ingested=0, model_version=model_registry.version)
+    return pb2.IngestRatingsResponse(ingested=update.ratings, model_version=update.snapshot.version,
+                                     affected_workers=len(update.worker_ids))
+
+# One training job at a time; repeated triggers join the running one
+training_jobs = TrainingJobManager(model_registry)
+
+def training_job_message(job: TrainingJob, merged: bool = False) -> pb2.TrainingJob:
+    message = pb2.TrainingJob(
+        job_id=job.job_id, state=job.state, stage=job.stage, progress=job.progress, tasks=job.tasks,
+        triggers=job.triggers, started_at=int(job.started_at.timestamp()), duration_seconds=job.duration_seconds,
+        version=job.version or "", error=job.error or "", merged=merged,
+    )
+    if job.n_factors is not None:
+        message.n_factors = job.n_factors
+    if job.n_epochs is not None:
+        message.n_epochs = job.n_epochs
+    return message
+
+def submit_training(request) -> pb2.TrainingJob:
+    """Start or join a training job (raises ValueError or TrainingConflict)."""
+    job, merged = training_jobs.submit(
+        request.n_factors if request.HasField("n_factors") else None,
+        request.n_epochs if request.HasField("n_epochs") else None,
+    )
+    return training_job_message(job, merged)
+
+def start_metrics_server():
+    if GRPC_METRICS_PORT is not None:
+        start_http_server(GRPC_METRICS_PORT)
+        print(f"Metrics available on port {GRPC_METRICS_PORT} at /metrics")
+
+def server_options():
+    return [
+        ('grpc.max_receive_message_length', GRPC_MAX_RECEIVE_MESSAGE_BYTES),
+        ('grpc.max_send_message_length', GRPC_MAX_SEND_MESSAGE_BYTES),
+    ]
 
 class RecommendationService(pb2_grpc.LongServiceServicer):
+    def __init__(self):
+        # Concurrent requests for the same genre share a single computation
+        self.recommendation_flights = SingleFlight("grpc-recommendations")
+
+    @rpc_metrics("GetWorkerRecommendations")
     def GetWorkerRecommendations(self, request, context):
         """Handle worker recommendations."""
-        genre_name = request.query
-        print(f"Received recommendation request for genre: {genre_name}")
+        query = query_from_request(request)
+        error = query_error([query])
+        if error:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, error)
+        print(f"Received recommendation request for genre: {query.genre}")
 
-        response = get_top_workers_by_genre_grpc(genre_name)
+        key = (canonical_genre(query.genre), query.user_id, query.top_n, query.weight_knn, query.weight_svd)
+        response = self.recommendation_flights.do(
+            key, get_top_workers_by_genre_grpc, query.genre, query.user_id, query.weight_knn,
+            query.weight_svd, query.top_n,
+        )
         return response
 
+    @rpc_metrics("BatchGetWorkerRecommendations")
+    def BatchGetWorkerRecommendations(self, request, context):
+        """Handle many recommendation queries in one call, sharing work across them."""
+        queries = [query_from_request(item) for item in request.requests]
+        error = query_error(queries)
+        if error:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, error)
+        print(f"Received batch recommendation request with {len(queries)} queries")
+        return batch_response(queries)
+
+    @rpc_metrics("StreamWorkerRecommendations")
+    def StreamWorkerRecommendations(self, request, context):
+        """Like the batch RPC, but send every result as soon as it is scored."""
+        queries = [query_from_request(item) for item in request.requests]
+        error = query_error(queries)
+        if error:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, error)
+        print(f"Received streaming recommendation request with {len(queries)} queries")
+
+        for index, response in get_batch_recommendations_grpc(queries):
+            if not context.is_active():
+                print("Client went away, stopping the stream")
+                return
+            yield pb2.RecommendationResult(index=index, response=response)
+
+    @rpc_metrics("IngestRatings")
+    def IngestRatings(self, request, context):
+        """Log ratings and fold them into the serving models."""
+        print(f"Received {len(request.ratings)} ratings")
+        try:
+            return ingest_ratings(request)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+    @rpc_metrics("RunModelTraining")
     def RunModelTraining(self, request, context):
-        """Trigger background model training."""
+        """Trigger background model training, or join the running job."""
         print("Training triggered via gRPC...")
+        try:
+            return submit_training(request)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except TrainingConflict as e:
+            context.abort(grpc.StatusCode.ALREADY_EXISTS, str(e))
+
+    @rpc_metrics("GetTrainingStatus")
+    def GetTrainingStatus(self, request, context):
+        """Report a training job's stage, progress and duration."""
+        job = training_jobs.get(request.job_id)
+        if job is None:
+            context.abort(grpc.StatusCode.NOT_FOUND, f"Unknown training job {request.job_id}")
+        return training_job_message(job)
+
+    @rpc_metrics("CancelModelTraining")
+    def CancelModelTraining(self, request, context):
+        """Cancel a training job (the running one by default)."""
+        job = training_jobs.cancel(request.job_id)
+        if job is None:
+            context.abort(grpc.StatusCode.NOT_FOUND, f"Unknown training job {request.job_id}")
+        return training_job_message(job)
 
-        # Run training in a separate thread
-        threading.Thread(target=self.do_training).start()
 
-        return pb2.Empty()
+class AsyncRecommendationService(pb2_grpc.LongServiceServicer):
+    """grpc.aio servicer: handlers stay on the event loop and scoring runs in a bounded pool.
 
-    def do_training(self):
-        """Run both models in sequence."""
+    Each call owns its pool job (no coalescing), so when the client's deadline
+    passes or the call is cancelled, a job that has not started yet is dropped.
+    """
+
+    def __init__(self, scoring_pool: ScoringPool):
+        self.scoring_pool = scoring_pool
+
+    async def _run(self, context, fn, *args):
+        """Run fn in the scoring pool within the call's deadline, mapping failures to status codes."""
         try:
-            train_svd()
-            train_knn()
-            print("Model training completed!")
-        except Exception as e:
-            print(f"Error during training: {e}")
+            # None without a deadline; 0 or less once it has passed, which fails right away
+            return await self.scoring_pool.run(fn, *args, timeout=context.time_remaining())
+        except PoolOverloaded:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Too many recommendation requests in progress")
+        except asyncio.TimeoutError:
+            await context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, "Deadline exceeded while scoring")
+
+    async def _queries(self, requests, context):
+        queries = [query_from_request(item) for item in requests]
+        error = query_error(queries)
+        if error:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, error)
+        return queries
+
+    @rpc_metrics("GetWorkerRecommendations")
+    async def GetWorkerRecommendations(self, request, context):
+        """Handle worker recommendations."""
+        query, = await self._queries([request], context)
+        print(f"Received recommendation request for genre: {query.genre}")
+        return await self._run(context, get_top_workers_by_genre_grpc, query.genre, query.user_id,
+                               query.weight_knn, query.weight_svd, query.top_n)
+
+    @rpc_metrics("BatchGetWorkerRecommendations")
+    async def BatchGetWorkerRecommendations(self, request, context):
+        """Handle many recommendation queries in one call, sharing work across them."""
+        queries = await self._queries(request.requests, context)
+        print(f"Received batch recommendation request with {len(queries)} queries")
+        return await self._run(context, batch_response, queries)
+
+    @rpc_metrics("StreamWorkerRecommendations")
+    async def StreamWorkerRecommendations(self, request, context):
+        """Like the batch RPC, but send every result as soon as it is scored."""
+        queries = await self._queries(request.requests, context)
+        print(f"Received streaming recommendation request with {len(queries)} queries")
+
+        # Each step of the engine's generator is its own pool job, checked against the deadline
+        results = get_batch_recommendations_grpc(queries)
+        while True:
+            item = await self._run(context, next, results, None)
+            if item is None:
+                return
+            index, response = item
+            yield pb2.RecommendationResult(index=index, response=response)
+
+    @rpc_metrics("IngestRatings")
+    async def IngestRatings(self, request, context):
+        """Log ratings and fold them into the serving models (in a thread, not the scoring pool)."""
+        print(f"Received {len(request.ratings)} ratings")
+        try:
+            return await asyncio.to_thread(ingest_ratings, request)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+    @rpc_metrics("RunModelTraining")
+    async def RunModelTraining(self, request, context):
+        """Trigger background model training, or join the running job."""
+        print("Training triggered via gRPC...")
+        try:
+            return submit_training(request)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except TrainingConflict as e:
+            await context.abort(grpc.StatusCode.ALREADY_EXISTS, str(e))
+
+    @rpc_metrics("GetTrainingStatus")
+    async def GetTrainingStatus(self, request, context):
+        """Report a training job's stage, progress and duration."""
+        job = training_jobs.get(request.job_id)
+        if job is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"Unknown training job {request.job_id}")
+        return training_job_message(job)
+
+    @rpc_metrics("CancelModelTraining")
+    async def CancelModelTraining(self, request, context):
+        """Cancel a training job (the running one by default)."""
+        job = training_jobs.cancel(request.job_id)
+        if job is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"Unknown training job {request.job_id}")
+        return training_job_message(job)
 
 
 def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=GRPC_MAX_WORKERS), options=server_options())
     pb2_grpc.add_LongServiceServicer_to_server(RecommendationService(), server)
     
-    server.add_insecure_port('[::]:50051')
-    print("Server is running on port 50051...")
+    server.add_insecure_port(f'[::]:{GRPC_PORT}')
+    start_metrics_server()
+    catalog_service.start()
+    rating_ingestor.start()
+    print(f"Server is running on port {GRPC_PORT}...")
     server.start()
     server.wait_for_termination()
 
+async def serve_aio():
+    """Run the asyncio server until SIGTERM/SIGINT, then drain in-flight calls."""
+    scoring_pool = ScoringPool(max_workers=GRPC_MAX_WORKERS, max_queue=GRPC_MAX_CONCURRENT_RPCS, timeout=None)
+    server = grpc.aio.server(maximum_concurrent_rpcs=GRPC_MAX_CONCURRENT_RPCS, options=server_options())
+    pb2_grpc.add_LongServiceServicer_to_server(AsyncRecommendationService(scoring_pool), server)
+
+    server.add_insecure_port(f'[::]:{GRPC_PORT}')
+    await asyncio.to_thread(catalog_service.start)
+    await asyncio.to_thread(rating_ingestor.start)
+    await server.start()
+    start_metrics_server()
+    print(f"Async server is running on port {GRPC_PORT}...")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+    await stopping.wait()
+
+    # New calls are rejected right away; in-flight ones get the grace period to finish
+    print(f"Shutting down, draining in-flight calls for up to {GRPC_SHUTDOWN_GRACE_SECONDS}s...")
+    await server.stop(GRPC_SHUTDOWN_GRACE_SECONDS)
+    rating_ingestor.stop()
+    scoring_pool.shutdown(wait=False)
+    print("Server stopped")
+
 if __name__ == '__main__':
-    serve()
+    # python server.py [sync|aio]
+    mode = sys.argv[1] if len(sys.argv) > 1 else GRPC_SERVER_MODE
+    if mode == "aio":
+        asyncio.run(serve_aio())
+    else:
+        serve()
@@ -24,21 +24,45 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rservice.proto\"&\n\x15RecommendationRequest\x12\r\n\x05query\x18\x01 \x01(\t\"H\n\x16RecommendationResponse\x12.\n\x0frecommendations\x18\x01 \x03(\x0b\x32\x15.WorkerRecommendation\"E\n\x14WorkerRecommendation\x12\x10\n\x08workerId\x18\x01 \x01(\x03\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\r\n\x05score\x18\x03 \x01(\x02\"\x07\n\x05\x45mpty2~\n\x0bLongService\x12K\n\x18GetWorkerRecommendations\x12\x16.RecommendationRequest\x1a\x17.RecommendationResponse\x12\"\n\x10RunModelTraining\x12\x06.Empty\x1a\x06.Emptyb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rservice.proto\"\xe2\x01\n\x15RecommendationRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\x14\n\x07user_id\x18\x02 \x01(\x03H\x00\x88\x01\x01\x12\x12\n\x05top_n\x18\x03 \x01(\x05H\x01\x88\x01\x01\x12\x17\n\nweight_knn\x18\x04 \x01(\x02H\x02\x88\x01\x01\x12\x17\n\nweight_svd\x18\x05 \x01(\x02H\x03\x88\x01\x01\x12\x0e\n\x06genres\x18\x06 \x03(\t\x12\x1a\n\x05match\x18\x07 \x01(\x0e\x32\x0b.GenreMatchB\n\n\x08_user_idB\x08\n\x06_top_nB\r\n\x0b_weight_knnB\r\n\x0b_weight_svd\"H\n\x16RecommendationResponse\x12.\n\x0frecommendations\x18\x01 \x03(\x0b\x32\x15.WorkerRecommendation\"E\n\x14WorkerRecommendation\x12\x10\n\x08workerId\x18\x01 \x01(\x03\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\r\n\x05score\x18\x03 \x01(\x02\"F\n\x1a\x42\x61tchRecommendationRequest\x12(\n\x08requests\x18\x01 \x03(\x0b\x32\x16.RecommendationRequest\"P\n\x14RecommendationResult\x12\r\n\x05index\x18\x01 \x01(\x05\x12)\n\x08response\x18\x02 \x01(\x0b\x32\x17.RecommendationResponse\"E\n\x1b\x42\x61tchRecommendationResponse\x12&\n\x07results\x18\x01 \x03(\x0b\x32\x15.RecommendationResult\"b\n\x06Rating\x12\x0f\n\x07user_id\x18\x01 \x01(\x03\x12\x11\n\tworker_id\x18\x02 \x01(\x03\x12\x0e\n\x06rating\x18\x03 \x01(\x02\x12\x16\n\ttimestamp\x18\x04 \x01(\x03H\x00\x88\x01\x01\x42\x0c\n\n_timestamp\"0\n\x14IngestRatingsRequest\x12\x18\n\x07ratings\x18\x01 \x03(\x0b\x32\x07.Rating\"Z\n\x15IngestRatingsResponse\x12\x10\n\x08ingested\x18\x01 \x01(\x05\x12\x15\n\rmodel_version\x18\x02 \x01(\t\x12\x18\n\x10\x61\x66\x66\x65\x63ted_workers\x18\x03 \x01(\x05\"[\n\x0fTrainingRequest\x12\x16\n\tn_factors\x18\x01 \x01(\x05H\x00\x88\x01\x01\x12\x15\n\x08n_epochs\x18\x02 \x01(\x05H\x01\x88\x01\x01\x42\x0c\n\n_n_factorsB\x0b\n\t_n_epochs\"$\n\x12TrainingJobRequest\x12\x0e\n\x06job_id\x18\x01 \x01(\t\"\xdd\x02\n\x0bTrainingJob\x12\x0e\n\x06job_id\x18\x01 \x01(\t\x12\r\n\x05state\x18\x02 \x01(\t\x12\r\n\x05stage\x18\x03 \x01(\t\x12\x10\n\x08progress\x18\x04 \x01(\x01\x12&\n\x05tasks\x18\x05 \x03(\x0b\x32\x17.TrainingJob.TasksEntry\x12\x16\n\tn_factors\x18\x06 \x01(\x05H\x00\x88\x01\x01\x12\x15\n\x08n_epochs\x18\x07 \x01(\x05H\x01\x88\x01\x01\x12\x10\n\x08triggers\x18\x08 \x01(\x05\x12\x12\n\nstarted_at\x18\t \x01(\x03\x12\x18\n\x10\x64uration_seconds\x18\n \x01(\x01\x12\x0f\n\x07version\x18\x0b \x01(\t\x12\r\n\x05\x65rror\x18\x0c \x01(\t\x12\x0e\n\x06merged\x18\r \x01(\x08\x1a,\n\nTasksEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\x42\x0c\n\n_n_factorsB\x0b\n\t_n_epochs\"\x07\n\x05\x45mpty*\x1e\n\nGenreMatch\x12\x07\n\x03\x41NY\x10\x00\x12\x07\n\x03\x41LL\x10\x01\x32\xf1\x03\n\x0bLongService\x12K\n\x18GetWorkerRecommendations\x12\x16.RecommendationRequest\x1a\x17.RecommendationResponse\x12\x32\n\x10RunModelTraining\x12\x10.TrainingRequest\x1a\x0c.TrainingJob\x12Z\n\x1d\x42\x61tchGetWorkerRecommendations\x12\x1b.BatchRecommendationRequest\x1a\x1c.BatchRecommendationResponse\x12S\n\x1bStreamWorkerRecommendations\x12\x1b.BatchRecommendationRequest\x1a\x15.RecommendationResult0\x01\x12>\n\rIngestRatings\x12\x15.IngestRatingsRequest\x1a\x16.IngestRatingsResponse\x12\x36\n\x11GetTrainingStatus\x12\x13.TrainingJobRequest\x1a\x0c.TrainingJob\x12\x38\n\x13\x43\x61ncelModelTraining\x12\x13.TrainingJobRequest\x1a\x0c.TrainingJobb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'service_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_RECOMMENDATIONREQUEST']._serialized_start=17
-  _globals['_RECOMMENDATIONREQUEST']._serialized_end=55
-  _globals['_RECOMMENDATIONRESPONSE']._serialized_start=57
-  _globals['_RECOMMENDATIONRESPONSE']._serialized_end=129
-  _globals['_WORKERRECOMMENDATION']._serialized_start=131
-  _globals['_WORKERRECOMMENDATION']._serialized_end=200
-  _globals['_EMPTY']._serialized_start=202
-  _globals['_EMPTY']._serialized_end=209
-  _globals['_LONGSERVICE']._serialized_start=211
-  _globals['_LONGSERVICE']._serialized_end=337
+  _globals['_TRAININGJOB_TASKSENTRY']._loaded_options = None
+  _globals['_TRAININGJOB_TASKSENTRY']._serialized_options = b'8\001'
+  _globals['_GENREMATCH']._serialized_start=1350
+  _globals['_GENREMATCH']._serialized_end=1380
+  _globals['_RECOMMENDATIONREQUEST']._serialized_start=18
+  _globals['_RECOMMENDATIONREQUEST']._serialized_end=244
+  _globals['_RECOMMENDATIONRESPONSE']._serialized_start=246
+  _globals['_RECOMMENDATIONRESPONSE']._serialized_end=318
+  _globals['_WORKERRECOMMENDATION']._serialized_start=320
+  _globals['_WORKERRECOMMENDATION']._serialized_end=389
+  _globals['_BATCHRECOMMENDATIONREQUEST']._serialized_start=391
+  _globals['_BATCHRECOMMENDATIONREQUEST']._serialized_end=461
+  _globals['_RECOMMENDATIONRESULT']._serialized_start=463
+  _globals['_RECOMMENDATIONRESULT']._serialized_end=543
+  _globals['_BATCHRECOMMENDATIONRESPONSE']._serialized_start=545
+  _globals['_BATCHRECOMMENDATIONRESPONSE']._serialized_end=614
+  _globals['_RATING']._serialized_start=616
+  _globals['_RATING']._serialized_end=714
+  _globals['_INGESTRATINGSREQUEST']._serialized_start=716
+  _globals['_INGESTRATINGSREQUEST']._serialized_end=764
+  _globals['_INGESTRATINGSRESPONSE']._serialized_start=766
+  _globals['_INGESTRATINGSRESPONSE']._serialized_end=856
+  _globals['_TRAININGREQUEST']._serialized_start=858
+  _globals['_TRAININGREQUEST']._serialized_end=949
+  _globals['_TRAININGJOBREQUEST']._serialized_start=951
+  _globals['_TRAININGJOBREQUEST']._serialized_end=987
+  _globals['_TRAININGJOB']._serialized_start=990
+  _globals['_TRAININGJOB']._serialized_end=1339
+  _globals['_TRAININGJOB_TASKSENTRY']._serialized_start=1268
+  _globals['_TRAININGJOB_TASKSENTRY']._serialized_end=1312
+  _globals['_EMPTY']._serialized_start=1341
+  _globals['_EMPTY']._serialized_end=1348
+  _globals['_LONGSERVICE']._serialized_start=1383
+  _globals['_LONGSERVICE']._serialized_end=1880
 # @@protoc_insertion_point(module_scope)
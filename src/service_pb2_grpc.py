@@ -41,8 +41,33 @@ class LongServiceStub(object):
                 _registered_method=True)
         self.RunModelTraining = channel.unary_unary(
                 '/LongService/RunModelTraining',
-                request_serializer=service__pb2.Empty.SerializeToString,
-                response_deserializer=service__pb2.Empty.FromString,
+                request_serializer=service__pb2.TrainingRequest.SerializeToString,
+                response_deserializer=service__pb2.TrainingJob.FromString,
+                _registered_method=True)
+        self.BatchGetWorkerRecommendations = channel.unary_unary(
+                '/LongService/BatchGetWorkerRecommendations',
+                request_serializer=service__pb2.BatchRecommendationRequest.SerializeToString,
+                response_deserializer=service__pb2.BatchRecommendationResponse.FromString,
+                _registered_method=True)
+        self.StreamWorkerRecommendations = channel.unary_stream(
+                '/LongService/StreamWorkerRecommendations',
+                request_serializer=service__pb2.BatchRecommendationRequest.SerializeToString,
+                response_deserializer=service__pb2.RecommendationResult.FromString,
+                _registered_method=True)
+        self.IngestRatings = channel.unary_unary(
+                '/LongService/IngestRatings',
+                request_serializer=service__pb2.IngestRatingsRequest.SerializeToString,
+                response_deserializer=service__pb2.IngestRatingsResponse.FromString,
+                _registered_method=True)
+        self.GetTrainingStatus = channel.unary_unary(
+                '/LongService/GetTrainingStatus',
+                request_serializer=service__pb2.TrainingJobRequest.SerializeToString,
+                response_deserializer=service__pb2.TrainingJob.FromString,
+                _registered_method=True)
+        self.CancelModelTraining = channel.unary_unary(
+                '/LongService/CancelModelTraining',
+                request_serializer=service__pb2.TrainingJobRequest.SerializeToString,
+                response_deserializer=service__pb2.TrainingJob.FromString,
                 _registered_method=True)
 
 
@@ -56,6 +81,40 @@ class LongServiceServicer(object):
         raise NotImplementedError('Method not implemented!')
 
     def RunModelTraining(self, request, context):
+        """Start a training job, or join the running one (an empty request, like the old Empty, uses the defaults)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchGetWorkerRecommendations(self, request, context):
+        """Many queries in one round trip; results come back in request order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamWorkerRecommendations(self, request, context):
+        """Same as the batch RPC, but each result is sent as soon as it is ready
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def IngestRatings(self, request, context):
+        """Log ratings and fold them into the serving models without retraining
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetTrainingStatus(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def CancelModelTraining(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
@@ -71,8 +130,33 @@ def add_LongServiceServicer_to_server(servicer, server):
             ),
             'RunModelTraining': grpc.unary_unary_rpc_method_handler(
                     servicer.RunModelTraining,
-                    request_deserializer=service__pb2.Empty.FromString,
-                    response_serializer=service__pb2.Empty.SerializeToString,
+                    request_deserializer=service__pb2.TrainingRequest.FromString,
+                    response_serializer=service__pb2.TrainingJob.SerializeToString,
+            ),
+            'BatchGetWorkerRecommendations': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchGetWorkerRecommendations,
+                    request_deserializer=service__pb2.BatchRecommendationRequest.FromString,
+                    response_serializer=service__pb2.BatchRecommendationResponse.SerializeToString,
+            ),
+            'StreamWorkerRecommendations': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamWorkerRecommendations,
+                    request_deserializer=service__pb2.BatchRecommendationRequest.FromString,
+                    response_serializer=service__pb2.RecommendationResult.SerializeToString,
+            ),
+            'IngestRatings': grpc.unary_unary_rpc_method_handler(
+                    servicer.IngestRatings,
+                    request_deserializer=service__pb2.IngestRatingsRequest.FromString,
+                    response_serializer=service__pb2.IngestRatingsResponse.SerializeToString,
+            ),
+            'GetTrainingStatus': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetTrainingStatus,
+                    request_deserializer=service__pb2.TrainingJobRequest.FromString,
+                    response_serializer=service__pb2.TrainingJob.SerializeToString,
+            ),
+            'CancelModelTraining': grpc.unary_unary_rpc_method_handler(
+                    servicer.CancelModelTraining,
+                    request_deserializer=service__pb2.TrainingJobRequest.FromString,
+                    response_serializer=service__pb2.TrainingJob.SerializeToString,
             ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
@@ -127,8 +211,143 @@ class LongService(object):
             request,
             target,
             '/LongService/RunModelTraining',
-            service__pb2.Empty.SerializeToString,
-            service__pb2.Empty.FromString,
+            service__pb2.TrainingRequest.SerializeToString,
+            service__pb2.TrainingJob.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchGetWorkerRecommendations(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/LongService/BatchGetWorkerRecommendations',
+            service__pb2.BatchRecommendationRequest.SerializeToString,
+            service__pb2.BatchRecommendationResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def StreamWorkerRecommendations(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/LongService/StreamWorkerRecommendations',
+            service__pb2.BatchRecommendationRequest.SerializeToString,
+            service__pb2.RecommendationResult.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def IngestRatings(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/LongService/IngestRatings',
+            service__pb2.IngestRatingsRequest.SerializeToString,
+            service__pb2.IngestRatingsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetTrainingStatus(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/LongService/GetTrainingStatus',
+            service__pb2.TrainingJobRequest.SerializeToString,
+            service__pb2.TrainingJob.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def CancelModelTraining(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/LongService/CancelModelTraining',
+            service__pb2.TrainingJobRequest.SerializeToString,
+            service__pb2.TrainingJob.FromString,
             options,
             channel_credentials,
             insecure,
@@ -0,0 +1,167 @@
+import numpy as np
+from config import RATING_SCALE, ONLINE_SGD_EPOCHS, ONLINE_SGD_LR, ONLINE_SGD_REG, ONLINE_SGD_MAX_RATINGS
+from worker_index import IdLookup
+
+UNKNOWN = -1
+INIT_STD_DEV = 0.1  # surprise's init_std_dev for new factors
+
+
+def _sgd_fold_in(factors, biases, fixed_factors, fixed_biases, own, other, ratings, global_mean: float,
+                 biased: bool, n_epochs: int, lr: float, reg: float, max_ratings: int, rng):
+    """Update factors[own] and biases[own] in place by SGD over (own, other, rating) triples.
+
+    The other side's factors stay fixed, so every row is independent: step j
+    updates all rows with their j-th rating at once. Rows with more than
+    max_ratings ratings use a random sample of them.
+    """
+    order = rng.permutation(len(own))
+    order = order[np.argsort(own[order], kind='stable')]
+    own, other, ratings = own[order], other[order], ratings[order]
+    starts = np.flatnonzero(np.r_[True, own[1:] != own[:-1]])
+    rank = np.arange(len(own)) - np.repeat(starts, np.diff(np.r_[starts, len(own)]))
+    steps = [np.flatnonzero(rank == j) for j in range(min(int(rank.max(initial=-1)) + 1, max_ratings))]
+
+    for _ in range(n_epochs):
+        for step in steps:
+            rows, partners = own[step], other[step]
+            dot = np.einsum('ij,ij->i', factors[rows], fixed_factors[partners])
+            if biased:
+                err = ratings[step] - (global_mean + biases[rows] + fixed_biases[partners] + dot)
+                biases[rows] += lr * (err - reg * biases[rows])
+            else:
+                err = ratings[step] - dot
+            factors[rows] += lr * (err[:, None] * fixed_factors[partners] - reg * factors[rows])
+
+
+class BatchSVDScorer:
+    """Vectorized equivalent of ``svd.predict(uid, iid).est`` for many items at once.
+
+    The factors, biases and global mean are pulled out of a trained surprise SVD
+    once, so scoring a candidate vector is a single NumPy expression instead of
+    one raw-to-inner id translation and Prediction tuple per item.
+    """
+
+    def __init__(self, pu, qi, bu, bi, global_mean: float, user_ids, item_ids,
+                 biased: bool = True, rating_scale=RATING_SCALE):
+        self.pu = pu
+        self.qi = qi
+        self.bu = bu
+        self.bi = bi
+        self.global_mean = float(global_mean)
+        self.biased = bool(biased)
+        self.rating_scale = tuple(rating_scale)
+        # Raw ids in inner id order, so the lookup position is the inner id
+        self.users = IdLookup(user_ids)
+        self.items = IdLookup(item_ids)
+
+    @classmethod
+    def from_svd(cls, svd, rating_scale=RATING_SCALE):
+        """Extract the scoring state from a trained surprise SVD."""
+        trainset = svd.trainset
+        user_ids = [trainset.to_raw_uid(inner) for inner in range(trainset.n_users)]
+        item_ids = [trainset.to_raw_iid(inner) for inner in range(trainset.n_items)]
+        return cls(svd.pu, svd.qi, svd.bu, svd.bi, trainset.global_mean, user_ids, item_ids,
+                   biased=svd.biased, rating_scale=rating_scale)
+
+    def fold_in(self, rating_matrix, user_ids, item_ids, n_epochs: int = ONLINE_SGD_EPOCHS,
+                lr: float = ONLINE_SGD_LR, reg: float = ONLINE_SGD_REG, max_ratings: int = ONLINE_SGD_MAX_RATINGS,
+                random_state=None) -> "BatchSVDScorer":
+        """Return a scorer with the given users' and items' factors refit against rating_matrix.
+
+        Only those rows move, by a few SGD epochs over their own ratings: the
+        users first with item factors fixed, then the items with user factors
+        fixed. Ids the model has never seen get new rows, initialized like
+        surprise does. The other factors, the global mean and this scorer stay
+        untouched (a copy is updated), so snapshots still using it are safe.
+        """
+        rng = np.random.default_rng(random_state)
+        user_ids = np.unique(np.asarray(user_ids, dtype=np.int64))
+        item_ids = np.unique(np.asarray(item_ids, dtype=np.int64))
+        new_users = user_ids[self.inner_users(user_ids) == UNKNOWN]
+        new_items = item_ids[self.inner_items(item_ids) == UNKNOWN]
+        n_factors = self.pu.shape[1]
+        scorer = BatchSVDScorer(
+            pu=np.vstack([self.pu, rng.normal(0, INIT_STD_DEV, (len(new_users), n_factors))]),
+            qi=np.vstack([self.qi, rng.normal(0, INIT_STD_DEV, (len(new_items), n_factors))]),
+            bu=np.concatenate([self.bu, np.zeros(len(new_users))]),
+            bi=np.concatenate([self.bi, np.zeros(len(new_items))]),
+            global_mean=self.global_mean,
+            user_ids=np.concatenate([self.users.ids, new_users]),
+            item_ids=np.concatenate([self.items.ids, new_items]),
+            biased=self.biased, rating_scale=self.rating_scale,
+        )
+
+        matrix = rating_matrix.matrix
+        user_columns = IdLookup(rating_matrix.user_ids).positions_for(user_ids)
+        item_rows = IdLookup(rating_matrix.worker_ids).positions_for(item_ids)
+        fit = dict(global_mean=self.global_mean, biased=self.biased, n_epochs=n_epochs, lr=lr, reg=reg,
+                   max_ratings=max_ratings, rng=rng)
+
+        # Users: every rating in their columns
+        ratings = matrix[:, user_columns[user_columns >= 0]].tocoo()
+        users = scorer.inner_users(rating_matrix.user_ids[user_columns[user_columns >= 0]][ratings.col])
+        items = scorer.inner_items(rating_matrix.worker_ids[ratings.row])
+        known = items != UNKNOWN
+        if known.any():
+            _sgd_fold_in(scorer.pu, scorer.bu, scorer.qi, scorer.bi, users[known], items[known],
+                         ratings.data[known], **fit)
+
+        # Items: every rating in their rows
+        ratings = matrix[item_rows[item_rows >= 0]].tocoo()
+        items = scorer.inner_items(rating_matrix.worker_ids[item_rows[item_rows >= 0]][ratings.row])
+        users = scorer.inner_users(rating_matrix.user_ids[ratings.col])
+        known = users != UNKNOWN
+        if known.any():
+            _sgd_fold_in(scorer.qi, scorer.bi, scorer.pu, scorer.bu, items[known], users[known],
+                         ratings.data[known], **fit)
+        return scorer
+
+    def inner_user(self, user_id) -> int:
+        """Return the inner id of a raw user id, or UNKNOWN."""
+        return self.users.position_for(user_id)
+
+    def inner_items(self, item_ids) -> np.ndarray:
+        """Return the inner ids of raw item ids, UNKNOWN for items the model never saw."""
+        return self.items.positions_for(item_ids)
+
+    def inner_users(self, user_ids) -> np.ndarray:
+        """Return the inner ids of raw user ids, UNKNOWN for users the model never saw."""
+        return self.users.positions_for(user_ids)
+
+    def score(self, user_id, item_ids) -> np.ndarray:
+        """Predict the ratings of one raw user id for a sequence of raw item ids."""
+        return self.score_inner(self.inner_user(user_id), self.inner_items(item_ids))
+
+    def score_many(self, user_ids, item_ids) -> np.ndarray:
+        """Predict a (users, items) rating matrix from raw ids."""
+        return self.score_inner_many(self.inner_users(user_ids), self.inner_items(item_ids))
+
+    def score_inner(self, inner_user: int, inner_items) -> np.ndarray:
+        """Predict ratings of one user from inner ids (a one-row score_inner_many)."""
+        return self.score_inner_many([inner_user], inner_items)[0]
+
+    def score_inner_many(self, inner_users, inner_items) -> np.ndarray:
+        """Predict a (users, items) rating matrix from inner ids with one factor product.
+
+        Unknown users and items are handled like surprise does.
+        """
+        inner_users = np.asarray(inner_users, dtype=np.int64)
+        inner_items = np.asarray(inner_items, dtype=np.int64)
+        known_users = inner_users != UNKNOWN
+        known_items = inner_items != UNKNOWN
+        users = inner_users[known_users]
+        items = inner_items[known_items]
+        known_pairs = np.ix_(known_users, known_items)
+
+        # Unbiased SVD falls back to the default prediction (the global mean)
+        est = np.full((len(inner_users), len(inner_items)), self.global_mean, dtype=np.float64)
+        if self.biased:
+            # Same accumulation order as SVD.estimate: mean, user bias, item bias, dot product
+            est[known_users] += self.bu[users][:, None]
+            est[:, known_items] += self.bi[items]
+            est[known_pairs] += self.pu[users] @ self.qi[items].T
+        else:
+            est[known_pairs] = self.pu[users] @ self.qi[items].T
+
+        lower_bound, higher_bound = self.rating_scale
+        return np.clip(est, lower_bound, higher_bound)
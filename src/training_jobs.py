@@ -0,0 +1,296 @@
+"""Background model training jobs.
+
+At most one training job runs at a time: triggers that arrive while one is
+running are merged into it rather than starting another, and a file lock
+extends this to every process sharing the artifacts folder (the REST and gRPC
+servers). The process holding the lock records its job's state in the lock
+file, so the others merge triggers into it and report it in status lookups.
+A job loads the ratings, fits SVD and KNN in parallel child
+processes (models_training.train_models), publishes the new artifact version
+and swaps it into the registry, reporting its stage and progress on the way.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from artifacts import new_version_folder, publish_version
+from data_processing import load_ratings
+from model_registry import ModelRegistry
+from models_training import TRAINING_STEPS, TrainingCancelled, train_models
+from metrics import TRAINING_SECONDS, TRAINING_RUNS
+from config import ARTIFACTS_FOLDER, TRAINING_LOCK_FILE, TRAINING_JOB_HISTORY
+
+logger = logging.getLogger(__name__)
+
+JOB_STATES = ("running", "succeeded", "failed", "cancelled")
+# load_ratings, every trainer step, publish and reload
+TOTAL_STEPS = 1 + sum(len(steps) for steps in TRAINING_STEPS.values()) + 2
+
+
+class TrainingConflict(Exception):
+    """A training job that cannot be merged with the new trigger is already running."""
+
+
+@dataclass
+class TrainingJob:
+    """State of one training job; updated in place by the thread running it."""
+    job_id: str
+    n_factors: Optional[int] = None
+    n_epochs: Optional[int] = None
+    state: str = "running"
+    stage: str = "queued"  # queued, load_ratings, train, publish, reload, finished
+    tasks: Dict[str, str] = field(default_factory=dict)  # Trainer -> step it is on
+    steps_done: int = 0
+    triggers: int = 1  # Trigger calls merged into this job, the first one included
+    started_at: datetime = field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+    version: Optional[str] = None  # The published artifact version, once it succeeded
+    error: Optional[str] = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.state == "running"
+
+    @property
+    def progress(self) -> float:
+        """Fraction of the job's steps completed, from 0 to 1."""
+        return 1.0 if self.state == "succeeded" else min(self.steps_done / TOTAL_STEPS, 1.0)
+
+    @property
+    def duration_seconds(self) -> float:
+        return ((self.finished_at or datetime.now()) - self.started_at).total_seconds()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job has finished; returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def to_record(self) -> dict:
+        """The job's state as stored in the lock file for other processes."""
+        return {
+            "job_id": self.job_id, "n_factors": self.n_factors, "n_epochs": self.n_epochs, "state": self.state,
+            "stage": self.stage, "tasks": dict(self.tasks), "steps_done": self.steps_done, "triggers": self.triggers,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "version": self.version, "error": self.error,
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "TrainingJob":
+        """A read-only view of a job recorded by another process."""
+        job = cls(**dict(record, started_at=datetime.fromisoformat(record["started_at"]),
+                         finished_at=datetime.fromisoformat(record["finished_at"]) if record["finished_at"] else None))
+        if not job.active:
+            job._done.set()
+        return job
+
+
+class TrainingJobManager:
+    """Runs training jobs one at a time and keeps the recent ones for status lookups."""
+
+    def __init__(self, registry: Optional[ModelRegistry] = None, lock_file: str = TRAINING_LOCK_FILE,
+                 history: int = TRAINING_JOB_HISTORY):
+        self.registry = registry  # Swapped to the new version after publishing, when given
+        self.lock_file = lock_file
+        self.history = history
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, TrainingJob]" = OrderedDict()
+        self._active: Optional[TrainingJob] = None
+
+    def submit(self, n_factors: Optional[int] = None, n_epochs: Optional[int] = None) -> Tuple[TrainingJob, bool]:
+        """Start a training job, or merge into the running one; returns (job, whether it was merged).
+
+        A trigger without overrides merges into any running job; one with
+        overrides only into a job with the same ones, otherwise it raises
+        TrainingConflict. A job running in another process is merged into the
+        same way (the returned job is a view of its recorded state), unless
+        its record cannot be read.
+        """
+        for name, value in (("n_factors", n_factors), ("n_epochs", n_epochs)):
+            if value is not None and value < 1:
+                raise ValueError(f"{name} must be >= 1, got {value}")
+        with self._lock:
+            if self._active is not None:
+                return self._merge(self._active, n_factors, n_epochs)
+
+            lock_fd = self._acquire_file_lock()
+            if lock_fd is None:
+                job = self._read_record()
+                if job is None or not job.active:
+                    raise TrainingConflict("A training job is already running in another process")
+                return self._merge(job, n_factors, n_epochs, where=" in another process")
+
+            job = TrainingJob(job_id=uuid.uuid4().hex[:12], n_factors=n_factors, n_epochs=n_epochs)
+            self._write_record(lock_fd, job)
+            self._active = job
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        threading.Thread(target=self._run, args=(job, lock_fd), name=f"training-{job.job_id}", daemon=True).start()
+        logger.info(f"Started training job {job.job_id}")
+        return job, False
+
+    def _merge(self, job: TrainingJob, n_factors: Optional[int], n_epochs: Optional[int],
+               where: str = "") -> Tuple[TrainingJob, bool]:
+        if (n_factors, n_epochs) not in ((None, None), (job.n_factors, job.n_epochs)):
+            raise TrainingConflict(f"Training job {job.job_id} with n_factors={job.n_factors}, "
+                                   f"n_epochs={job.n_epochs} is already running{where}")
+        job.triggers += 1
+        logger.info(f"Training trigger merged into running job {job.job_id}{where}")
+        return job, True
+
+    def get(self, job_id: Optional[str] = None) -> Optional[TrainingJob]:
+        """Return a job by id; without one, the running job or else the latest.
+
+        The job another process runs, or ran last, is included as a view of
+        its recorded state.
+        """
+        with self._lock:
+            if job_id and job_id in self._jobs:
+                return self._jobs[job_id]
+            if not job_id and self._active is not None:
+                return self._active
+            latest = next(reversed(self._jobs.values()), None)
+        shared = self._shared_job()
+        if job_id:
+            return shared if shared is not None and shared.job_id == job_id else None
+        if shared is not None and (shared.active or latest is None or shared.started_at > latest.started_at):
+            return shared
+        return latest
+
+    def cancel(self, job_id: Optional[str] = None) -> Optional[TrainingJob]:
+        """Ask a job (the running one by default) to stop; returns it, or None if unknown.
+
+        Cancelling takes effect until the trained models are published; a job
+        past that point finishes normally. A job running in another process
+        can only be cancelled there.
+        """
+        job = self.get(job_id)
+        if job is not None and job.active:
+            with self._lock:
+                local = job.job_id in self._jobs
+            if local:
+                job._cancel.set()
+                logger.info(f"Cancelling training job {job.job_id}")
+            else:
+                logger.warning(f"Training job {job.job_id} runs in another process; cancel it there")
+        return job
+
+    def _acquire_file_lock(self) -> Optional[int]:
+        """Take the lock file; None if another process holds it."""
+        os.makedirs(os.path.dirname(self.lock_file), exist_ok=True)
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _lock_is_free(self) -> bool:
+        try:
+            fd = os.open(self.lock_file, os.O_RDONLY)
+        except FileNotFoundError:
+            return True
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+        finally:
+            os.close(fd)  # Also releases the probe
+
+    def _write_record(self, lock_fd: int, job: TrainingJob):
+        data = json.dumps(job.to_record()).encode()
+        try:
+            os.pwrite(lock_fd, data, 0)
+            os.ftruncate(lock_fd, len(data))
+        except OSError as e:
+            logger.warning(f"Could not record training job {job.job_id} in {self.lock_file}: {e}")
+
+    def _read_record(self) -> Optional[TrainingJob]:
+        try:
+            with open(self.lock_file, "rb") as f:
+                return TrainingJob.from_record(json.loads(f.read()))
+        except (OSError, ValueError, KeyError, TypeError):
+            # Missing, or caught halfway through a rewrite
+            return None
+
+    def _shared_job(self) -> Optional[TrainingJob]:
+        """The job another process recorded in the lock file; failed if that process died running it."""
+        job = self._read_record()
+        with self._lock:
+            if job is None or job.job_id in self._jobs:
+                return None
+        if job.active and self._lock_is_free():
+            # Nobody holds the lock; read again in case the job finished in between
+            job = self._read_record()
+            if job is not None and job.active:
+                job.state, job.error = "failed", "The process running the job exited before it finished"
+                job._done.set()
+        return job
+
+    def _run(self, job: TrainingJob, lock_fd: int):
+        folder = None
+
+        def step_started(trainer, step):
+            # Starting a step (or being done) completes the trainer's previous one
+            if trainer in job.tasks:
+                job.steps_done += 1
+            job.tasks[trainer] = step
+            self._write_record(lock_fd, job)
+
+        def enter(stage):
+            job.stage = stage
+            self._write_record(lock_fd, job)
+
+        try:
+            with TRAINING_SECONDS.time("total"):
+                enter("load_ratings")
+                with TRAINING_SECONDS.time("load_ratings"):
+                    ratings = load_ratings()
+                job.steps_done += 1
+                if job._cancel.is_set():
+                    raise TrainingCancelled("Training was cancelled")
+
+                enter("train")
+                folder = new_version_folder(ARTIFACTS_FOLDER)
+                train_models(folder, ratings, job.n_factors, job.n_epochs, report=step_started, cancelled=job._cancel)
+
+                enter("publish")
+                job.version = publish_version(ARTIFACTS_FOLDER, folder)
+                folder = None
+                job.steps_done += 1
+            if self.registry is not None:
+                enter("reload")
+                self.registry.reload()
+            job.steps_done += 1
+            job.stage, job.state = "finished", "succeeded"
+            TRAINING_RUNS.inc("success")
+            logger.info(f"Training job {job.job_id} completed, serving version {job.version}")
+        except TrainingCancelled:
+            job.state = "cancelled"
+            TRAINING_RUNS.inc("cancelled")
+            logger.info(f"Training job {job.job_id} cancelled during {job.stage}")
+        except Exception as e:
+            job.state, job.error = "failed", str(e)
+            TRAINING_RUNS.inc("failure")
+            logger.error(f"Training job {job.job_id} failed during {job.stage}: {e}")
+        finally:
+            if folder is not None:
+                # Never published; drop the half-exported version
+                shutil.rmtree(folder, ignore_errors=True)
+            job.finished_at = datetime.now()
+            with self._lock:
+                self._active = None
+                self._write_record(lock_fd, job)  # The final state, for other processes' status lookups
+                os.close(lock_fd)  # Releases the file lock
+            job._done.set()
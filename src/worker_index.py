@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+UNKNOWN_WORKER = "Unknown Worker"
+
+
+class IdLookup:
+    """Vectorized raw id -> position lookup over an int64 id array, via searchsorted."""
+
+    def __init__(self, ids):
+        self.ids = np.asarray(ids, dtype=np.int64)  # position -> raw id
+        self._order = np.argsort(self.ids, kind='stable')
+        self._sorted_ids = self.ids[self._order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions_for(self, raw_ids) -> np.ndarray:
+        """Return the position of each raw id, or -1 for ids that are not in the array."""
+        raw_ids = np.asarray(raw_ids, dtype=np.int64)
+        if not len(self._sorted_ids):
+            return np.full(raw_ids.shape, -1, dtype=np.int64)
+        positions = np.searchsorted(self._sorted_ids, raw_ids)
+        positions = np.minimum(positions, len(self._sorted_ids) - 1)
+        found = self._sorted_ids[positions] == raw_ids
+        return np.where(found, self._order[positions], -1)
+
+    def position_for(self, raw_id: int) -> int:
+        """Return the position of a single raw id, or -1."""
+        return int(self.positions_for([raw_id])[0])
+
+
+class WorkerIndex:
+    """Constant-time lookups between workerIds, rating matrix rows and worker names.
+
+    Rows are rating matrix row positions, i.e. the rows of the CSR matrix and of
+    the neighbor table.
+    """
+
+    def __init__(self, row_ids, names):
+        self._lookup = IdLookup(row_ids)
+        self.row_ids = self._lookup.ids  # row -> workerId
+        self.names = np.asarray(names, dtype=object)  # row -> worker name
+
+    @classmethod
+    def build(cls, row_ids, worker_df: pd.DataFrame):
+        """Align worker names to the given row ids (first name wins for duplicate ids)."""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        workers = worker_df.drop_duplicates('workerId')
+        names_by_id = pd.Series(workers['names'].to_numpy(), index=workers['workerId'].astype(np.int64))
+        names = names_by_id.reindex(row_ids).fillna(UNKNOWN_WORKER).to_numpy(dtype=object)
+        return cls(row_ids, names)
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def rows_for(self, worker_ids) -> np.ndarray:
+        """Return the row of each workerId, or -1 for ids that are not in the dataset."""
+        return self._lookup.positions_for(worker_ids)
+
+    def row_for(self, worker_id: int) -> int:
+        """Return the row of a single workerId, or -1."""
+        return self._lookup.position_for(worker_id)
+
+    def name_for(self, worker_id: int) -> str:
+        """Return the name of a single workerId, or UNKNOWN_WORKER."""
+        row = self.row_for(worker_id)
+        return self.names[row] if row >= 0 else UNKNOWN_WORKER
+
+    def ids_for(self, rows) -> np.ndarray:
+        return self.row_ids[rows]
+
+    def names_for(self, rows) -> np.ndarray:
+        return self.names[rows]
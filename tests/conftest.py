@@ -0,0 +1,31 @@
+import os
+import sys
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC)
+
+from data_processing import stream_ratings  # noqa: E402
+from config import RATING_SCALE, SVD_N_FACTORS, SVD_N_EPOCHS  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def ratings():
+    """The bundled ratings CSV (no online log, no binary cache)."""
+    return stream_ratings(os.path.join(SRC, "data", "ratings_snowflake.csv"))
+
+
+@pytest.fixture(scope="session")
+def rating_matrix(ratings):
+    return ratings.to_rating_matrix()
+
+
+@pytest.fixture(scope="session")
+def svd(ratings):
+    """An SVD trained on the bundled ratings with the production settings."""
+    from surprise import SVD, Dataset, Reader
+
+    data = Dataset.load_from_df(ratings.to_frame()[['userId', 'workerId', 'rating']], Reader(rating_scale=RATING_SCALE))
+    model = SVD(n_factors=SVD_N_FACTORS, n_epochs=SVD_N_EPOCHS, random_state=42)
+    model.fit(data.build_full_trainset())
+    return model
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from config import KNN_NEIGHBORS
+from neighbor_index import make_neighbor_index, normalize_rows
+from neighbors import NeighborTable, _top_neighbors, compute_neighbors
+
+
+def brute_force_neighbors(csr_data, k: int, batch_size: int = 1024):
+    """Exact (indices, similarities) of every row."""
+    normalized = normalize_rows(csr_data)
+    n_rows = csr_data.shape[0]
+    all_rows = np.arange(n_rows)
+    indices = np.empty((n_rows, k), dtype=np.int32)
+    similarities = np.empty((n_rows, k), dtype=np.float64)
+    for start in range(0, n_rows, batch_size):
+        rows = all_rows[start:start + batch_size]
+        row_similarities = np.asarray((normalized[rows] @ normalized.T).todense())
+        indices[rows], similarities[rows] = _top_neighbors(all_rows, row_similarities, k)
+    return indices, similarities
+
+
+@pytest.fixture(scope="module")
+def update(rating_matrix):
+    """Random ratings, a new worker and a new user applied to a table built as training does.
+
+    The trained table has sklearn's tie order, which the rebuilt lists do not keep.
+    """
+    rng = np.random.default_rng(42)
+    knn = make_neighbor_index("brute")
+    knn.fit(rating_matrix.matrix)
+    old_indices, old_similarities = compute_neighbors(knn, rating_matrix.matrix, k=KNN_NEIGHBORS)
+    worker_ids = np.r_[rng.choice(rating_matrix.worker_ids, 200), -1, rating_matrix.worker_ids[0]]
+    user_ids = np.r_[rng.choice(rating_matrix.user_ids, 200), rating_matrix.user_ids[0], -2]
+    ratings = rng.integers(1, 11, len(worker_ids)) / 2
+
+    updated, changed_rows = rating_matrix.with_ratings(worker_ids, user_ids, ratings)
+    table, reported = NeighborTable(old_indices, old_similarities).with_changed_rows(updated.matrix, changed_rows)
+    _, expected = brute_force_neighbors(updated.matrix, KNN_NEIGHBORS)
+    return SimpleNamespace(old_indices=old_indices, old_similarities=old_similarities, updated=updated,
+                           changed_rows=changed_rows, table=table, reported=reported, expected=expected,
+                           n_old=rating_matrix.matrix.shape[0])
+
+
+def test_with_changed_rows_matches_full_recomputation(update):
+    # Ties at the k-th neighbor may be broken either way, so compare similarities
+    np.testing.assert_allclose(update.table.similarities, update.expected, rtol=0, atol=1e-9)
+
+
+def test_with_changed_rows_indices_have_their_similarities(update):
+    normalized = normalize_rows(update.updated.matrix)
+    n_rows, k = update.table.indices.shape
+    actual = np.asarray(normalized[np.repeat(np.arange(n_rows), k)].multiply(normalized[update.table.indices.ravel()])
+                        .sum(axis=1)).reshape(n_rows, k)
+    np.testing.assert_allclose(update.table.similarities, actual, rtol=0, atol=1e-9)
+
+
+def test_with_changed_rows_reports_every_changed_list(update):
+    # A row whose similarities moved is reported or lists a reported row (what affected_genres relies on)
+    changed = np.flatnonzero((np.abs(update.expected[:update.n_old] - update.old_similarities) > 1e-12).any(axis=1))
+    unreported = np.setdiff1d(changed, update.reported)
+    assert np.isin(update.table.indices[unreported], update.reported).any(axis=1).all()
+
+
+def test_with_changed_rows_reports_only_changed_lists(update):
+    others = np.setdiff1d(update.reported, update.changed_rows)
+    others = others[others < update.n_old]
+    same_set = (np.sort(update.table.indices[others], axis=1)
+                == np.sort(update.old_indices[others], axis=1)).all(axis=1)
+    assert not same_set.any()
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from svd_scoring import BatchSVDScorer
+from worker_index import IdLookup
+
+NEW_USER, NEW_ITEM = -7, -8
+
+
+def test_batch_scorer_matches_svd_predict(svd):
+    # Known users and items mixed with ids the model has never seen
+    rng = np.random.default_rng(42)
+    trainset = svd.trainset
+    users = [trainset.to_raw_uid(u) for u in rng.integers(0, trainset.n_users, 20)] + [-1]
+    items = [trainset.to_raw_iid(i) for i in rng.integers(0, trainset.n_items, 1000 // len(users))] + [-1, -2]
+
+    scorer = BatchSVDScorer.from_svd(svd, rating_scale=trainset.rating_scale)
+    expected = np.array([[svd.predict(uid=user_id, iid=item_id).est for item_id in items] for user_id in users])
+    np.testing.assert_allclose(scorer.score_many(users, items), expected, rtol=0, atol=1e-9)
+    for user_id, user_expected in zip(users, expected):
+        np.testing.assert_allclose(scorer.score(user_id, items), user_expected, rtol=0, atol=1e-9)
+
+
+@pytest.fixture(scope="module")
+def fold_in(svd, rating_matrix):
+    """Raise one user's lowest rating to the top of the scale and rate a new user and a new item.
+
+    The raised pair is logged twice, lowest value first, so only the last may count.
+    """
+    scorer = BatchSVDScorer.from_svd(svd)
+    rng = np.random.default_rng(42)
+    column = int(rng.choice(np.flatnonzero(np.diff(rating_matrix.matrix.tocsc().indptr))))
+    user_ratings = rating_matrix.matrix[:, column].tocoo()
+    user_id = int(rating_matrix.user_ids[column])
+    worker_id = int(rating_matrix.worker_ids[user_ratings.row[np.argmin(user_ratings.data)]])
+    low, top = scorer.rating_scale
+    user_ids = np.array([user_id, user_id, NEW_USER, user_id])
+    worker_ids = np.array([worker_id, worker_id, worker_id, NEW_ITEM])
+    ratings = np.array([low, top, top, top])
+
+    before = [array.copy() for array in (scorer.pu, scorer.qi, scorer.bu, scorer.bi)]
+    updated, _ = rating_matrix.with_ratings(worker_ids, user_ids, ratings)
+    folded = scorer.fold_in(updated, user_ids, worker_ids, random_state=42)
+    return SimpleNamespace(scorer=scorer, before=before, updated=updated, folded=folded, user_id=user_id,
+                           worker_id=worker_id, top=top)
+
+
+def test_with_ratings_keeps_last_duplicate_rating(fold_in):
+    row = IdLookup(fold_in.updated.worker_ids).position_for(fold_in.worker_id)
+    column = IdLookup(fold_in.updated.user_ids).position_for(fold_in.user_id)
+    assert fold_in.updated.matrix[row, column] == fold_in.top
+
+
+def test_fold_in_leaves_original_scorer_untouched(fold_in):
+    for copy, array in zip(fold_in.before, (fold_in.scorer.pu, fold_in.scorer.qi, fold_in.scorer.bu,
+                                            fold_in.scorer.bi)):
+        np.testing.assert_array_equal(copy, array)
+
+
+def test_fold_in_only_moves_the_rated_users_and_items(fold_in):
+    scorer, folded = fold_in.scorer, fold_in.folded
+    other_users = np.setdiff1d(np.arange(len(scorer.users.ids)), scorer.inner_users([fold_in.user_id]))
+    other_items = np.setdiff1d(np.arange(len(scorer.items.ids)), scorer.inner_items([fold_in.worker_id]))
+    np.testing.assert_array_equal(folded.pu[other_users], scorer.pu[other_users])
+    np.testing.assert_array_equal(folded.bu[other_users], scorer.bu[other_users])
+    np.testing.assert_array_equal(folded.qi[other_items], scorer.qi[other_items])
+    np.testing.assert_array_equal(folded.bi[other_items], scorer.bi[other_items])
+
+
+def test_fold_in_appends_new_ids(fold_in):
+    n_users, n_items = len(fold_in.scorer.users.ids), len(fold_in.scorer.items.ids)
+    assert fold_in.folded.inner_user(NEW_USER) == n_users
+    assert fold_in.folded.inner_items([NEW_ITEM])[0] == n_items
+
+
+def test_fold_in_fits_new_ids_to_their_ratings(fold_in):
+    # Both were rated at the top of the scale, so their biases move up from 0
+    assert fold_in.folded.bu[len(fold_in.scorer.users.ids)] > 0
+    assert fold_in.folded.bi[len(fold_in.scorer.items.ids)] > 0
+
+
+def test_fold_in_moves_prediction_toward_new_rating(fold_in):
+    def error(scorer):
+        return abs(scorer.score(fold_in.user_id, [fold_in.worker_id])[0] - fold_in.top)
+    assert error(fold_in.folded) < error(fold_in.scorer)